@@ -0,0 +1,153 @@
+# --- Anotações para Iniciantes ---
+# Microbenchmarks dos caminhos de CPU mais usados, em escala:
+#   - db_service.get_divisoes_completas_by_user: agrupamento de itens, pessoas
+#     e atribuições de todo o histórico (10 a 5000 divisões);
+#   - main.db_divisao_to_response: conversão da divisão para o modelo de resposta;
+#   - main.calcular_totais_endpoint: totais com a divisão em cache ("local") e
+#     a partir do resumo da função SQL ("banco").
+# As divisões são sintéticas (dados_sinteticos.py): de 10 a 500 itens, de 2 a
+# 50 pessoas, com matriz de atribuições densa (todo mundo consome tudo) ou
+# esparsa (cada pessoa consome ~5% dos itens).
+#
+# O banco é trocado por um cliente em memória que devolve as linhas prontas,
+# então só o trabalho do Python é medido (sem rede nem SQL). Para cada caso:
+# tempo por chamada (melhor de 3 rodadas) e pico de memória alocada durante
+# UMA chamada (tracemalloc), que mostra as cópias e listas intermediárias.
+#
+# Execute da raiz do projeto: python -m backend.benchmarks.bench_agregados [rapido]
+# ("rapido" pula os casos maiores)
+
+import sys
+import timeit
+import tracemalloc
+
+from backend import main as api
+from backend.services import cache_divisoes
+from backend.services import db_service
+from backend.benchmarks.dados_sinteticos import gerar_divisao, gerar_historico
+from backend.benchmarks.bench_totais_estrategias import linhas_das_tabelas, simular_totais_compactos
+
+DIVISOES = [(10, 2), (50, 10), (200, 20), (500, 50)]  # (itens, pessoas)
+DENSIDADES = {"densa": 1.0, "esparsa": 0.05}
+HISTORICOS = [10, 100, 1000, 5000]  # divisões do usuário (12 itens e 4 pessoas cada)
+
+
+class ConsultaFixa:
+    """Aceita qualquer filtro e devolve sempre as mesmas linhas (já prontas)."""
+
+    def __init__(self, dados):
+        self.data = dados
+
+    def __getattr__(self, nome):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return self
+
+
+class ClienteEmMemoria:
+    """Faz o papel do cliente do Supabase, com as respostas de cada tabela e RPC."""
+
+    def __init__(self, tabelas: dict, rpcs: dict = None):
+        self.tabelas = tabelas
+        self.rpcs = rpcs or {}
+
+    def table(self, tabela: str) -> ConsultaFixa:
+        return ConsultaFixa(self.tabelas.get(tabela, []))
+
+    def rpc(self, nome: str, params: dict = None) -> ConsultaFixa:
+        return ConsultaFixa(self.rpcs.get(nome))
+
+
+def tabelas_do_historico(historico: list) -> dict:
+    """As linhas de cada tabela (como o PostgREST devolveria) de um histórico inteiro."""
+    tabelas = {"divisoes": [], "itens": [], "pessoas": [], "atribuicoes": []}
+    for divisao in historico:
+        cabecalho, itens, pessoas, atribuicoes = linhas_das_tabelas(divisao)
+        tabelas["divisoes"].append(cabecalho)
+        tabelas["itens"] += itens
+        tabelas["pessoas"] += pessoas
+        tabelas["atribuicoes"] += atribuicoes
+    return tabelas
+
+
+def executar(corrotina):
+    """Roda um endpoint async que não espera nada (sem o custo de um event loop)."""
+    try:
+        corrotina.send(None)
+    except StopIteration as fim:
+        return fim.value
+    raise RuntimeError("O endpoint ficou esperando algo (não dá para medir assim).")
+
+
+def medir(funcao) -> tuple:
+    """(ms por chamada, pico de KB alocados em uma chamada)."""
+    timer = timeit.Timer(funcao)
+    numero, _ = timer.autorange()
+    ms = min(timer.repeat(repeat=3, number=numero)) / numero * 1000
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    antes, _ = tracemalloc.get_traced_memory()
+    funcao()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ms, (pico - antes) / 1024
+
+
+def imprimir(caminho: str, caso: str, funcao) -> None:
+    ms, kb = medir(funcao)
+    print(f"  {caminho:<34} {caso:<24} {ms:>10.3f} ms {kb:>10.1f} KB")
+
+
+def bench_divisao(n_itens: int, n_pessoas: int, nome_densidade: str) -> None:
+    divisao = gerar_divisao(n_itens, n_pessoas, densidade=DENSIDADES[nome_densidade])
+    divisao_id = divisao["id"]
+    atribuicoes = sum(len(i["atribuido_a"]) for i in divisao["itens"])
+    caso = f"{n_itens}x{n_pessoas} {nome_densidade}"
+
+    db_service.db = ClienteEmMemoria({}, {"totais_divisao_compacto": simular_totais_compactos(divisao)})
+    cache_divisoes.guardar(divisao)
+
+    print(f"\nDivisão {n_itens} itens x {n_pessoas} pessoas, matriz {nome_densidade} ({atribuicoes} atribuições)")
+    imprimir("db_divisao_to_response", caso, lambda: api.db_divisao_to_response(divisao))
+    imprimir("calcular_totais_endpoint (local)", caso,
+             lambda: executar(api.calcular_totais_endpoint(divisao_id, "local", {})))
+    imprimir("calcular_totais_endpoint (banco)", caso,
+             lambda: executar(api.calcular_totais_endpoint(divisao_id, "banco", {})))
+    cache_divisoes.invalidar(divisao_id)
+
+
+def bench_historico(n_divisoes: int) -> None:
+    historico = gerar_historico(n_divisoes=n_divisoes)
+    tabelas = tabelas_do_historico(historico)
+    db_service.db = ClienteEmMemoria(tabelas)
+
+    print(f"\nHistórico com {n_divisoes} divisões ({len(tabelas['itens'])} itens, "
+          f"{len(tabelas['atribuicoes'])} atribuições)")
+    imprimir("get_divisoes_completas_by_user", f"{n_divisoes} divisões",
+             lambda: db_service.get_divisoes_completas_by_user("user-bench"))
+
+
+def main():
+    rapido = len(sys.argv) > 1 and sys.argv[1] == "rapido"
+    divisoes = DIVISOES[:-1] if rapido else DIVISOES
+    historicos = HISTORICOS[:-1] if rapido else HISTORICOS
+
+    cliente_original = db_service.db
+    ttl_original = cache_divisoes.TTL_SEGUNDOS
+    cache_divisoes.TTL_SEGUNDOS = float("inf")  # a divisão não pode sair do cache no meio da medição
+    try:
+        print(f"  {'caminho':<34} {'caso':<24} {'tempo':>13} {'pico memória':>13}")
+        for n_itens, n_pessoas in divisoes:
+            for nome_densidade in DENSIDADES:
+                bench_divisao(n_itens, n_pessoas, nome_densidade)
+        for n_divisoes in historicos:
+            bench_historico(n_divisoes)
+    finally:
+        db_service.db = cliente_original
+        cache_divisoes.TTL_SEGUNDOS = ttl_original
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+# --- Anotações para Iniciantes ---
+# Benchmark de carga ponta a ponta da API (antes de um deploy).
+# Sobe a API de verdade (uvicorn, em outro processo) sobre o banco SQLite local
+# (services/sqlite_backend.py) e com um scanner falso no lugar do Gemini, e
+# simula usuários fazendo sessões completas:
+#     escanear comanda -> criar divisão -> várias distribuições -> totais -> finalizar
+# com cada vez mais usuários ao mesmo tempo (níveis de concorrência).
+#
+# Para cada nível mostra: requisições e sessões por segundo, latência de cada
+# endpoint (p50/p95/p99/máx) e o atraso do event loop do servidor ("lag": quanto
+# uma tarefa que pediu para acordar em 10 ms esperou a mais). Lag alto quer dizer
+# que algo síncrono (banco, scanner, CPU) está travando todas as requisições.
+#
+# Os dois "dublês" imitam o comportamento real, inclusive o que trava o loop:
+#   - scanner: dorme --latencia-scan segundos (a chamada ao Gemini é síncrona);
+#   - banco: cada consulta espera --rtt-banco ms, como a ida ao Supabase (o
+#     cliente do Supabase também é síncrono). Padrão 0 = só o custo do SQLite.
+#
+# Os resultados ficam em backend/benchmarks/resultados/ (um JSON por execução,
+# com o commit) e cada execução se compara com a última de outro commit.
+#
+# Execute da raiz do projeto:
+#     python -m backend.benchmarks.bench_carga [--niveis 1,4,16,64] [--duracao 10]
+#         [--latencia-scan 1.5] [--rtt-banco 0] [--distribuicoes 15]
+# Precisa do uvicorn e do httpx (já instalados com o requirements.txt).
+
+import argparse
+import asyncio
+import glob
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from backend.benchmarks.dados_sinteticos import NOMES_ITENS, NOMES_PESSOAS
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+PASTA_RESULTADOS = os.path.join(os.path.dirname(__file__), "resultados")
+INTERVALO_LAG = 0.01  # o monitor do servidor acorda a cada 10 ms
+
+
+# ============================================
+# LADO DO SERVIDOR (roda em outro processo)
+# ============================================
+
+class ClienteComLatencia:
+    """Repassa tudo ao cliente do banco, mas cada .execute() espera o RTT (como a rede)."""
+
+    def __init__(self, alvo, rtt: float):
+        self._alvo = alvo
+        self._rtt = rtt
+
+    def __getattr__(self, nome):
+        atributo = getattr(self._alvo, nome)
+        if not callable(atributo):
+            return atributo
+
+        def chamar(*args, **kwargs):
+            resultado = atributo(*args, **kwargs)
+            if nome == "execute":
+                time.sleep(self._rtt)
+                return resultado
+            return ClienteComLatencia(resultado, self._rtt)
+        return chamar
+
+
+def servidor(args) -> None:
+    """Sobe a API com os dublês (banco local, scanner falso) e o monitor de lag."""
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = args.banco
+    os.environ["API_SECRET_TOKEN"] = ""  # sem autenticação: usa o usuário local
+
+    import uvicorn
+    from backend import main
+    from backend.services import db_service
+
+    if args.rtt_banco > 0:
+        db_service.db = ClienteComLatencia(db_service.db, args.rtt_banco / 1000)
+
+    def scanner_falso(caminho: str) -> dict:
+        time.sleep(args.latencia_scan)
+        rng = random.Random(caminho)
+        return {"itens": [
+            {"item": NOMES_ITENS[i % len(NOMES_ITENS)], "quantidade": rng.randint(1, 4),
+             "preco_unitario": round(rng.uniform(5, 90), 2)}
+            for i in range(args.itens)
+        ]}
+    main.scan_receipt_to_json = scanner_falso
+
+    atrasos = deque(maxlen=200_000)
+
+    async def monitorar_lag():
+        while True:
+            inicio = time.perf_counter()
+            await asyncio.sleep(INTERVALO_LAG)
+            atrasos.append(time.perf_counter() - inicio - INTERVALO_LAG)
+
+    async def iniciar_monitor():
+        asyncio.get_running_loop().create_task(monitorar_lag())
+
+    def lag_do_loop(zerar: bool = False) -> dict:
+        amostras = [a * 1000 for a in atrasos]
+        if zerar:
+            atrasos.clear()
+        return resumir(amostras)
+
+    main.app.add_event_handler("startup", iniciar_monitor)
+    main.app.add_api_route("/_bench/lag", lag_do_loop, methods=["GET"], include_in_schema=False)
+    uvicorn.run(main.app, host="127.0.0.1", port=args.porta, log_level="warning", access_log=False)
+
+
+# ============================================
+# LADO DO CLIENTE (gera a carga)
+# ============================================
+
+def percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def resumir(valores: List[float]) -> dict:
+    return {
+        "n": len(valores),
+        "p50": percentil(valores, 50),
+        "p95": percentil(valores, 95),
+        "p99": percentil(valores, 99),
+        "max": max(valores, default=0.0),
+    }
+
+
+class Medidas:
+    """Latências (ms) por endpoint e erros de um nível de concorrência."""
+
+    def __init__(self):
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.erros: Dict[str, int] = defaultdict(int)
+        self.sessoes = 0
+
+    async def chamar(self, http: httpx.AsyncClient, endpoint: str, metodo: str, url: str, **kwargs):
+        inicio = time.perf_counter()
+        resposta = await http.request(metodo, url, **kwargs)
+        self.latencias[endpoint].append((time.perf_counter() - inicio) * 1000)
+        if resposta.status_code >= 400:
+            self.erros[endpoint] += 1
+            return None
+        return resposta.json()
+
+
+async def sessao(http: httpx.AsyncClient, medidas: Medidas, rng: random.Random, args) -> None:
+    """Uma mesa de restaurante, do começo ao fim."""
+    scan = await medidas.chamar(http, "POST /api/scan-comanda", "POST", "/api/scan-comanda",
+                                files={"file": ("comanda.jpg", rng.randbytes(64), "image/jpeg")})
+    if not scan or not scan["itens"]:
+        return
+
+    nomes = [f"{NOMES_PESSOAS[i % len(NOMES_PESSOAS)]} {i}" for i in range(args.pessoas)]
+    divisao = await medidas.chamar(http, "POST /api/criar-divisao", "POST", "/api/criar-divisao",
+                                   json={"itens": scan["itens"], "nomes_pessoas": nomes})
+    if not divisao:
+        return
+    divisao_id = divisao["id"]
+
+    for _ in range(args.distribuicoes):
+        item = rng.choice(divisao["itens"])
+        consumidores = rng.sample(divisao["pessoas"], rng.randint(1, len(divisao["pessoas"])))
+        parte = math.floor(item["quantidade"] * 1000 / len(consumidores)) / 1000
+        await medidas.chamar(
+            http, "POST /api/distribuir-item/{divisao_id}", "POST", f"/api/distribuir-item/{divisao_id}",
+            json={"item_id": item["id"], "distribuicao": [
+                {"pessoa_id": p["id"], "quantidade": parte} for p in consumidores
+            ]},
+        )
+        await asyncio.sleep(rng.uniform(0, args.pausa))  # o tempo do dedo entre um toque e outro
+
+    await medidas.chamar(http, "GET /api/calcular-totais/{divisao_id}", "GET", f"/api/calcular-totais/{divisao_id}")
+    await medidas.chamar(http, "PUT /api/divisao/{divisao_id}/finalizar", "PUT", f"/api/divisao/{divisao_id}/finalizar")
+    medidas.sessoes += 1
+
+
+async def usuario(http: httpx.AsyncClient, medidas: Medidas, fim: float, semente: int, args) -> None:
+    rng = random.Random(semente)
+    while time.perf_counter() < fim:
+        await sessao(http, medidas, rng, args)
+
+
+async def rodar_nivel(url: str, concorrencia: int, args) -> dict:
+    """Roda `concorrencia` usuários simultâneos por `args.duracao` segundos."""
+    limites = httpx.Limits(max_connections=concorrencia, max_keepalive_connections=concorrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=120) as http:
+        await http.get("/_bench/lag", params={"zerar": True})
+        medidas = Medidas()
+        inicio = time.perf_counter()
+        fim = inicio + args.duracao
+        await asyncio.gather(*(usuario(http, medidas, fim, concorrencia * 1000 + i, args) for i in range(concorrencia)))
+        duracao = time.perf_counter() - inicio
+        lag = (await http.get("/_bench/lag", params={"zerar": True})).json()
+
+    requisicoes = sum(len(v) for v in medidas.latencias.values())
+    return {
+        "concorrencia": concorrencia,
+        "duracao_s": round(duracao, 2),
+        "requisicoes": requisicoes,
+        "sessoes": medidas.sessoes,
+        "erros": sum(medidas.erros.values()),
+        "req_por_s": round(requisicoes / duracao, 1),
+        "sessoes_por_s": round(medidas.sessoes / duracao, 2),
+        "lag_loop_ms": lag,
+        "endpoints": {nome: resumir(valores) for nome, valores in sorted(medidas.latencias.items())},
+    }
+
+
+def imprimir_nivel(nivel: dict) -> None:
+    lag = nivel["lag_loop_ms"]
+    print(f"\nConcorrência {nivel['concorrencia']}: {nivel['req_por_s']} req/s, "
+          f"{nivel['sessoes_por_s']} sessões/s, {nivel['erros']} erros em {nivel['duracao_s']} s")
+    print(f"  lag do event loop: p50 {lag['p50']:.1f} ms, p99 {lag['p99']:.1f} ms, máx {lag['max']:.1f} ms")
+    print(f"  {'endpoint':<44} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'máx':>8}")
+    for nome, r in nivel["endpoints"].items():
+        print(f"  {nome:<44} {r['n']:>6} {r['p50']:>6.1f}ms {r['p95']:>6.1f}ms {r['p99']:>6.1f}ms {r['max']:>6.1f}ms")
+
+
+# ============================================
+# RESULTADOS (comparação entre commits)
+# ============================================
+
+def commit_atual() -> str:
+    try:
+        saida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                               capture_output=True, text=True, check=True)
+        sujo = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=RAIZ,
+                              capture_output=True, text=True).stdout.strip()
+        return saida.stdout.strip() + ("-modificado" if sujo else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+def resultado_anterior(commit: str) -> Optional[dict]:
+    """A execução mais recente de OUTRO commit (para comparar)."""
+    for caminho in sorted(glob.glob(os.path.join(PASTA_RESULTADOS, "carga-*.json")), reverse=True):
+        with open(caminho, encoding="utf-8") as arquivo:
+            resultado = json.load(arquivo)
+        if resultado.get("commit") != commit:
+            return resultado
+    return None
+
+
+def comparar(atual: dict, anterior: dict) -> None:
+    print(f"\nComparação com o commit {anterior['commit']} ({anterior['data'][:16]}):")
+    if anterior.get("parametros") != atual["parametros"]:
+        print("  (atenção: parâmetros diferentes, a comparação pode não valer)")
+    niveis_anteriores = {n["concorrencia"]: n for n in anterior["niveis"]}
+    for nivel in atual["niveis"]:
+        antes = niveis_anteriores.get(nivel["concorrencia"])
+        if not antes:
+            continue
+        print(f"  concorrência {nivel['concorrencia']}: req/s {antes['req_por_s']} -> {nivel['req_por_s']}"
+              f" ({variacao(antes['req_por_s'], nivel['req_por_s'])})")
+        for nome, r in nivel["endpoints"].items():
+            if nome in antes["endpoints"]:
+                p99 = antes["endpoints"][nome]["p99"]
+                print(f"    {nome:<44} p99 {p99:.1f} -> {r['p99']:.1f} ms ({variacao(p99, r['p99'])})")
+
+
+def variacao(antes: float, depois: float) -> str:
+    return f"{(depois - antes) / antes * 100:+.0f}%" if antes else "novo"
+
+
+# ============================================
+# EXECUÇÃO
+# ============================================
+
+def aguardar_servidor(url: str, processo: subprocess.Popen, limite: float = 30) -> None:
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError("O servidor do benchmark terminou ao iniciar (veja o log).")
+        try:
+            if httpx.get(f"{url}/api/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("O servidor do benchmark não respondeu a tempo.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga ponta a ponta da API.")
+    parser.add_argument("--niveis", default="1,4,16,64", help="níveis de concorrência (usuários simultâneos)")
+    parser.add_argument("--duracao", type=float, default=10, help="segundos por nível")
+    parser.add_argument("--latencia-scan", type=float, default=1.5, help="segundos do scanner falso")
+    parser.add_argument("--rtt-banco", type=float, default=0, help="ms de espera por consulta ao banco")
+    parser.add_argument("--itens", type=int, default=12, help="itens por comanda")
+    parser.add_argument("--pessoas", type=int, default=4, help="pessoas por divisão")
+    parser.add_argument("--distribuicoes", type=int, default=15, help="distribuições por sessão")
+    parser.add_argument("--pausa", type=float, default=0.2, help="pausa máxima (s) entre distribuições")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--servidor", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--banco", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servidor:
+        servidor(args)
+        return
+
+    pasta = tempfile.mkdtemp(prefix="bench-carga-")
+    comando = [sys.executable, "-m", "backend.benchmarks.bench_carga", "--servidor",
+               "--banco", os.path.join(pasta, "bench.db"), "--porta", str(args.porta),
+               "--latencia-scan", str(args.latencia_scan), "--rtt-banco", str(args.rtt_banco),
+               "--itens", str(args.itens)]
+    ambiente = {**os.environ, "PYTHONPATH": RAIZ}
+    log = open(os.path.join(pasta, "servidor.log"), "w")
+    # cwd na pasta temporária: o /api/scan-comanda grava os uploads no diretório atual
+    processo = subprocess.Popen(comando, cwd=pasta, env=ambiente, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{args.porta}"
+
+    parametros = {k: v for k, v in vars(args).items() if k not in ("servidor", "banco", "porta")}
+    resultado = {
+        "commit": commit_atual(),
+        "data": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "parametros": parametros,
+        "niveis": [],
+    }
+    print(f"Benchmark de carga (commit {resultado['commit']}), log do servidor: {log.name}")
+    try:
+        aguardar_servidor(url, processo)
+        for concorrencia in (int(n) for n in args.niveis.split(",")):
+            nivel = asyncio.run(rodar_nivel(url, concorrencia, args))
+            resultado["niveis"].append(nivel)
+            imprimir_nivel(nivel)
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+        log.close()
+
+    anterior = resultado_anterior(resultado["commit"])
+    os.makedirs(PASTA_RESULTADOS, exist_ok=True)
+    nome = f"carga-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{resultado['commit']}.json"
+    with open(os.path.join(PASTA_RESULTADOS, nome), "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+    print(f"\nResultado salvo em backend/benchmarks/resultados/{nome}")
+    if anterior:
+        comparar(resultado, anterior)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# --- Anotações para Iniciantes ---
+# Benchmark da subida "a frio" da API: o que um container novo (autoscaling)
+# custa antes de atender o primeiro usuário.
+#   - import: tempo de `import backend.main` num processo Python novo, e os
+#     módulos que mais pesam nele (python -X importtime);
+#   - primeira resposta: do início do processo do uvicorn até o primeiro 200
+#     do /api/health;
+#   - aquecimento: a primeira chamada ao /api/ready (cria o cliente do banco e
+#     carrega o SDK do Gemini) e a segunda, já aquecida.
+# Cada medida é feita --repeticoes vezes (processos novos) e mostra a mediana.
+#
+# O banco é o SQLite local (como no bench_carga), para a medida não depender
+# da rede. Com --banco-do-env, usa o banco configurado no backend/.env.
+#
+# Execute da raiz do projeto:
+#     python -m backend.benchmarks.bench_inicializacao [--repeticoes 5] [--banco-do-env]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+MEDIR_IMPORT = "import time; t = time.perf_counter(); import backend.main; print(time.perf_counter() - t)"
+
+
+def ambiente(args) -> dict:
+    variaveis = dict(os.environ)
+    if not args.banco_do_env:
+        variaveis["DB_BACKEND"] = "sqlite"
+        variaveis["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-inicializacao-"), "banco.db")
+    return variaveis
+
+
+def tempo_de_import(args) -> float:
+    saida = subprocess.run([sys.executable, "-c", MEDIR_IMPORT], cwd=RAIZ, env=ambiente(args),
+                           capture_output=True, text=True, check=True)
+    return float(saida.stdout.strip().splitlines()[-1])
+
+
+def modulos_mais_pesados(args, quantos: int = 10) -> list:
+    """(módulo, ms acumulados) dos imports feitos direto pelo backend, do mais pesado ao mais leve."""
+    saida = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend.main"], cwd=RAIZ,
+                           env=ambiente(args), capture_output=True, text=True, check=True)
+    modulos = []
+    for linha in saida.stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, acumulado, nome = linha.split("|")
+        profundidade = (len(nome) - len(nome.lstrip()) - 1) // 2
+        if profundidade <= 1:  # o próprio backend.main e o que ele importa
+            modulos.append((nome.strip(), int(acumulado) / 1000))
+    return sorted(modulos, key=lambda m: m[1], reverse=True)[:quantos]
+
+
+def subida(args) -> dict:
+    """Sobe o uvicorn e mede (em ms) a primeira resposta e o aquecimento."""
+    porta = args.porta
+    url = f"http://127.0.0.1:{porta}"
+    comando = [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(porta), "--log-level", "warning"]
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(comando, cwd=RAIZ, env=ambiente(args),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(timeout=30) as cliente:
+            while True:
+                if processo.poll() is not None:
+                    raise RuntimeError("O servidor não subiu (rode o uvicorn à mão para ver o erro).")
+                try:
+                    if cliente.get(f"{url}/api/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.005)
+            primeira = time.perf_counter() - inicio
+
+            medidas = {"primeira_resposta": primeira * 1000}
+            for nome in ("ready_frio", "ready_quente"):
+                antes = time.perf_counter()
+                resposta = cliente.get(f"{url}/api/ready")
+                medidas[nome] = (time.perf_counter() - antes) * 1000
+                if resposta.status_code != 200:
+                    print(f"  (atenção: /api/ready respondeu {resposta.status_code}: {resposta.text[:200]})")
+            return medidas
+    finally:
+        processo.terminate()
+        processo.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da subida a frio da API.")
+    parser.add_argument("--repeticoes", type=int, default=5, help="processos novos por medida")
+    parser.add_argument("--banco-do-env", action="store_true", help="usa o banco do backend/.env (não o SQLite)")
+    parser.add_argument("--porta", type=int, default=8766)
+    args = parser.parse_args()
+
+    imports = [tempo_de_import(args) * 1000 for _ in range(args.repeticoes)]
+    print(f"import backend.main: mediana {statistics.median(imports):.0f} ms "
+          f"(mín {min(imports):.0f}, máx {max(imports):.0f})")
+    print("  módulos mais pesados (ms acumulados):")
+    for nome, ms in modulos_mais_pesados(args):
+        print(f"    {nome:<44} {ms:>8.1f}")
+
+    subidas = [subida(args) for _ in range(args.repeticoes)]
+    print("\nSubida do uvicorn (mediana):")
+    print(f"  primeira resposta (/api/health): {statistics.median(s['primeira_resposta'] for s in subidas):>8.0f} ms")
+    print(f"  /api/ready a frio (aquecimento):  {statistics.median(s['ready_frio'] for s in subidas):>8.0f} ms")
+    print(f"  /api/ready já aquecido:           {statistics.median(s['ready_quente'] for s in subidas):>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# --- Anotações para Iniciantes ---
+# Benchmark do caminho de resposta das divisões.
+# Compara o caminho antigo (modelos Pydantic validados + revalidação do response_model
+# + json padrão) com o caminho rápido (dicionários direto do banco + orjson),
+# e mede o custo da compressão gzip.
+# Execute da raiz do projeto: python -m backend.benchmarks.bench_serializacao
+
+import gzip
+import json
+import timeit
+from typing import List
+
+from pydantic import TypeAdapter
+
+from backend.schemas import Divisao, Item, Pessoa
+from backend.services.serializacao import divisao_para_dict, resposta_json
+from backend.benchmarks.dados_sinteticos import gerar_divisao, gerar_historico
+
+
+def caminho_antigo(divisao_db: dict) -> Divisao:
+    """Reprodução do db_divisao_to_response original (modelos validados)."""
+    return Divisao(
+        id=str(divisao_db["id"]),
+        nome=divisao_db.get("nome", "Divisão sem nome"),
+        itens=[
+            Item(
+                id=str(item["id"]),
+                nome=item["nome"],
+                quantidade=float(item["quantidade"]),
+                valor_unitario=float(item["valor_unitario"]),
+                atribuido_a=item.get("atribuido_a", {})
+            ) for item in divisao_db.get("itens", [])
+        ],
+        pessoas=[Pessoa(id=str(p["id"]), nome=p["nome"]) for p in divisao_db.get("pessoas", [])],
+        status=divisao_db.get("status", "em_andamento"),
+        taxa_servico_percentual=float(divisao_db.get("taxa_servico_percentual", 10.0)),
+        desconto_valor=float(divisao_db.get("desconto_valor", 0.0)),
+        created_at=divisao_db.get("created_at"),
+        versao=divisao_db.get("versao")
+    )
+
+
+ADAPTER_UMA = TypeAdapter(Divisao)
+ADAPTER_LISTA = TypeAdapter(List[Divisao])
+
+
+def resposta_antiga(conteudo, adapter: TypeAdapter) -> bytes:
+    """O que o FastAPI fazia: valida de novo contra o response_model e serializa com json."""
+    validado = adapter.validate_python(conteudo, from_attributes=True)
+    dados = adapter.dump_python(validado, mode="json")
+    return json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def medir(nome: str, funcao, repeticoes: int) -> float:
+    """Executa a função e imprime o tempo médio por chamada em milissegundos."""
+    total = min(timeit.repeat(funcao, number=repeticoes, repeat=5))
+    ms = total / repeticoes * 1000
+    print(f"  {nome:<38} {ms:8.3f} ms/req")
+    return ms
+
+
+def comparar(titulo: str, antigo, novo, corpo: bytes, repeticoes: int):
+    print(f"\n{titulo}")
+    ms_antigo = medir("antigo (Pydantic + json)", antigo, repeticoes)
+    ms_novo = medir("rápido (dict + orjson)", novo, repeticoes)
+    medir("gzip do corpo (nível 6)", lambda: gzip.compress(corpo, compresslevel=6), repeticoes)
+    comprimido = len(gzip.compress(corpo, compresslevel=6))
+    print(f"  CPU economizada: {ms_antigo - ms_novo:.3f} ms/req ({ms_antigo / ms_novo:.1f}x)")
+    print(f"  Corpo: {len(corpo) / 1024:.1f} KB -> {comprimido / 1024:.1f} KB com gzip")
+
+
+def main():
+    divisao = gerar_divisao(n_itens=50, n_pessoas=10)
+    corpo = resposta_json(divisao_para_dict(divisao)).body
+    comparar(
+        "Divisão com 50 itens e 10 pessoas",
+        lambda: resposta_antiga(caminho_antigo(divisao), ADAPTER_UMA),
+        lambda: resposta_json(divisao_para_dict(divisao)).body,
+        corpo,
+        repeticoes=200,
+    )
+
+    historico = gerar_historico(n_divisoes=200)
+    corpo = resposta_json([divisao_para_dict(d) for d in historico]).body
+    comparar(
+        "Lista com 200 divisões",
+        lambda: resposta_antiga([caminho_antigo(d) for d in historico], ADAPTER_LISTA),
+        lambda: resposta_json([divisao_para_dict(d) for d in historico]).body,
+        corpo,
+        repeticoes=10,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# --- Anotações para Iniciantes ---
+# Benchmark das estratégias de cálculo de totais (services/totais_service.py).
+#   - "banco": 1 chamada RPC que devolve só o consumo por pessoa.
+#   - "local" sem cache: 4 queries trazendo a divisão completa + agregação em Python.
+#   - "local" com cache: nenhuma query, só a agregação em Python.
+# Sem um banco de verdade, o custo de rede é estimado a partir do RTT e da banda
+# informados (padrão: 25 ms de ida e volta e 20 Mbit/s entre o Render e o Supabase).
+# A parte de CPU (decodificar o JSON e calcular) é medida de verdade.
+# Execute da raiz do projeto: python -m backend.benchmarks.bench_totais_estrategias [rtt_ms] [mbps]
+
+import sys
+import timeit
+
+import orjson
+
+from backend.services.totais import (
+    agregar, consumo_do_banco, fechar_totais, montar_matriz, MILESIMOS, CENTAVOS,
+)
+from backend.benchmarks.dados_sinteticos import gerar_divisao
+
+TAMANHOS = [(10, 2), (50, 10), (200, 20), (500, 50)]  # (itens, pessoas)
+
+
+def simular_totais_compactos(divisao: dict) -> dict:
+    """Monta em Python o mesmo JSON que a função SQL totais_divisao_compacto devolve."""
+    m = montar_matriz(divisao)
+    c = agregar(m)
+    return {
+        "taxa_servico_percentual": divisao["taxa_servico_percentual"],
+        "desconto_valor": divisao["desconto_valor"],
+        "subtotal_geral": c.subtotal_geral / (CENTAVOS * MILESIMOS),
+        "quantidade_total": c.quantidade_total / MILESIMOS,
+        "quantidade_distribuida": c.quantidade_distribuida / MILESIMOS,
+        "itens_total": c.itens_total,
+        "itens_restantes": c.itens_restantes,
+        "pessoas": [
+            {
+                "nome": nome,
+                "subtotal": subtotal / (CENTAVOS * MILESIMOS),
+                "itens": [[n, q / MILESIMOS, v / (CENTAVOS * MILESIMOS)] for n, q, v in linhas],
+            }
+            for nome, subtotal, linhas in zip(c.pessoa_nomes, c.subtotais, c.linhas)
+        ],
+    }
+
+
+def linhas_das_tabelas(divisao: dict) -> list:
+    """As 4 respostas do PostgREST usadas para montar a divisão completa."""
+    cabecalho = {k: v for k, v in divisao.items() if k not in ("itens", "pessoas")}
+    itens = [{k: v for k, v in i.items() if k != "atribuido_a"} for i in divisao["itens"]]
+    atribuicoes = [
+        {"id": f"{i['id']}-{pessoa_id}", "item_id": i["id"], "pessoa_id": pessoa_id,
+         "quantidade": q, "itens": {"divisao_id": divisao["id"]}}
+        for i in divisao["itens"] for pessoa_id, q in i["atribuido_a"].items()
+    ]
+    return [cabecalho, itens, divisao["pessoas"], atribuicoes]
+
+
+def medir_ms(funcao, repeticoes: int = 50) -> float:
+    return min(timeit.repeat(funcao, number=repeticoes, repeat=5)) / repeticoes * 1000
+
+
+def main():
+    rtt_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 25.0
+    mbps = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    bytes_por_ms = mbps * 1_000_000 / 8 / 1000
+
+    print(f"RTT {rtt_ms:.0f} ms, banda {mbps:.0f} Mbit/s (tempo total = rede estimada + CPU medida)\n")
+    print(f"{'itens x pessoas':<16} {'estratégia':<14} {'queries':>7} {'payload':>10} {'CPU':>9} {'total':>9}")
+    for n_itens, n_pessoas in TAMANHOS:
+        divisao = gerar_divisao(n_itens, n_pessoas, densidade=0.3)
+
+        corpo_rpc = orjson.dumps(simular_totais_compactos(divisao))
+        cpu_rpc = medir_ms(lambda: fechar_totais(consumo_do_banco(orjson.loads(corpo_rpc))))
+
+        corpos = [orjson.dumps(linhas) for linhas in linhas_das_tabelas(divisao)]
+        cpu_decodificar = medir_ms(lambda: [orjson.loads(corpo) for corpo in corpos])
+        cpu_local = medir_ms(lambda: fechar_totais(agregar(montar_matriz(divisao))))
+
+        # Conferência: as duas estratégias precisam dar exatamente o mesmo resultado
+        assert fechar_totais(consumo_do_banco(orjson.loads(corpo_rpc))) == \
+            fechar_totais(agregar(montar_matriz(divisao)))
+
+        linhas = [
+            ("banco (RPC)", 1, len(corpo_rpc), cpu_rpc),
+            ("local s/ cache", 4, sum(map(len, corpos)), cpu_decodificar + cpu_local),
+            ("local c/ cache", 0, 0, cpu_local),
+        ]
+        for nome, queries, tamanho, cpu in linhas:
+            total = queries * rtt_ms + tamanho / bytes_por_ms + cpu
+            print(f"{f'{n_itens} x {n_pessoas}':<16} {nome:<14} {queries:>7} "
+                  f"{tamanho / 1024:>8.1f}KB {cpu:>7.2f}ms {total:>7.2f}ms")
+        print()
+
+
+if __name__ == "__main__":
+    main()
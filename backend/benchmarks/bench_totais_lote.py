@@ -0,0 +1,62 @@
+# --- Anotações para Iniciantes ---
+# Benchmark do cálculo de totais em lote (totais.calcular_totais_lote), usado
+# pelo /api/calcular-totais/lote para a lista do histórico.
+#
+# O calcular_totais_lote é um laço simples: cada divisão passa pelo mesmo
+# caminho do cálculo de uma divisão só. Este benchmark mostra que isso basta,
+# comparando com um "passe único" da fase 1: os preços de todas as divisões
+# num vetor só e as quantidades numa matriz só (pessoa × item de todas as
+# divisões, com zeros fora da própria divisão), somados de uma vez.
+# A fase 2 (rateio em centavos) é sempre por divisão, então entra igual nas duas.
+#
+# Execute da raiz do projeto: python -m backend.benchmarks.bench_totais_lote
+
+import random
+import timeit
+from operator import mul
+
+from backend.services.totais import agregar, calcular_totais_lote, fechar_totais, montar_matriz
+from backend.benchmarks.dados_sinteticos import gerar_divisao
+
+HISTORICOS = [10, 50, 200]  # divisões pedidas de uma vez
+TAMANHO_DIVISAO = (15, 5)  # itens, pessoas (uma conta de bar típica)
+
+
+def subtotais_em_passe_unico(matrizes: list) -> list:
+    """Fase 1 de todas as divisões numa matriz combinada (um vetor de preços só)."""
+    precos = [preco for m in matrizes for preco in m.precos]
+    linhas = []
+    inicio = 0
+    for m in matrizes:
+        for linha in m.matriz:
+            linhas.append([0] * inicio + linha + [0] * (len(precos) - inicio - len(linha)))
+        inicio += len(m.precos)
+    return [sum(map(mul, linha, precos)) for linha in linhas]
+
+
+def medir_ms(funcao, repeticoes: int = 20) -> float:
+    return min(timeit.repeat(funcao, number=repeticoes, repeat=5)) / repeticoes * 1000
+
+
+def main():
+    itens, pessoas = TAMANHO_DIVISAO
+    print(f"Divisões de {itens} itens x {pessoas} pessoas\n")
+    print(f"{'divisões':>8} {'lote (laço)':>12} {'fase 1':>9} {'fase 2':>9} {'fase 1 passe único':>19}")
+    for quantidade in HISTORICOS:
+        rng = random.Random(42)
+        divisoes = [gerar_divisao(itens, pessoas, densidade=0.4, rng=rng) for _ in range(quantidade)]
+        matrizes = [montar_matriz(d) for d in divisoes]
+        consumos = [agregar(m) for m in matrizes]
+
+        # Conferência: o passe único dá os mesmos subtotais do laço
+        assert subtotais_em_passe_unico(matrizes) == [s for c in consumos for s in c.subtotais]
+
+        lote = medir_ms(lambda: calcular_totais_lote(divisoes))
+        fase1 = medir_ms(lambda: [agregar(montar_matriz(d)) for d in divisoes])
+        fase2 = medir_ms(lambda: [fechar_totais(c) for c in consumos])
+        unico = medir_ms(lambda: subtotais_em_passe_unico([montar_matriz(d) for d in divisoes]))
+        print(f"{quantidade:>8} {lote:>10.2f}ms {fase1:>7.2f}ms {fase2:>7.2f}ms {unico:>17.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
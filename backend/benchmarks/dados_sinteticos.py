@@ -0,0 +1,80 @@
+# --- Anotações para Iniciantes ---
+# Gera divisões falsas (no mesmo formato que o db_service devolve) para os benchmarks.
+# Usamos um gerador com semente fixa para que os resultados sejam reproduzíveis.
+
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+NOMES_ITENS = [
+    "Coca-Cola", "Guaraná", "Cerveja", "Chopp", "Água", "Suco de Laranja", "Caipirinha",
+    "Batata Frita", "Picanha", "Frango a Passarinho", "Pizza Calabresa", "Couvert",
+    "Vinho Tinto", "Sobremesa", "Café", "Porção de Mandioca", "Salada", "Risoto",
+]
+NOMES_PESSOAS = [
+    "Ana", "Bruno", "Carla", "Diego", "Elisa", "Fábio", "Gabi", "Heitor", "Iara", "João",
+]
+
+
+def gerar_divisao(n_itens: int = 50, n_pessoas: int = 10, densidade: float = 0.3,
+                  rng: random.Random = None, user_id: str = "user-bench",
+                  created_at: str = None) -> dict:
+    """
+    Gera uma divisão completa com `n_itens` itens e `n_pessoas` pessoas.
+    `densidade` é a chance de cada pessoa consumir cada item (1.0 = matriz densa).
+    """
+    rng = rng or random.Random(42)
+    divisao_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    pessoas = [
+        {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "divisao_id": divisao_id,
+            "nome": f"{NOMES_PESSOAS[i % len(NOMES_PESSOAS)]} {i // len(NOMES_PESSOAS) or ''}".strip(),
+        }
+        for i in range(n_pessoas)
+    ]
+    itens = []
+    for i in range(n_itens):
+        quantidade = float(rng.randint(1, 6))
+        consumidores = [p["id"] for p in pessoas if rng.random() < densidade]
+        atribuido_a = {}
+        if consumidores:
+            # Divide em milésimos sem ultrapassar a quantidade do item
+            parte, sobra = divmod(int(quantidade * 1000), len(consumidores))
+            atribuido_a = {
+                pessoa_id: (parte + (1 if i < sobra else 0)) / 1000
+                for i, pessoa_id in enumerate(consumidores)
+            }
+        itens.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "divisao_id": divisao_id,
+            "nome": NOMES_ITENS[i % len(NOMES_ITENS)],
+            "quantidade": quantidade,
+            "valor_unitario": round(rng.uniform(3, 120), 2),
+            "ordem": i,
+            "atribuido_a": atribuido_a,
+        })
+    return {
+        "id": divisao_id,
+        "user_id": user_id,
+        "nome": f"Bench {divisao_id[:8]}",
+        "status": "em_andamento",
+        "taxa_servico_percentual": 10.0,
+        "desconto_valor": round(rng.uniform(0, 30), 2),
+        "created_at": created_at or datetime.now(timezone.utc).isoformat(),
+        "versao": 1,
+        "itens": itens,
+        "pessoas": pessoas,
+    }
+
+
+def gerar_historico(n_divisoes: int = 200, n_itens: int = 12, n_pessoas: int = 4,
+                    densidade: float = 0.5, seed: int = 42) -> list:
+    """Gera o histórico de um usuário com `n_divisoes` divisões (mais recentes primeiro)."""
+    rng = random.Random(seed)
+    inicio = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        gerar_divisao(n_itens, n_pessoas, densidade, rng=rng,
+                      created_at=(inicio + timedelta(hours=n_divisoes - i)).isoformat())
+        for i in range(n_divisoes)
+    ]
@@ -0,0 +1,65 @@
+# --- Anotações para Iniciantes ---
+# Job de backfill das estatísticas (database/13estatisticas.md).
+# Divisões finalizadas ANTES das tabelas de resumo existirem ainda não foram
+# contadas. Este job conta todas, em lotes pequenos, com uma pausa entre eles
+# para não pesar no banco enquanto o app está no ar:
+#   1. divisões finalizadas sem snapshot ganham o snapshot (o que já as conta);
+#   2. as demais são contadas por processar_estatisticas_pendentes.
+# Pode ser interrompido e executado de novo: nada é contado duas vezes.
+# Execute da raiz do projeto: python -m backend.jobs.backfill_estatisticas [lote] [pausa_segundos]
+
+import logging
+import sys
+import time
+
+from backend.services import db_service as db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def gerar_snapshots_pendentes(lote: int, pausa: float) -> int:
+    """Grava o snapshot das divisões finalizadas antigas. Retorna quantas foram."""
+    total = 0
+    vistas = set()
+    while True:
+        divisoes = [d for d in db.get_divisoes_finalizadas_sem_snapshot(lote) if d["id"] not in vistas]
+        if not divisoes:
+            return total
+        for divisao in divisoes:
+            vistas.add(divisao["id"])  # se falhar, não tenta de novo nesta execução
+            try:
+                db.get_divisao_completa(divisao["id"], divisao=divisao)
+                total += 1
+            except Exception as e:
+                logger.error(f"Erro ao gerar o snapshot da divisão '{divisao['id']}': {e}")
+        logger.info(f"Snapshots gerados: {total}")
+        time.sleep(pausa)
+
+
+def processar_pendentes(lote: int, pausa: float) -> int:
+    """Conta nas estatísticas as divisões finalizadas restantes. Retorna quantas foram."""
+    total = 0
+    while True:
+        processadas = db.processar_estatisticas_pendentes(lote)
+        if not processadas:
+            return total
+        total += processadas
+        logger.info(f"Divisões contadas nas estatísticas: {total}")
+        time.sleep(pausa)
+
+
+def main():
+    lote = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    pausa = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    if not db.db:
+        logger.error("❌ Supabase não configurado (veja backend/.env).")
+        sys.exit(1)
+
+    snapshots = gerar_snapshots_pendentes(lote, pausa)
+    contadas = processar_pendentes(lote, pausa)
+    logger.info(f"✅ Backfill concluído: {snapshots} snapshots gerados, {contadas + snapshots} divisões contadas.")
+
+
+if __name__ == "__main__":
+    main()
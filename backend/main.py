@@ -2,15 +2,20 @@
 # Este arquivo é o "coração" do nosso backend.
 # ATUALIZADO: Agora usando Supabase para persistência e autenticação JWT!
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Header, Query
 from fastapi.security import APIKeyHeader
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional, Union
+from datetime import datetime, timedelta, timezone
 import uvicorn
+import asyncio
+import hmac
 import os
+import time
 import uuid
-from dotenv import load_dotenv
 import logging
 
 # Configura logging
@@ -18,7 +23,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Carrega .env da mesma pasta do main.py (backend/)
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
+from .services import ambiente  # noqa: F401
 
 # Verifica se o token foi configurado
 API_SECRET_TOKEN = os.getenv("API_SECRET_TOKEN")
@@ -28,21 +33,41 @@ else:
     logger.warning("⚠️ Rodando SEM autenticação por API Key")
 
 # --- Importações do nosso próprio projeto ---
-from .services.ia_scanner import scan_receipt_to_json
+from .services.ia_scanner import scan_receipt_to_json, carregar_gemini
 from .services import db_service as db
 from .services.auth import get_current_user  # NOVO: Autenticação JWT
+from .services.serializacao import divisao_para_dict, resposta_json, TAMANHO_MINIMO_COMPRESSAO
+from .services.totais import calcular_totais, calcular_totais_lote
+from .services import totais_service
+from .services import coalescedor
+from .services import eventos
+from .services import compartilhamento
+from .services import exportacao
+from .services import armazenamento
+from .services import metricas
+from .services import perfilador
+from .services import idempotencia
 from .schemas import (
     Item, ScanResponse, Pessoa, Divisao, DistribuirItemRequest, TotaisResponse,
-    PessoaTotal, ItemConsumido, Progresso, ItemPayload, ConfigDivisao, AddPessoaRequest
+    ItemPayload, ConfigDivisao, AddPessoaRequest, TotaisLoteRequest, SimularTotaisRequest,
+    DistribuicaoLoteRequest, OperacoesDivisaoRequest, OperacoesDivisaoResponse,
+    SincronizacaoDivisoesResponse, CompartilhamentoResponse, DivisaoPublicaResponse, BuscaResponse,
+    EstatisticaMensal, EstatisticaItem, EstatisticaCompanhia
 )
 
 # --- Configuração da Aplicação FastAPI ---
 app = FastAPI(
     title="Compartilha AI API",
     description="API para escanear e dividir contas de restaurante.",
-    version="3.1.0"  # Versão atualizada com autenticação JWT
+    version="3.1.0",  # Versão atualizada com autenticação JWT
+    default_response_class=ORJSONResponse  # Serialização rápida com orjson
 )
 
+# POST com header Idempotency-Key: executa uma vez, repete a resposta nos reenvios.
+# Adicionado primeiro = o mais interno: a resposta repetida ainda passa pelo
+# CORS, pelos headers de segurança e pelo gzip da requisição atual.
+app.add_middleware(idempotencia.MiddlewareIdempotencia)
+
 # Middleware de CORS
 app.add_middleware(
     CORSMiddleware,
@@ -61,23 +86,64 @@ app.add_middleware(
 )
 
 # Middleware de Segurança
+# ASGI puro: só acrescenta os headers no início da resposta (o BaseHTTPMiddleware
+# criava uma tarefa e um stream extra por requisição)
 from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.responses import Response
 
-class CustomSecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        response = await call_next(request)
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        return response
+class CustomSecurityHeadersMiddleware:
+    HEADERS = [
+        (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+        (b"x-content-type-options", b"nosniff"),
+        (b"x-frame-options", b"DENY"),
+    ]
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_com_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), *self.HEADERS]}
+            await send(message)
+
+        await self.app(scope, receive, send_com_headers)
 
 app.add_middleware(CustomSecurityHeadersMiddleware)
 
+# Compressão gzip para respostas grandes (ex: histórico de divisões)
+app.add_middleware(GZipMiddleware, minimum_size=TAMANHO_MINIMO_COMPRESSAO, compresslevel=6)
+
+# Pilhas das requisições mais lentas que PERFIL_LENTO_MS (desligado por padrão)
+if perfilador.LIMITE_LENTO_MS > 0:
+    app.add_middleware(perfilador.MiddlewareRequisicoesLentas)
+
+# Tempo de cada requisição por fase (header Server-Timing e /api/metrics).
+# Adicionado por último = o mais externo: mede também os outros middlewares.
+metricas.instrumentar_db(db)
+app.add_middleware(metricas.MiddlewareMetricas)
+
+@app.on_event("shutdown")
+def gravar_pendencias_ao_desligar():
+    """Grava as distribuições ainda pendentes no coalescedor antes de desligar."""
+    coalescedor.descarregar_tudo()
+
+
 # --- Constantes ---
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+INTERVALO_PING_EVENTOS = 15  # segundos sem eventos até mandar um "ping" (mantém a conexão viva)
+RETENCAO_EXCLUSOES_DIAS = 90  # lápides de divisões excluídas (ver database/09sincronizacao.md)
+# Links públicos: um dia de cache em qualquer lugar (navegador, CDN). Longo o
+# bastante para a mesa inteira abrir o link, curto para um link de divisão
+# excluída sumir dos caches compartilhados.
+CACHE_CONTROL_PUBLICO = "public, max-age=86400"
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # protege o /api/metrics (opcional)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # libera o /api/admin (sem ele, as rotas não existem)
 
 
 # ============================================
@@ -85,32 +151,141 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
 # ============================================
 
 def db_divisao_to_response(divisao_db: dict) -> Divisao:
-    """Converte dados do banco para o modelo de resposta."""
-    itens = divisao_db.get("itens", [])
-    pessoas = divisao_db.get("pessoas", [])
-    
-    return Divisao(
-        id=str(divisao_db["id"]),
-        nome=divisao_db.get("nome", "Divisão sem nome"),
-        itens=[
-            Item(
-                id=str(item["id"]),
-                nome=item["nome"],
-                quantidade=float(item["quantidade"]),
-                valor_unitario=float(item["valor_unitario"]),
-                atribuido_a=item.get("atribuido_a", {})
-            ) for item in itens
-        ],
-        pessoas=[
-            Pessoa(id=str(p["id"]), nome=p["nome"]) for p in pessoas
-        ],
-        status=divisao_db.get("status", "em_andamento"),
-        taxa_servico_percentual=float(divisao_db.get("taxa_servico_percentual", 10.0)),
-        desconto_valor=float(divisao_db.get("desconto_valor", 0.0)),
-        created_at=divisao_db.get("created_at")
+    """
+    Converte dados do banco para o modelo de resposta.
+    OTIMIZADO: Usa model_construct, pois os dados do banco já foram validados na escrita.
+    """
+    dados = divisao_para_dict(divisao_db)
+    dados["itens"] = [Item.model_construct(**item) for item in dados["itens"]]
+    dados["pessoas"] = [Pessoa.model_construct(**p) for p in dados["pessoas"]]
+    return Divisao.model_construct(**dados)
+
+
+def gerar_etag(divisao_db: dict) -> str:
+    """Gera o ETag de uma divisão a partir da sua versão."""
+    return f'"{divisao_db.get("versao", 1)}"'
+
+
+def etag_confere(if_none_match: Optional[str], etag: str) -> bool:
+    """Verifica se o ETag atual está na lista enviada em If-None-Match."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def versao_do_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Extrai a versão esperada do header If-Match (None = sem pré-condição)."""
+    if not if_match or if_match.strip() == "*":
+        return None
+    tag = if_match.split(",")[0].strip().removeprefix("W/").strip('"')
+    try:
+        return int(tag)
+    except ValueError:
+        raise HTTPException(status_code=412, detail="Header If-Match inválido.")
+
+
+def alterar_divisao_ou_erro(divisao_id: str, operacoes: list, if_match: Optional[str],
+                            user_id: str = None) -> dict:
+    """
+    Aplica as operações (formato dos schemas Op*) e incrementa a versão da
+    divisão na MESMA transação (db.alterar_divisao): se a alteração falha, a
+    versão não muda. Lança 404 se a divisão não existe, 409 se ela já foi
+    finalizada, 412 se o If-Match está desatualizado, e 404/400 quando o banco
+    recusa uma operação (item ou pessoa fora da divisão, regra violada).
+    Retorna {"divisao": linha já na versão nova, "referencias": ref -> ID}.
+    """
+    versao_esperada = versao_do_if_match(if_match)
+    descarregar_pendentes(divisao_id)
+    versao_esperada = coalescedor.versao_equivalente(divisao_id, versao_esperada)
+    try:
+        alteracao = db.alterar_divisao(divisao_id, operacoes, versao_esperada, user_id)
+    except (db.RegistroNaoEncontrado, db.RegraDivisaoViolada) as e:
+        status_code = 404 if isinstance(e, db.RegistroNaoEncontrado) else 400
+        # Com uma operação só, o "Operação 1: " do banco não ajuda ninguém
+        detalhe = str(e).removeprefix("Operação 1: ") if len(operacoes) == 1 else str(e)
+        raise HTTPException(status_code=status_code, detail=detalhe)
+    if not alteracao:
+        recusar_alteracao(divisao_id, if_match, user_id)
+    return alteracao
+
+
+def conferir_divisao(divisao_id: str, if_match: Optional[str], user_id: str = None,
+                     permitir_finalizada: bool = False) -> dict:
+    """
+    Lê a divisão (sem alterar nada) e confere se ela pode ser alterada.
+    Lança 404 se a divisão não existe, 409 se ela já foi finalizada
+    (exceto com `permitir_finalizada`) e 412 se o If-Match está desatualizado.
+    """
+    divisao = db.get_divisao(divisao_id, user_id)
+    if not divisao:
+        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
+    if divisao.get("status") == "finalizada" and not permitir_finalizada:
+        raise erro_divisao_finalizada()
+    versao_esperada = coalescedor.versao_equivalente(divisao_id, versao_do_if_match(if_match))
+    if versao_esperada is not None and divisao.get("versao") != versao_esperada:
+        raise erro_versao_desatualizada()
+    return divisao
+
+
+def descarregar_pendentes(divisao_id: str) -> None:
+    """
+    Grava antes as distribuições pendentes no coalescedor, para a ordem das
+    escritas se manter. Se a gravação falhou (elas continuam pendentes e
+    serão gravadas de novo), a alteração é recusada com 503.
+    """
+    if not coalescedor.descarregar(divisao_id):
+        raise HTTPException(
+            status_code=503,
+            detail="Não foi possível salvar as últimas alterações da divisão. Tente novamente."
+        )
+
+
+def recusar_alteracao(divisao_id: str, if_match: Optional[str], user_id: str = None,
+                      permitir_finalizada: bool = False) -> None:
+    """
+    Uma gravação condicional (versão, dono, status) não pegou nenhuma linha.
+    Só gasta uma query extra no caminho de erro, para diferenciar 404, 409 e 412.
+    """
+    conferir_divisao(divisao_id, if_match, user_id, permitir_finalizada)
+    raise erro_versao_desatualizada()  # a versão mudou entre a leitura e a gravação
+
+
+def erro_versao_desatualizada() -> HTTPException:
+    """Erro para If-Match desatualizado (outro dispositivo alterou a divisão antes)."""
+    return HTTPException(
+        status_code=412,
+        detail="A divisão foi alterada em outro dispositivo. Recarregue e tente novamente."
+    )
+
+
+def erro_divisao_finalizada() -> HTTPException:
+    """Erro para alterações em divisões finalizadas (o snapshot delas é definitivo)."""
+    return HTTPException(
+        status_code=409,
+        detail="Esta divisão já foi finalizada e não pode ser alterada. Duplique-a para editar."
     )
 
 
+def cache_control_da_divisao(divisao_db: dict) -> str:
+    """
+    Divisões finalizadas nunca mudam (só podem ser excluídas), então o
+    navegador pode guardá-las sem revalidar. As demais sempre revalidam (ETag).
+    """
+    if divisao_db.get("status") == "finalizada":
+        return "private, max-age=31536000, immutable"
+    return "private, no-cache"
+
+
+def responder_divisao(divisao_completa: dict) -> Response:
+    """
+    Serializa a divisão direto para JSON e anexa o ETag da versão atual.
+    OTIMIZADO: Não passa pelos modelos Pydantic nem pela revalidação do response_model.
+    """
+    headers = {"ETag": gerar_etag(divisao_completa), "Cache-Control": cache_control_da_divisao(divisao_completa)}
+    return resposta_json(divisao_para_dict(divisao_completa), headers=headers)
+
+
 def get_user_id_or_error(current_user: dict) -> str:
     """Extrai o user_id do usuário autenticado ou lança erro."""
     user_id = current_user.get("user_id")
@@ -130,21 +305,125 @@ def read_root():
         "status": "ok",
         "version": app.version,
         "auth": "jwt",
-        "database": "supabase"
+        "database": armazenamento.DB_BACKEND
     }
 
 
+@app.get("/api/publico/{token}", response_model=DivisaoPublicaResponse)
+def divisao_publica_endpoint(token: str, if_none_match: Optional[str] = Header(None)):
+    """
+    Página pública de um link compartilhado: quanto cada pessoa deve.
+    Sem login. A resposta vem pronta do cache (memória ou disco); o banco só
+    é consultado na primeira abertura do link.
+    """
+    if not compartilhamento.token_valido(token):
+        raise HTTPException(status_code=404, detail="Link não encontrado.")
+    
+    entrada = compartilhamento.obter(token)
+    if entrada is None:
+        conteudo = db.get_divisao_compartilhada(token)
+        if not conteudo:
+            raise HTTPException(status_code=404, detail="Link não encontrado.")
+        entrada = compartilhamento.guardar(token, conteudo)
+    
+    corpo, etag = entrada
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL_PUBLICO}
+    if etag_confere(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=corpo, media_type="application/json", headers=headers)
+
+
 @app.get("/api/health")
 def health_check():
     """Health check com status do banco."""
-    from .services.supabase_client import supabase
     return {
         "status": "ok",
         "version": app.version,
-        "database_connected": supabase is not None
+        "database_connected": bool(db.db)
     }
 
 
+@app.get("/api/ready")
+def ready_check():
+    """
+    Prontidão: cria o cliente do banco (com uma consulta mínima) e carrega o
+    SDK do Gemini, que no import ficam para o primeiro uso. Aponte a
+    verificação de prontidão da hospedagem para cá: o custo da subida fica
+    nela, e não na primeira requisição de um usuário. 503 se algo falhar.
+    """
+    componentes = {}
+    for nome, aquecer in (("banco", db.verificar_conexao), ("scanner", carregar_gemini)):
+        inicio = time.perf_counter()
+        try:
+            ok = aquecer() is not False
+            erro = None if ok else "não configurado"
+        except Exception as e:
+            ok, erro = False, str(e)
+            logger.warning(f"⚠️ /api/ready: {nome} falhou: {e}")
+        componentes[nome] = {"ok": ok, "ms": round((time.perf_counter() - inicio) * 1000, 1), "erro": erro}
+    pronto = all(c["ok"] for c in componentes.values())
+    return ORJSONResponse({"pronto": pronto, "componentes": componentes}, status_code=200 if pronto else 503)
+
+
+def bearer_confere(authorization: Optional[str], token: str) -> bool:
+    """Confere "Authorization: Bearer <token>" em tempo constante (não vaza o token pelo tempo)."""
+    return hmac.compare_digest((authorization or "").encode(), f"Bearer {token}".encode())
+
+
+@app.get("/api/metrics", include_in_schema=False)
+def metricas_endpoint(authorization: Optional[str] = Header(None)):
+    """
+    Métricas por rota (latência, tempo por fase, chamadas ao banco) no formato
+    do Prometheus. Com METRICS_TOKEN no .env, exige "Authorization: Bearer <token>".
+    """
+    if METRICS_TOKEN and not bearer_confere(authorization, METRICS_TOKEN):
+        raise HTTPException(status_code=401, detail="Token de métricas inválido.")
+    return Response(content=metricas.texto_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ============================================
+# ADMINISTRAÇÃO (perfilador)
+# ============================================
+
+def verificar_admin(authorization: Optional[str] = Header(None)):
+    """Exige "Authorization: Bearer <ADMIN_TOKEN>". Sem ADMIN_TOKEN no .env, responde 404."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not bearer_confere(authorization, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Token de administração inválido.")
+
+
+@app.post("/api/admin/perfil", include_in_schema=False, dependencies=[Depends(verificar_admin)])
+def iniciar_perfil_endpoint(
+    segundos: float = Query(30, gt=0, le=300),
+    intervalo_ms: float = Query(5, ge=1, le=100),
+):
+    """
+    Começa um perfil por amostragem deste worker por `segundos`. Ao final, o
+    arquivo (formato folded, para flamegraph.pl ou speedscope) aparece em
+    /api/admin/perfis. Um perfil por vez.
+    """
+    nome = perfilador.iniciar_perfil(segundos, intervalo_ms)
+    if nome is None:
+        raise HTTPException(status_code=409, detail="Já há um perfil em andamento.")
+    return {"arquivo": nome, "segundos": segundos, "pid": os.getpid()}
+
+
+@app.get("/api/admin/perfis", include_in_schema=False, dependencies=[Depends(verificar_admin)])
+def listar_perfis_endpoint():
+    """Perfis gravados (sob demanda e de requisições lentas), do mais novo ao mais antigo."""
+    return {"perfis": perfilador.arquivos()}
+
+
+@app.get("/api/admin/perfis/{nome}", include_in_schema=False, dependencies=[Depends(verificar_admin)])
+def baixar_perfil_endpoint(nome: str):
+    """Baixa um perfil gravado."""
+    caminho = perfilador.caminho_do_arquivo(nome)
+    if caminho is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado.")
+    return FileResponse(caminho, media_type="text/plain; charset=utf-8", filename=nome)
+
+
 # ============================================
 # ENDPOINTS AUTENTICADOS
 # ============================================
@@ -170,7 +449,8 @@ async def scan_comanda_endpoint(file: UploadFile = File(...), current_user: dict
         with open(temp_file_path, "wb") as buffer:
             buffer.write(contents)
 
-        dados_extraidos = scan_receipt_to_json(temp_file_path)
+        with metricas.fase("scanner"):
+            dados_extraidos = scan_receipt_to_json(temp_file_path)
         if not dados_extraidos or "itens" not in dados_extraidos:
             raise HTTPException(status_code=400, detail="A IA não conseguiu extrair itens da imagem.")
 
@@ -242,7 +522,7 @@ async def criar_divisao_endpoint(request: CriarDivisaoRequest, current_user: dic
             raise HTTPException(status_code=500, detail="Erro ao buscar divisão criada")
         
         logger.info(f"Nova divisão criada com ID: {divisao_id} para usuário: {user_id[:8]}...")
-        return db_divisao_to_response(divisao_completa)
+        return responder_divisao(divisao_completa)
         
     except HTTPException:
         raise
@@ -252,39 +532,221 @@ async def criar_divisao_endpoint(request: CriarDivisaoRequest, current_user: dic
 
 
 @app.get("/api/divisao/{divisao_id}", response_model=Divisao)
-async def buscar_divisao_endpoint(divisao_id: str, current_user: dict = Depends(get_current_user)):
-    """Busca uma divisão pelo ID."""
-    divisao = db.get_divisao_completa(divisao_id)
+async def buscar_divisao_endpoint(
+    divisao_id: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Busca uma divisão pelo ID.
+    Se o cliente já tem a versão atual (If-None-Match), responde 304 sem
+    buscar itens, pessoas e atribuições. Divisões finalizadas vêm do snapshot
+    (uma única query) e podem ficar no cache do navegador para sempre.
+    """
+    divisao = db.get_divisao(divisao_id)
+    if not divisao:
+        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
+    
+    etag = gerar_etag(divisao)
+    if etag_confere(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control_da_divisao(divisao)})
+    
+    # Distribuições pendentes (coalescedor) já têm a versão reservada: entram no conteúdo dela
+    divisao_completa = coalescedor.sobrepor(db.get_divisao_completa(divisao_id, divisao=divisao))
+    return responder_divisao(divisao_completa)
+
+
+@app.get("/api/divisao/{divisao_id}/eventos")
+async def eventos_divisao_endpoint(
+    divisao_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Acompanha a divisão em tempo real (Server-Sent Events).
+    Cada alteração chega como um evento pequeno (item_atualizado,
+    atribuicoes_substituidas, ...) com a versão da divisão no campo `id`.
+    Ao receber "ressincronizar", o cliente deve buscar a divisão inteira.
+    Ao reconectar com Last-Event-ID, os eventos perdidos são reenviados
+    (ou vem um "ressincronizar", se não estiverem mais no histórico).
+    """
+    divisao = db.get_divisao(divisao_id)
     if not divisao:
         raise HTTPException(status_code=404, detail="Divisão não encontrada.")
-    return db_divisao_to_response(divisao)
+    versao = divisao.get("versao")
+    
+    perdidos = []
+    if last_event_id and last_event_id.isdigit() and versao is not None:
+        perdidos = eventos.mudancas_desde(divisao_id, int(last_event_id), versao)
+        if perdidos is None:
+            perdidos = [{"tipo": "ressincronizar", "versao": versao}]
+    
+    assinatura = eventos.assinar(divisao_id)
+    if not assinatura:
+        raise HTTPException(status_code=429, detail="Muitos dispositivos acompanhando esta divisão.")
+    eventos.registrar_versao(divisao_id, versao)
+    
+    async def gerar_eventos():
+        try:
+            yield eventos.formatar_evento({"tipo": "conectado", "versao": versao})
+            for evento in perdidos:
+                yield eventos.formatar_evento(evento)
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(assinatura.fila.get(), timeout=INTERVALO_PING_EVENTOS)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+        finally:
+            eventos.cancelar(assinatura)
+    
+    return StreamingResponse(
+        gerar_eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/divisao/{divisao_id}/mudancas")
+async def mudancas_divisao_endpoint(
+    divisao_id: str,
+    desde: int = Query(..., ge=0, description="Versão que o cliente já tem"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Sincronização por diferença: devolve só as mudanças feitas depois da
+    versão `desde` (os mesmos eventos do /eventos). Se o histórico não cobre
+    esse intervalo, devolve a divisão completa com `completo: true`.
+    """
+    divisao = db.get_divisao(divisao_id)
+    if not divisao:
+        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
+    versao = divisao.get("versao")
+    
+    mudancas = None
+    if versao is not None and not coalescedor.tem_pendentes(divisao_id):
+        mudancas = eventos.mudancas_desde(divisao_id, desde, versao)
+    
+    if mudancas is not None:
+        conteudo = {"versao": versao, "completo": False, "mudancas": mudancas}
+    else:
+        divisao_completa = coalescedor.sobrepor(db.get_divisao_completa(divisao_id, divisao=divisao))
+        conteudo = {"versao": versao, "completo": True, "divisao": divisao_para_dict(divisao_completa)}
+    
+    return resposta_json(conteudo, headers={"ETag": gerar_etag(divisao), "Cache-Control": "private, no-cache"})
 
 
-@app.get("/api/divisoes", response_model=List[Divisao])
-async def listar_divisoes_endpoint(current_user: dict = Depends(get_current_user)):
-    """Lista todas as divisões do usuário. OTIMIZADO: 4 queries ao invés de N+1."""
+@app.get("/api/divisoes", response_model=Union[List[Divisao], SincronizacaoDivisoesResponse])
+async def listar_divisoes_endpoint(
+    desde: Optional[datetime] = Query(None, description="`sincronizado_em` da última sincronização"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Lista todas as divisões do usuário. OTIMIZADO: 4 queries ao invés de N+1.
+    
+    Com `desde`, devolve só o que mudou depois dessa data (criadas, alteradas
+    e IDs das excluídas) no formato SincronizacaoDivisoesResponse. Sem
+    mudanças, custa uma única chamada ao banco.
+    """
     user_id = get_user_id_or_error(current_user)
     
+    if desde is not None:
+        if desde.tzinfo is None:
+            desde = desde.replace(tzinfo=timezone.utc)
+        agora = datetime.now(timezone.utc)
+        if desde >= agora - timedelta(days=RETENCAO_EXCLUSOES_DIAS):
+            alteracoes = db.get_alteracoes_desde(user_id, desde.isoformat())
+            if alteracoes is not None:
+                alteracoes["divisoes"] = [
+                    divisao_para_dict(coalescedor.sobrepor(div)) for div in alteracoes["divisoes"]
+                ]
+                return resposta_json({**alteracoes, "completo": False})
+        
+        # Última sincronização antiga demais (lápides já apagadas): manda tudo
+        divisoes_completas = db.get_divisoes_completas_by_user(user_id)
+        return resposta_json({
+            "divisoes": [divisao_para_dict(coalescedor.sobrepor(div)) for div in divisoes_completas],
+            "excluidas": [],
+            "sincronizado_em": (agora - timedelta(seconds=5)).isoformat(),
+            "completo": True,
+        })
+    
     # OTIMIZADO: Uma única função que faz batch de queries
     divisoes_completas = db.get_divisoes_completas_by_user(user_id)
-    return [db_divisao_to_response(div) for div in divisoes_completas]
+    return resposta_json([divisao_para_dict(coalescedor.sobrepor(div)) for div in divisoes_completas])
+
+
+@app.get("/api/buscar", response_model=BuscaResponse)
+async def buscar_endpoint(
+    q: str = Query(..., min_length=2, max_length=100, description="Texto procurado"),
+    pagina: int = Query(1, ge=1, le=1000),
+    tamanho: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Busca no histórico do usuário pelo nome das divisões e dos itens
+    (ex: "vinho"), ignorando acentos e maiúsculas. Mais recentes primeiro.
+    Uma única chamada ao banco, que devolve só a página pedida.
+    """
+    user_id = get_user_id_or_error(current_user)
+    termo = q.strip()
+    if len(termo) < 2:
+        raise HTTPException(status_code=400, detail="Digite pelo menos 2 letras para buscar.")
+    
+    encontrados = db.buscar_historico(user_id, termo, limite=tamanho, offset=(pagina - 1) * tamanho)
+    return resposta_json({
+        "resultados": encontrados["resultados"],
+        "pagina": pagina,
+        "tamanho": tamanho,
+        "tem_mais": encontrados["tem_mais"],
+    })
+
+
+@app.get("/api/exportar")
+def exportar_historico_endpoint(
+    nivel: str = Query("divisoes", pattern="^(divisoes|pessoas)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Baixa o histórico de divisões em CSV (para planilhas e contadores).
+    `nivel`: "divisoes" (uma linha por conta) ou "pessoas" (uma linha por
+    pessoa de cada conta). O arquivo é enviado aos poucos, página por página,
+    então a memória do servidor não cresce com o tamanho do histórico.
+    """
+    user_id = get_user_id_or_error(current_user)
+    
+    return StreamingResponse(
+        exportacao.gerar_csv(user_id, nivel),
+        media_type="text/csv; charset=utf-8",
+        headers={
+            "Content-Disposition": f'attachment; filename="compartilha-ai-{nivel}.csv"',
+            "Cache-Control": "no-store",
+        }
+    )
 
 
 @app.delete("/api/divisao/{divisao_id}")
-async def deletar_divisao_endpoint(divisao_id: str, current_user: dict = Depends(get_current_user)):
+async def deletar_divisao_endpoint(divisao_id: str, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
     """Deleta uma divisão e todos os seus dados relacionados."""
     try:
         user_id = get_user_id_or_error(current_user)
         
-        # Verifica se a divisão existe e pertence ao usuário
-        divisao = db.get_divisao(divisao_id, user_id)
-        if not divisao:
-            raise HTTPException(status_code=404, detail="Divisão não encontrada.")
+        # Distribuições pendentes são gravadas antes (a ordem das escritas se mantém)
+        descarregar_pendentes(divisao_id)
         
-        # Deleta a divisão (CASCADE deleta itens, pessoas e atribuições)
-        success = db.delete_divisao(divisao_id)
-        if not success:
-            raise HTTPException(status_code=500, detail="Erro ao deletar divisão.")
+        # Verifica se a divisão existe, pertence ao usuário e está na versão esperada
+        # (divisões finalizadas também podem ser excluídas)
+        divisao = conferir_divisao(divisao_id, if_match, user_id, permitir_finalizada=True)
+        
+        # Só divisões finalizadas têm link público (o CASCADE apaga o token no banco)
+        link = db.get_compartilhamento(divisao_id) if divisao.get("status") == "finalizada" else None
+        
+        # Deleta a divisão (CASCADE deleta itens, pessoas e atribuições), só se
+        # ninguém a alterou depois da leitura acima
+        if not db.delete_divisao(divisao_id, versao=divisao["versao"]):
+            recusar_alteracao(divisao_id, if_match, user_id, permitir_finalizada=True)
+        if link:
+            compartilhamento.esquecer([link["token"]])
         
         logger.info(f"Divisão '{divisao_id}' deletada pelo usuário '{user_id[:8]}...'")
         return {"success": True, "message": "Divisão deletada com sucesso."}
@@ -324,35 +786,32 @@ async def duplicar_divisao_endpoint(divisao_id: str, current_user: dict = Depend
         
         nova_divisao_id = nova_divisao["id"]
         
-        # Mapeia IDs antigos para novos (para atribuições)
-        pessoas_map = {}  # {id_antigo: id_novo}
-        itens_map = {}    # {id_antigo: id_novo}
-        
-        # Copia pessoas
+        # OTIMIZADO: Copia pessoas, itens e atribuições com um insert em lote cada
+        # (o número de queries não depende do tamanho da divisão)
         pessoas_originais = divisao_original.get("pessoas", [])
-        for pessoa in pessoas_originais:
-            nova_pessoa = db.create_pessoa(nova_divisao_id, pessoa["nome"])
-            if nova_pessoa:
-                pessoas_map[pessoa["id"]] = nova_pessoa["id"]
+        novas_pessoas = db.create_pessoas_bulk([
+            {"divisao_id": nova_divisao_id, "nome": pessoa["nome"]} for pessoa in pessoas_originais
+        ])
+        # Mapeia IDs antigos para novos (o insert devolve as linhas na mesma ordem)
+        pessoas_map = {antiga["id"]: nova["id"] for antiga, nova in zip(pessoas_originais, novas_pessoas)}
         
-        # Copia itens
         itens_originais = divisao_original.get("itens", [])
-        for item in itens_originais:
-            novo_item = db.create_item(
-                divisao_id=nova_divisao_id,
-                nome=item["nome"],
-                quantidade=float(item["quantidade"]),
-                valor_unitario=float(item["valor_unitario"])
-            )
-            if novo_item:
-                itens_map[item["id"]] = novo_item["id"]
-                
-                # Copia atribuições deste item
-                atribuicoes = item.get("atribuido_a", {})
-                for pessoa_id_antigo, quantidade in atribuicoes.items():
-                    pessoa_id_novo = pessoas_map.get(pessoa_id_antigo)
-                    if pessoa_id_novo and quantidade > 0:
-                        db.create_atribuicao(novo_item["id"], pessoa_id_novo, float(quantidade))
+        novos_itens = db.create_itens_bulk([
+            {
+                "divisao_id": nova_divisao_id,
+                "nome": item["nome"],
+                "quantidade": float(item["quantidade"]),
+                "valor_unitario": float(item["valor_unitario"])
+            } for item in itens_originais
+        ])
+        
+        atribuicoes = [
+            {"item_id": novo_item["id"], "pessoa_id": pessoas_map[pessoa_id_antigo], "quantidade": float(quantidade)}
+            for item, novo_item in zip(itens_originais, novos_itens)
+            for pessoa_id_antigo, quantidade in item.get("atribuido_a", {}).items()
+            if pessoa_id_antigo in pessoas_map and quantidade > 0
+        ]
+        db.create_atribuicoes_bulk(atribuicoes)
         
         # Busca a divisão completa para retornar
         divisao_completa = db.get_divisao_completa(nova_divisao_id)
@@ -360,7 +819,7 @@ async def duplicar_divisao_endpoint(divisao_id: str, current_user: dict = Depend
             raise HTTPException(status_code=500, detail="Erro ao buscar divisão criada.")
         
         logger.info(f"Divisão '{divisao_id}' duplicada para '{nova_divisao_id}' pelo usuário '{user_id[:8]}...'")
-        return db_divisao_to_response(divisao_completa)
+        return responder_divisao(divisao_completa)
         
     except HTTPException:
         raise
@@ -374,20 +833,17 @@ async def duplicar_divisao_endpoint(divisao_id: str, current_user: dict = Depend
 # ============================================
 
 @app.put("/api/divisao/{divisao_id}/config", response_model=Divisao)
-async def configurar_divisao_endpoint(divisao_id: str, config: ConfigDivisao, current_user: dict = Depends(get_current_user)):
+async def configurar_divisao_endpoint(divisao_id: str, config: ConfigDivisao, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
     """Atualiza as configurações gerais da divisão."""
-    divisao = db.get_divisao(divisao_id)
-    if not divisao:
-        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
-    
-    db.update_divisao(divisao_id, {
+    alteracao = alterar_divisao_ou_erro(divisao_id, [{
+        "tipo": "configurar",
         "taxa_servico_percentual": config.taxa_servico_percentual,
         "desconto_valor": config.desconto_valor
-    })
+    }], if_match)
     
     logger.info(f"Configuração da divisão '{divisao_id}' atualizada.")
-    divisao_completa = db.get_divisao_completa(divisao_id)
-    return db_divisao_to_response(divisao_completa)
+    divisao_completa = db.get_divisao_completa(divisao_id, divisao=alteracao["divisao"])
+    return responder_divisao(divisao_completa)
 
 
 # ============================================
@@ -395,62 +851,45 @@ async def configurar_divisao_endpoint(divisao_id: str, config: ConfigDivisao, cu
 # ============================================
 
 @app.post("/api/divisao/{divisao_id}/item", response_model=Divisao)
-async def adicionar_item_endpoint(divisao_id: str, item_payload: ItemPayload, current_user: dict = Depends(get_current_user)):
+async def adicionar_item_endpoint(divisao_id: str, item_payload: ItemPayload, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
     """Adiciona um novo item à lista de itens da divisão."""
-    divisao = db.get_divisao(divisao_id)
-    if not divisao:
-        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
-    
-    novo_item = db.create_item(
-        divisao_id=divisao_id,
-        nome=item_payload.nome,
-        quantidade=item_payload.quantidade,
-        valor_unitario=item_payload.valor_unitario
-    )
+    alteracao = alterar_divisao_ou_erro(divisao_id, [{
+        "tipo": "adicionar_item",
+        "ref": "novo",
+        "nome": item_payload.nome,
+        "quantidade": item_payload.quantidade,
+        "valor_unitario": item_payload.valor_unitario
+    }], if_match)
     
     logger.info(f"Item '{item_payload.nome}' adicionado à divisão '{divisao_id}'.")
-    divisao_completa = db.get_divisao_completa(divisao_id)
-    return db_divisao_to_response(divisao_completa)
+    divisao_completa = db.get_divisao_completa(divisao_id, divisao=alteracao["divisao"])
+    return responder_divisao(divisao_completa)
 
 
 @app.put("/api/divisao/{divisao_id}/item/{item_id}", response_model=Divisao)
-async def editar_item_endpoint(divisao_id: str, item_id: str, item_payload: ItemPayload, current_user: dict = Depends(get_current_user)):
+async def editar_item_endpoint(divisao_id: str, item_id: str, item_payload: ItemPayload, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
     """Edita um item existente na divisão."""
-    divisao = db.get_divisao(divisao_id)
-    if not divisao:
-        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
-    
-    item = db.get_item(item_id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item não encontrado.")
-    
-    db.update_item(item_id, {
+    alteracao = alterar_divisao_ou_erro(divisao_id, [{
+        "tipo": "editar_item",
+        "item_id": item_id,
         "nome": item_payload.nome,
         "quantidade": item_payload.quantidade,
         "valor_unitario": item_payload.valor_unitario
-    })
+    }], if_match)
     
     logger.info(f"Item '{item_payload.nome}' atualizado na divisão '{divisao_id}'.")
-    divisao_completa = db.get_divisao_completa(divisao_id)
-    return db_divisao_to_response(divisao_completa)
+    divisao_completa = db.get_divisao_completa(divisao_id, divisao=alteracao["divisao"])
+    return responder_divisao(divisao_completa)
 
 
 @app.delete("/api/divisao/{divisao_id}/item/{item_id}", response_model=Divisao)
-async def excluir_item_endpoint(divisao_id: str, item_id: str, current_user: dict = Depends(get_current_user)):
+async def excluir_item_endpoint(divisao_id: str, item_id: str, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
     """Exclui um item da divisão."""
-    divisao = db.get_divisao(divisao_id)
-    if not divisao:
-        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
-    
-    item = db.get_item(item_id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item não encontrado.")
-    
-    db.delete_item(item_id)
+    alteracao = alterar_divisao_ou_erro(divisao_id, [{"tipo": "remover_item", "item_id": item_id}], if_match)
     
     logger.info(f"Item ID '{item_id}' excluído da divisão '{divisao_id}'.")
-    divisao_completa = db.get_divisao_completa(divisao_id)
-    return db_divisao_to_response(divisao_completa)
+    divisao_completa = db.get_divisao_completa(divisao_id, divisao=alteracao["divisao"])
+    return responder_divisao(divisao_completa)
 
 
 # ============================================
@@ -458,41 +897,27 @@ async def excluir_item_endpoint(divisao_id: str, item_id: str, current_user: dic
 # ============================================
 
 @app.post("/api/divisao/{divisao_id}/pessoa", response_model=Divisao)
-async def adicionar_pessoa_endpoint(divisao_id: str, request: AddPessoaRequest, current_user: dict = Depends(get_current_user)):
+async def adicionar_pessoa_endpoint(divisao_id: str, request: AddPessoaRequest, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
     """Adiciona uma nova pessoa à divisão."""
-    divisao = db.get_divisao(divisao_id)
-    if not divisao:
-        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
-    
-    # Verifica se já existe pessoa com mesmo nome
-    pessoas = db.get_pessoas_by_divisao(divisao_id)
-    if any(p["nome"].lower() == request.nome.lower() for p in pessoas):
-        raise HTTPException(status_code=400, detail=f"Pessoa '{request.nome}' já existe na divisão.")
-    
-    nova_pessoa = db.create_pessoa(divisao_id, request.nome)
+    # O banco recusa (400) uma pessoa com o mesmo nome de outra da divisão
+    alteracao = alterar_divisao_ou_erro(
+        divisao_id, [{"tipo": "adicionar_pessoa", "ref": "nova", "nome": request.nome}], if_match
+    )
     
     logger.info(f"Pessoa '{request.nome}' adicionada à divisão '{divisao_id}'.")
-    divisao_completa = db.get_divisao_completa(divisao_id)
-    return db_divisao_to_response(divisao_completa)
+    divisao_completa = db.get_divisao_completa(divisao_id, divisao=alteracao["divisao"])
+    return responder_divisao(divisao_completa)
 
 
 @app.delete("/api/divisao/{divisao_id}/pessoa/{pessoa_id}", response_model=Divisao)
-async def excluir_pessoa_endpoint(divisao_id: str, pessoa_id: str, current_user: dict = Depends(get_current_user)):
+async def excluir_pessoa_endpoint(divisao_id: str, pessoa_id: str, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
     """Exclui uma pessoa e redistribui suas atribuições."""
-    divisao = db.get_divisao(divisao_id)
-    if not divisao:
-        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
-    
-    pessoa = db.get_pessoa(pessoa_id)
-    if not pessoa:
-        raise HTTPException(status_code=404, detail="Pessoa não encontrada.")
-    
     # A redistribuição automática das atribuições acontece via CASCADE no banco
-    db.delete_pessoa(pessoa_id)
+    alteracao = alterar_divisao_ou_erro(divisao_id, [{"tipo": "remover_pessoa", "pessoa_id": pessoa_id}], if_match)
     
     logger.info(f"Pessoa ID '{pessoa_id}' excluída da divisão '{divisao_id}'.")
-    divisao_completa = db.get_divisao_completa(divisao_id)
-    return db_divisao_to_response(divisao_completa)
+    divisao_completa = db.get_divisao_completa(divisao_id, divisao=alteracao["divisao"])
+    return responder_divisao(divisao_completa)
 
 
 # ============================================
@@ -500,16 +925,42 @@ async def excluir_pessoa_endpoint(divisao_id: str, pessoa_id: str, current_user:
 # ============================================
 
 @app.post("/api/distribuir-item/{divisao_id}", response_model=Divisao)
-async def distribuir_item_endpoint(divisao_id: str, request: DistribuirItemRequest, current_user: dict = Depends(get_current_user)):
+async def distribuir_item_endpoint(divisao_id: str, request: DistribuirItemRequest, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
     """Atribui um item (ou partes dele) a uma ou mais pessoas."""
-    divisao = db.get_divisao(divisao_id)
-    if not divisao:
-        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
+    if coalescedor.ativo():
+        return distribuir_item_juntando(divisao_id, request, if_match)
+    
+    # Troca as atribuições antigas pelas novas na mesma transação da versão.
+    # O banco confere item e pessoas (404) e o limite da quantidade (400)
+    alteracao = alterar_divisao_ou_erro(divisao_id, [{
+        "tipo": "distribuir_item",
+        "item_id": request.item_id,
+        "distribuicao": [{"pessoa_id": dist.pessoa_id, "quantidade": dist.quantidade} for dist in request.distribuicao]
+    }], if_match)
     
-    item = db.get_item(request.item_id)
+    logger.info(f"Item ID '{request.item_id}' distribuído na divisão '{divisao_id}'.")
+    divisao_completa = db.get_divisao_completa(divisao_id, divisao=alteracao["divisao"])
+    return responder_divisao(divisao_completa)
+
+
+def distribuir_item_juntando(divisao_id: str, request: DistribuirItemRequest, if_match: Optional[str]) -> Response:
+    """
+    Versão "juntada" da distribuição: valida contra a divisão (normalmente em
+    cache), reserva uma versão nova, guarda só o último estado do item no
+    coalescedor e responde na hora com o ETag dessa versão. A gravação
+    acontece ao fim da janela ou antes da próxima alteração.
+    """
+    divisao = conferir_divisao(divisao_id, if_match)
+    
+    divisao_completa = db.get_divisao_completa(divisao_id, divisao=divisao)
+    item = next((i for i in divisao_completa["itens"] if str(i["id"]) == request.item_id), None)
     if not item:
         raise HTTPException(status_code=404, detail="Item não encontrado na divisão.")
     
+    pessoas_ids = {str(p["id"]) for p in divisao_completa["pessoas"]}
+    if any(dist.pessoa_id not in pessoas_ids for dist in request.distribuicao):
+        raise HTTPException(status_code=404, detail="Pessoa não encontrada na divisão.")
+    
     quantidade_total_distribuida = sum(d.quantidade for d in request.distribuicao)
     if quantidade_total_distribuida > float(item["quantidade"]) + 1e-9:
         raise HTTPException(
@@ -517,17 +968,61 @@ async def distribuir_item_endpoint(divisao_id: str, request: DistribuirItemReque
             detail=f"Quantidade distribuída ({quantidade_total_distribuida}) maior que disponível ({item['quantidade']})."
         )
     
-    # Limpa atribuições antigas do item
-    db.delete_atribuicoes_by_item(request.item_id)
-    
-    # Cria novas atribuições
+    distribuicao: Dict[str, float] = {}
     for dist in request.distribuicao:
-        if dist.quantidade > 0:
-            db.create_atribuicao(request.item_id, dist.pessoa_id, dist.quantidade)
+        distribuicao[dist.pessoa_id] = distribuicao.get(dist.pessoa_id, 0) + dist.quantidade
+    
+    # A versão lida acima é a esperada: se mudou depois da validação, 412
+    reservada = db.reservar_versao(divisao_id, divisao["versao"])
+    if not reservada:
+        recusar_alteracao(divisao_id, if_match)
+    coalescedor.registrar(divisao_id, request.item_id, distribuicao, reservada["versao"])
+    
+    # No banco, só a versão mudou: o conteúdo em cache continua valendo para ela
+    divisao_completa = db.renovar_cache(divisao_completa, reservada)
+    return responder_divisao(coalescedor.sobrepor(divisao_completa))
+
+
+@app.post("/api/divisao/{divisao_id}/distribuir-lote", response_model=Divisao)
+async def distribuir_lote_endpoint(divisao_id: str, request: DistribuicaoLoteRequest, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
+    """
+    Distribui vários itens de uma vez: dividir igualmente, atribuir tudo a uma
+    pessoa ou limpar tudo. Tudo acontece em uma única chamada ao banco (uma
+    transação), não importa quantos itens a divisão tenha.
+    """
+    alteracao = alterar_divisao_ou_erro(
+        divisao_id, [{"tipo": "distribuir_lote", **request.model_dump(exclude_none=True)}], if_match
+    )
     
-    logger.info(f"Item '{item['nome']}' distribuído na divisão '{divisao_id}'.")
-    divisao_completa = db.get_divisao_completa(divisao_id)
-    return db_divisao_to_response(divisao_completa)
+    logger.info(f"Distribuição em lote '{request.operacao}' na divisão '{divisao_id}'.")
+    divisao_completa = db.get_divisao_completa(divisao_id, divisao=alteracao["divisao"])
+    return responder_divisao(divisao_completa)
+
+
+# ============================================
+# OPERAÇÕES EM LOTE
+# ============================================
+
+@app.post("/api/divisao/{divisao_id}/batch", response_model=OperacoesDivisaoResponse)
+async def aplicar_operacoes_endpoint(divisao_id: str, request: OperacoesDivisaoRequest, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
+    """
+    Aplica várias edições (renomear, itens, pessoas, distribuição...) na ordem
+    enviada, em uma única transação, e devolve a divisão final uma vez só.
+    Base para a fila de edições offline do app: um lote inteiro custa o mesmo
+    que uma edição isolada.
+    """
+    alteracao = alterar_divisao_ou_erro(
+        divisao_id, [op.model_dump(exclude_none=True) for op in request.operacoes], if_match
+    )
+    referencias = alteracao["referencias"]
+    
+    logger.info(f"{len(request.operacoes)} operações aplicadas na divisão '{divisao_id}'.")
+    divisao_completa = db.get_divisao_completa(divisao_id, divisao=alteracao["divisao"])
+    headers = {"ETag": gerar_etag(divisao_completa), "Cache-Control": "private, no-cache"}
+    return resposta_json(
+        {"divisao": divisao_para_dict(divisao_completa), "referencias": referencias},
+        headers=headers
+    )
 
 
 # ============================================
@@ -535,67 +1030,73 @@ async def distribuir_item_endpoint(divisao_id: str, request: DistribuirItemReque
 # ============================================
 
 @app.get("/api/calcular-totais/{divisao_id}", response_model=TotaisResponse)
-async def calcular_totais_endpoint(divisao_id: str, current_user: dict = Depends(get_current_user)):
-    """Calcula e retorna os totais para cada pessoa."""
-    divisao_completa = db.get_divisao_completa(divisao_id)
-    if not divisao_completa:
+async def calcular_totais_endpoint(
+    divisao_id: str,
+    estrategia: str = Query("auto", pattern="^(auto|banco|local)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Calcula e retorna os totais para cada pessoa.
+    Usa o motor de totais em centavos (services/totais.py): a soma do que cada
+    pessoa paga bate exatamente com o total da conta.
+    
+    `estrategia`: "banco" agrega no Postgres (uma chamada RPC), "local" agrega
+    em Python sobre a divisão completa e "auto" escolhe "local" só quando a
+    divisão já está em cache.
+    """
+    totais = totais_service.calcular_totais_divisao(divisao_id, estrategia)
+    if not totais:
         raise HTTPException(status_code=404, detail="Divisão não encontrada.")
     
-    divisao = db_divisao_to_response(divisao_completa)
+    return resposta_json(totais)
+
+
+@app.post("/api/calcular-totais/lote", response_model=Dict[str, TotaisResponse])
+async def calcular_totais_lote_endpoint(request: TotaisLoteRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Calcula os totais de várias divisões do usuário em uma única requisição
+    (ex: para mostrar os totais no histórico). Usa 4 queries no total.
+    Divisões inexistentes ou de outros usuários são omitidas da resposta.
+    """
+    user_id = get_user_id_or_error(current_user)
     
-    # Calcula totais por pessoa
-    calculos_pessoas = {
-        p.id: PessoaTotal(nome=p.nome, itens=[], subtotal=0, taxa=0, desconto=0, total=0, percentual_da_conta=0)
-        for p in divisao.pessoas
+    divisoes_completas = db.get_divisoes_completas_by_ids(request.divisao_ids, user_id)
+    return resposta_json(calcular_totais_lote(divisoes_completas))
+
+
+@app.post("/api/divisao/{divisao_id}/simular-totais", response_model=TotaisResponse)
+async def simular_totais_endpoint(divisao_id: str, request: SimularTotaisRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Calcula os totais com alterações hipotéticas (taxa, desconto, distribuição
+    de itens) SEM salvar nada. Serve para mostrar os totais mudando em tempo real
+    enquanto o usuário mexe nos controles; só o "salvar" precisa do PUT.
+    """
+    distribuicoes = {
+        simulacao.item_id: {d.pessoa_id: d.quantidade for d in simulacao.distribuicao}
+        for simulacao in request.distribuicoes
     }
-    
-    subtotal_geral_consumo = 0
-    for item in divisao.itens:
-        for pessoa_id, quantidade in item.atribuido_a.items():
-            if pessoa_id in calculos_pessoas:
-                valor_consumido = quantidade * item.valor_unitario
-                calculos_pessoas[pessoa_id].subtotal += valor_consumido
-                calculos_pessoas[pessoa_id].itens.append(
-                    ItemConsumido(nome=item.nome, quantidade=quantidade, valor=valor_consumido, desconto_aplicado=0)
-                )
-        subtotal_geral_consumo += item.quantidade * item.valor_unitario
-    
-    if subtotal_geral_consumo == 0:
-        return TotaisResponse(
-            pessoas=list(calculos_pessoas.values()),
-            progresso=Progresso(percentual_distribuido=0, itens_restantes=len(divisao.itens))
+    try:
+        totais = totais_service.simular_totais_divisao(
+            divisao_id,
+            taxa_servico_percentual=request.taxa_servico_percentual,
+            desconto_valor=request.desconto_valor,
+            distribuicoes=distribuicoes,
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not totais:
+        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
     
-    valor_apos_desconto = subtotal_geral_consumo - divisao.desconto_valor
-    valor_taxa_servico = valor_apos_desconto * (divisao.taxa_servico_percentual / 100)
-    total_geral_final = valor_apos_desconto + valor_taxa_servico
-    
-    for pessoa_id, calculo in calculos_pessoas.items():
-        proporcao_consumo = calculo.subtotal / subtotal_geral_consumo if subtotal_geral_consumo > 0 else 0
-        calculo.desconto = divisao.desconto_valor * proporcao_consumo
-        calculo.taxa = valor_taxa_servico * proporcao_consumo
-        calculo.total = (calculo.subtotal - calculo.desconto) + calculo.taxa
-        calculo.percentual_da_conta = (calculo.total / total_geral_final) * 100 if total_geral_final > 0 else 0
-        
-        for item_consumido in calculo.itens:
-            proporcao_item = item_consumido.valor / calculo.subtotal if calculo.subtotal > 0 else 0
-            item_consumido.desconto_aplicado = calculo.desconto * proporcao_item
-    
-    # Calcula progresso
-    quantidade_total_geral = sum(item.quantidade for item in divisao.itens)
-    quantidade_total_distribuida = sum(sum(item.atribuido_a.values()) for item in divisao.itens)
-    percentual_distribuido = (quantidade_total_distribuida / quantidade_total_geral) * 100 if quantidade_total_geral > 0 else 0
-    
-    itens_incompletos = sum(
-        1 for item in divisao.itens if item.quantidade - sum(item.atribuido_a.values()) > 1e-9
-    )
-    
-    progresso = Progresso(
-        percentual_distribuido=round(percentual_distribuido, 2),
-        itens_restantes=itens_incompletos
-    )
-    
-    return TotaisResponse(pessoas=list(calculos_pessoas.values()), progresso=progresso)
+    return resposta_json(totais)
+
+
+@app.post("/api/simular-totais", response_model=TotaisResponse)
+async def simular_totais_divisao_enviada(divisao: Divisao, current_user: dict = Depends(get_current_user)):
+    """
+    Calcula os totais de uma divisão enviada inteira no corpo da requisição,
+    sem ler nem escrever no banco (cálculo puro).
+    """
+    return resposta_json(calcular_totais(divisao.model_dump()))
 
 
 # ============================================
@@ -607,24 +1108,17 @@ class AtualizarNomeRequest(BaseModel):
 
 
 @app.put("/api/divisao/{divisao_id}/nome", response_model=Divisao)
-async def atualizar_nome_divisao(divisao_id: str, request: AtualizarNomeRequest, current_user: dict = Depends(get_current_user)):
+async def atualizar_nome_divisao(divisao_id: str, request: AtualizarNomeRequest, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
     """Atualiza o nome de uma divisão."""
     try:
         user_id = get_user_id_or_error(current_user)
         
-        # Verifica se a divisão existe e pertence ao usuário
-        divisao_db = db.get_divisao(divisao_id, user_id)
-        if not divisao_db:
-            raise HTTPException(status_code=404, detail="Divisão não encontrada")
-        
-        # Atualiza o nome
-        updated = db.update_divisao(divisao_id, {"nome": request.nome})
-        if not updated:
-            raise HTTPException(status_code=500, detail="Erro ao atualizar nome")
+        # Atualiza o nome, se a divisão existe, pertence ao usuário e está na versão esperada
+        alteracao = alterar_divisao_ou_erro(divisao_id, [{"tipo": "renomear", "nome": request.nome}], if_match, user_id)
         
         # Retorna a divisão completa atualizada
-        divisao_completa = db.get_divisao_completa(divisao_id)
-        return db_divisao_to_response(divisao_completa)
+        divisao_completa = db.get_divisao_completa(divisao_id, divisao=alteracao["divisao"])
+        return responder_divisao(divisao_completa)
         
     except HTTPException:
         raise
@@ -638,24 +1132,29 @@ async def atualizar_nome_divisao(divisao_id: str, request: AtualizarNomeRequest,
 # ============================================
 
 @app.put("/api/divisao/{divisao_id}/finalizar", response_model=Divisao)
-async def finalizar_divisao(divisao_id: str, current_user: dict = Depends(get_current_user)):
-    """Finaliza uma divisão, alterando o status para 'finalizada'."""
+async def finalizar_divisao(divisao_id: str, if_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
+    """
+    Finaliza uma divisão, alterando o status para 'finalizada'.
+    Grava junto o snapshot (divisão completa + totais): a partir daqui a
+    divisão não muda mais e é sempre lida dele.
+    """
     try:
         user_id = get_user_id_or_error(current_user)
         
-        # Verifica se a divisão existe e pertence ao usuário
-        divisao_db = db.get_divisao(divisao_id, user_id)
-        if not divisao_db:
-            raise HTTPException(status_code=404, detail="Divisão não encontrada")
+        # Grava as distribuições pendentes (entram no snapshot) e verifica se a
+        # divisão existe, pertence ao usuário e está na versão esperada
+        descarregar_pendentes(divisao_id)
+        divisao = conferir_divisao(divisao_id, if_match, user_id)
         
-        # Atualiza o status para finalizada
-        updated = db.update_divisao(divisao_id, {"status": "finalizada"})
+        # Monta o snapshot a partir dessa versão e finaliza (incrementando a
+        # versão) só se ninguém alterou a divisão depois da leitura
+        snapshot = db.montar_snapshot(db.get_divisao_completa(divisao_id, divisao=divisao))
+        updated = db.finalizar_divisao(divisao_id, snapshot, divisao["versao"])
         if not updated:
-            raise HTTPException(status_code=500, detail="Erro ao finalizar divisão")
+            recusar_alteracao(divisao_id, if_match, user_id)
         
-        # Retorna a divisão completa atualizada
-        divisao_completa = db.get_divisao_completa(divisao_id)
-        return db_divisao_to_response(divisao_completa)
+        # Retorna a divisão a partir do snapshot (sem buscar de novo)
+        return responder_divisao(db.get_divisao_completa(divisao_id, divisao=updated))
         
     except HTTPException:
         raise
@@ -664,6 +1163,89 @@ async def finalizar_divisao(divisao_id: str, current_user: dict = Depends(get_cu
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============================================
+# ESTATÍSTICAS
+# ============================================
+# Todas leem só as tabelas de resumo (database/13estatisticas.md), mantidas
+# quando as divisões são finalizadas: o custo não cresce com o histórico.
+
+@app.get("/api/estatisticas/mensal", response_model=List[EstatisticaMensal])
+async def estatisticas_mensais_endpoint(
+    meses: int = Query(12, ge=1, le=120),
+    current_user: dict = Depends(get_current_user)
+):
+    """Gasto por mês (e ticket médio) das divisões finalizadas, mais recente primeiro."""
+    user_id = get_user_id_or_error(current_user)
+    
+    return resposta_json([
+        {
+            "mes": linha["mes"],
+            "divisoes": linha["divisoes"],
+            "total_gasto": float(linha["total_gasto"]),
+            "ticket_medio": round(float(linha["total_gasto"]) / linha["divisoes"], 2) if linha["divisoes"] else 0.0,
+        }
+        for linha in db.get_estatisticas_mensais(user_id, meses)
+    ])
+
+
+@app.get("/api/estatisticas/itens", response_model=List[EstatisticaItem])
+async def estatisticas_itens_endpoint(
+    limite: int = Query(10, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """Itens mais pedidos nas divisões finalizadas."""
+    user_id = get_user_id_or_error(current_user)
+    
+    return resposta_json([
+        {**linha, "quantidade": float(linha["quantidade"]), "total_gasto": float(linha["total_gasto"])}
+        for linha in db.get_estatisticas_itens(user_id, limite)
+    ])
+
+
+@app.get("/api/estatisticas/companhias", response_model=List[EstatisticaCompanhia])
+async def estatisticas_companhias_endpoint(
+    limite: int = Query(10, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """Pessoas que mais aparecem nas divisões finalizadas (e quanto pagaram no total)."""
+    user_id = get_user_id_or_error(current_user)
+    
+    return resposta_json([
+        {**linha, "total_pago": float(linha["total_pago"])}
+        for linha in db.get_estatisticas_companhias(user_id, limite)
+    ])
+
+
+# ============================================
+# LINK PÚBLICO
+# ============================================
+
+@app.post("/api/divisao/{divisao_id}/compartilhar", response_model=CompartilhamentoResponse)
+async def compartilhar_divisao_endpoint(divisao_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Cria (ou devolve o já existente) link público de uma divisão finalizada,
+    para cada pessoa da mesa ver quanto deve sem precisar de login.
+    """
+    user_id = get_user_id_or_error(current_user)
+    
+    divisao = db.get_divisao(divisao_id, user_id)
+    if not divisao:
+        raise HTTPException(status_code=404, detail="Divisão não encontrada.")
+    if divisao.get("status") != "finalizada":
+        raise HTTPException(status_code=409, detail="Finalize a divisão antes de compartilhar.")
+    if not divisao.get("snapshot"):
+        db.get_divisao_completa(divisao_id, divisao=divisao)  # finalizada antes do snapshot: grava agora
+    
+    link = db.get_compartilhamento(divisao_id)
+    if not link:
+        link = db.create_compartilhamento(compartilhamento.novo_token(), divisao_id, user_id)
+        if not link:
+            raise HTTPException(status_code=500, detail="Erro ao criar o link.")
+        logger.info(f"Link público criado para a divisão '{divisao_id}'.")
+    
+    return {"token": link["token"], "url": f"/api/publico/{link['token']}"}
+
+
 # --- Execução do Servidor ---
 if __name__ == "__main__":
     print("🔒 Compartilha AI API - Com Supabase + JWT Auth")
@@ -6,7 +6,7 @@
 # evitando bugs e tornando a API mais segura e previsível.
 
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from typing import Annotated, List, Dict, Literal, Optional, Union
 import uuid
 
 
@@ -40,6 +40,7 @@ class Divisao(BaseModel):
     taxa_servico_percentual: float = Field(default=10.0, ge=0, le=100)
     desconto_valor: float = Field(default=0.0, ge=0)
     created_at: Optional[str] = None  # Data de criação
+    versao: Optional[int] = None  # Versão da divisão (usada como ETag)
 
 
 # --- Modelos para Requisições e Respostas da API ---
@@ -62,6 +63,35 @@ class DistribuirItemRequest(BaseModel):
     distribuicao: List[DistribuicaoItem]
 
 
+class DistribuicaoLoteRequest(BaseModel):
+    """
+    O 'formulário' para distribuir vários itens de uma vez.
+    - dividir_igualmente: divide cada item entre as pessoas (sobra pelo maior resto)
+    - atribuir_tudo: dá todos os itens para UMA pessoa (pessoa_ids com um único ID)
+    - limpar: remove todas as atribuições
+    `item_ids`/`pessoa_ids` vazios = todos os itens / todas as pessoas.
+    """
+    operacao: Literal["dividir_igualmente", "atribuir_tudo", "limpar"]
+    item_ids: Optional[List[str]] = Field(default=None, example=["item_abc123"])
+    pessoa_ids: Optional[List[str]] = Field(default=None, example=["pessoa_abc123"])
+
+
+class DistribuicaoSimulada(BaseModel):
+    """Distribuição hipotética de UM item (substitui a distribuição atual na simulação)."""
+    item_id: str
+    distribuicao: List[DistribuicaoItem]
+
+
+class SimularTotaisRequest(BaseModel):
+    """
+    O 'formulário' para simular totais SEM salvar nada (ex: enquanto o usuário
+    arrasta o slider da taxa). Campos não enviados usam o valor atual da divisão.
+    """
+    taxa_servico_percentual: Optional[float] = Field(default=None, ge=0, le=100, example=12.0)
+    desconto_valor: Optional[float] = Field(default=None, ge=0, example=15.00)
+    distribuicoes: List[DistribuicaoSimulada] = Field(default=[])
+
+
 class ItemPayload(BaseModel):
     """O 'formulário' para ADICIONAR ou EDITAR um item."""
     nome: str = Field(min_length=1, example="Couvert")
@@ -110,4 +140,161 @@ class Progresso(BaseModel):
 class TotaisResponse(BaseModel):
     """O modelo de resposta completo para o endpoint de cálculo de totais."""
     pessoas: List[PessoaTotal]
-    progresso: Progresso
\ No newline at end of file
+    progresso: Progresso
+
+
+class SincronizacaoDivisoesResponse(BaseModel):
+    """
+    Resposta do histórico incremental (GET /api/divisoes?desde=...).
+    O app junta `divisoes` na cópia local, remove as `excluidas` e guarda
+    `sincronizado_em` para a próxima vez. Com `completo`, a lista é o histórico
+    inteiro e a cópia local deve ser substituída.
+    """
+    divisoes: List[Divisao]
+    excluidas: List[str]
+    sincronizado_em: str
+    completo: bool = False
+
+
+class DivisaoResumo(BaseModel):
+    """A divisão de um resultado da busca (sem itens e pessoas)."""
+    id: str
+    nome: Optional[str] = None
+    status: str
+    created_at: Optional[str] = None
+
+
+class ItemEncontrado(BaseModel):
+    """O item de um resultado da busca."""
+    id: str
+    nome: str
+    quantidade: float
+    valor_unitario: float
+
+
+class ResultadoBusca(BaseModel):
+    """Um resultado da busca: a divisão encontrada ou um item dela."""
+    tipo: Literal["divisao", "item"]
+    divisao: DivisaoResumo
+    item: Optional[ItemEncontrado] = None
+
+
+class BuscaResponse(BaseModel):
+    """Uma página de resultados da busca no histórico."""
+    resultados: List[ResultadoBusca]
+    pagina: int
+    tamanho: int
+    tem_mais: bool
+
+
+# --- Modelos para Estatísticas (/api/estatisticas/*) ---
+
+class EstatisticaMensal(BaseModel):
+    """Gasto do usuário em um mês."""
+    mes: str = Field(example="2025-03-01")
+    divisoes: int
+    total_gasto: float
+    ticket_medio: float
+
+
+class EstatisticaItem(BaseModel):
+    """Um item que o usuário costuma pedir."""
+    nome: str
+    vezes: int
+    quantidade: float
+    total_gasto: float
+    ultima_vez: Optional[str] = None
+
+
+class EstatisticaCompanhia(BaseModel):
+    """Uma pessoa com quem o usuário costuma dividir a conta."""
+    nome: str
+    divisoes: int
+    total_pago: float
+    ultima_vez: Optional[str] = None
+
+
+class CompartilhamentoResponse(BaseModel):
+    """O link público (só leitura) de uma divisão finalizada."""
+    token: str
+    url: str = Field(example="/api/publico/3q2-7wEjQ1m8Xn0bT1Zk9A")
+
+
+class DivisaoPublicaResponse(BaseModel):
+    """O que a página pública de um link mostra: quanto cada pessoa deve."""
+    nome: Optional[str] = None
+    finalizada_at: Optional[str] = None
+    taxa_servico_percentual: float
+    desconto_valor: float
+    totais: TotaisResponse
+
+
+class TotaisLoteRequest(BaseModel):
+    """O 'formulário' para calcular os totais de várias divisões de uma vez."""
+    divisao_ids: List[str] = Field(min_length=1, max_length=500, example=["divisao_abc123"])
+
+# --- Modelos para Operações em Lote (/batch) ---
+# Cada operação tem um campo `tipo` que diz qual é. Itens e pessoas criados
+# no lote podem receber uma `ref` (ID temporário escolhido pelo app), que as
+# operações seguintes podem usar no lugar do ID definitivo.
+
+class OpRenomear(BaseModel):
+    tipo: Literal["renomear"]
+    nome: str = Field(min_length=1, example="Aniversário do João")
+
+
+class OpConfigurar(ConfigDivisao):
+    tipo: Literal["configurar"]
+
+
+class OpAdicionarItem(ItemPayload):
+    tipo: Literal["adicionar_item"]
+    ref: Optional[str] = Field(default=None, example="novo_item_1")
+
+
+class OpEditarItem(ItemPayload):
+    tipo: Literal["editar_item"]
+    item_id: str
+
+
+class OpRemoverItem(BaseModel):
+    tipo: Literal["remover_item"]
+    item_id: str
+
+
+class OpAdicionarPessoa(AddPessoaRequest):
+    tipo: Literal["adicionar_pessoa"]
+    ref: Optional[str] = Field(default=None, example="nova_pessoa_1")
+
+
+class OpRemoverPessoa(BaseModel):
+    tipo: Literal["remover_pessoa"]
+    pessoa_id: str
+
+
+class OpDistribuirItem(DistribuirItemRequest):
+    tipo: Literal["distribuir_item"]
+
+
+class OpDistribuirLote(DistribuicaoLoteRequest):
+    tipo: Literal["distribuir_lote"]
+
+
+OperacaoDivisao = Annotated[
+    Union[
+        OpRenomear, OpConfigurar, OpAdicionarItem, OpEditarItem, OpRemoverItem,
+        OpAdicionarPessoa, OpRemoverPessoa, OpDistribuirItem, OpDistribuirLote,
+    ],
+    Field(discriminator="tipo"),
+]
+
+
+class OperacoesDivisaoRequest(BaseModel):
+    """O 'formulário' com a lista ORDENADA de operações a aplicar de uma vez."""
+    operacoes: List[OperacaoDivisao] = Field(min_length=1, max_length=200)
+
+
+class OperacoesDivisaoResponse(BaseModel):
+    """A divisão após aplicar o lote e o mapa ref temporária -> ID definitivo."""
+    divisao: Divisao
+    referencias: Dict[str, str]
@@ -0,0 +1,12 @@
+# --- Anotações para Iniciantes ---
+# Carrega o backend/.env UMA vez, no primeiro import deste módulo.
+# Quem lê configurações com os.getenv no import (main.py, auth.py,
+# supabase_client.py...) importa este módulo antes: o Python só executa um
+# módulo uma vez, então o arquivo é lido uma vez só, em vez de uma por módulo.
+
+import os
+from dotenv import load_dotenv
+
+ARQUIVO_ENV = os.path.join(os.path.dirname(__file__), "..", ".env")
+
+load_dotenv(dotenv_path=ARQUIVO_ENV)
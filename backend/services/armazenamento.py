@@ -0,0 +1,81 @@
+# --- Anotações para Iniciantes ---
+# Escolhe onde os dados ficam guardados, pela variável DB_BACKEND do .env:
+#   - "supabase" (padrão): o Postgres do Supabase (precisa de internet)
+#   - "sqlite": um arquivo SQLite local (SQLITE_PATH), ou ":memory:" para
+#     um banco que some quando o servidor para (testes e benchmarks)
+# Os dois clientes têm a mesma interface (table/rpc/execute), então o
+# db_service funciona igual com qualquer um deles.
+#
+# No modo sqlite não existe o Supabase Auth: as requisições sem token JWT
+# usam um usuário local fixo (USUARIO_LOCAL_ID), criado junto com o banco.
+#
+# O db_service não cria o cliente no import: guarda um ClientePreguicoso,
+# que só cria o cliente de verdade no primeiro uso (ou no /api/ready).
+
+import os
+import threading
+import logging
+from typing import Optional
+
+from . import supabase_client  # também carrega o .env
+
+logger = logging.getLogger(__name__)
+
+DB_BACKEND = os.getenv("DB_BACKEND", "supabase").strip().lower()
+SQLITE_PATH = os.getenv(
+    "SQLITE_PATH", os.path.join(os.path.dirname(__file__), "..", "compartilha_ai.db")
+)
+USUARIO_LOCAL_ID = os.getenv("USUARIO_LOCAL_ID", "00000000-0000-0000-0000-000000000001")
+
+BACKENDS = ("supabase", "sqlite")
+
+
+def get_cliente_banco():
+    """Cria o cliente do banco escolhido em DB_BACKEND (None se não configurado)."""
+    if DB_BACKEND == "sqlite":
+        from .sqlite_backend import ClienteSQLite
+        logger.info(f"✅ Banco local SQLite: {SQLITE_PATH}")
+        return ClienteSQLite(SQLITE_PATH, usuario_local=USUARIO_LOCAL_ID)
+
+    if DB_BACKEND not in BACKENDS:
+        logger.warning(f"⚠️ DB_BACKEND desconhecido ({DB_BACKEND}), usando o Supabase.")
+    return supabase_client.get_supabase_admin()
+
+
+class ClientePreguicoso:
+    """Faz o papel do cliente do banco, criando o cliente de verdade no primeiro uso."""
+
+    def __init__(self, fabrica=None):
+        self._fabrica = fabrica or get_cliente_banco
+        self._cliente = None
+        self._criado = False
+        self._lock = threading.Lock()
+
+    def obter(self):
+        """O cliente de verdade (criado agora, se ainda não foi)."""
+        if not self._criado:
+            with self._lock:
+                if not self._criado:
+                    self._cliente = self._fabrica()
+                    self._criado = True
+        return self._cliente
+
+    def __getattr__(self, nome):
+        cliente = self.obter()
+        if cliente is None:
+            raise RuntimeError("Banco não configurado (veja DB_BACKEND e as credenciais no backend/.env).")
+        return getattr(cliente, nome)
+
+    def __bool__(self):
+        # `if db.db:` pergunta se há banco configurado, sem precisar criar o cliente
+        return self._cliente is not None if self._criado else configurado()
+
+
+def configurado() -> bool:
+    """Se há um banco para usar (o SQLite sempre; o Supabase se há credenciais)."""
+    return DB_BACKEND == "sqlite" or bool(supabase_client.configurado() and supabase_client.SUPABASE_SERVICE_KEY)
+
+
+def usuario_local() -> Optional[str]:
+    """ID do usuário local no modo sqlite (None com o Supabase)."""
+    return USUARIO_LOCAL_ID if DB_BACKEND == "sqlite" else None
@@ -2,15 +2,14 @@
 # Autenticação usando Supabase para validar tokens JWT
 
 import os
-from fastapi import HTTPException, Depends
+from typing import Optional
+from fastapi import HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, APIKeyHeader
-from dotenv import load_dotenv
 import logging
 
-logger = logging.getLogger(__name__)
+from . import ambiente  # noqa: F401 (carrega o .env)
 
-# Carrega variáveis de ambiente
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+logger = logging.getLogger(__name__)
 
 # Token de API legado (para desenvolvimento/compatibilidade)
 API_SECRET_TOKEN = os.getenv("API_SECRET_TOKEN")
@@ -19,27 +18,31 @@ API_SECRET_TOKEN = os.getenv("API_SECRET_TOKEN")
 bearer_scheme = HTTPBearer(auto_error=False)
 api_key_scheme = APIKeyHeader(name="x-api-key", auto_error=False)
 
-# Cliente Supabase para validar tokens
-from .supabase_client import supabase_admin
+# Cliente Supabase para validar tokens (criado no primeiro token JWT)
+from .supabase_client import get_supabase_admin
+# No banco local (DB_BACKEND=sqlite) não há Supabase Auth: usamos o usuário local
+from .armazenamento import usuario_local
+from .metricas import cronometrado
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    api_key: str = Depends(api_key_scheme),
-) -> dict:
+def token_bearer(authorization: Optional[str]) -> Optional[str]:
+    """Token do header "Authorization: Bearer <token>" (None se o header não for desse tipo)."""
+    esquema, _, token = (authorization or "").partition(" ")
+    return (token.strip() or None) if esquema.lower() == "bearer" else None
+
+
+@cronometrado("auth")
+async def identificar(token: Optional[str], api_key: Optional[str]) -> Optional[dict]:
     """
-    Verifica a autenticação e retorna os dados do usuário.
-    
-    Usa o Supabase para validar o token JWT.
+    Identifica o usuário pelo token JWT (validado no Supabase) ou pela API Key.
+    Mesmas regras do get_current_user, mas devolve None em vez de lançar 401.
     """
     
     # Tenta autenticação por Bearer token (Supabase JWT)
-    if credentials and credentials.credentials:
-        token = credentials.credentials
-        
+    if token:
         try:
             # Usa o Supabase Admin para validar o token e pegar o usuário
-            user_response = supabase_admin.auth.get_user(token)
+            user_response = get_supabase_admin().auth.get_user(token)
             
             if user_response and user_response.user:
                 user = user_response.user
@@ -56,9 +59,9 @@ async def get_current_user(
     if api_key:
         if API_SECRET_TOKEN and api_key == API_SECRET_TOKEN:
             logger.info("Autenticado via API Key (modo desenvolvimento)")
-            # Em modo API Key, não temos user_id
+            # Em modo API Key, não temos user_id (exceto no banco local)
             return {
-                "user_id": None,
+                "user_id": usuario_local(),
                 "email": None,
                 "method": "api_key",
             }
@@ -67,14 +70,35 @@ async def get_current_user(
     if not API_SECRET_TOKEN:
         logger.warning("⚠️ Rodando SEM autenticação (modo desenvolvimento)")
         return {
-            "user_id": None,
+            "user_id": usuario_local(),
             "email": None,
             "method": "none",
         }
     
+    return None
+
+
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    api_key: str = Depends(api_key_scheme),
+) -> dict:
+    """
+    Verifica a autenticação e retorna os dados do usuário.
+    
+    Usa o Supabase para validar o token JWT. Se o MiddlewareIdempotencia já
+    identificou o usuário nesta requisição, reaproveita (o token não é
+    validado duas vezes).
+    """
+    usuario = getattr(request.state, "usuario", None)
+    if usuario is None:
+        usuario = await identificar(credentials.credentials if credentials else None, api_key)
+    if usuario is not None:
+        return usuario
+    
     # Se chegou aqui, a autenticação falhou
     raise HTTPException(
         status_code=401,
         detail="Token de autenticação inválido ou ausente",
         headers={"WWW-Authenticate": "Bearer"},
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,68 @@
+# --- Anotações para Iniciantes ---
+# Cache em memória das divisões completas (divisão + itens + pessoas + atribuições).
+# Montar uma divisão completa custa 4 queries; com o cache, leituras repetidas
+# (ex: GET da divisão, cálculo de totais) podem reaproveitar o último resultado.
+#
+# Regras para o cache nunca devolver dados errados:
+#   - Toda alteração passa por db_service.alterar_divisao, que invalida a entrada.
+#   - Quando sabemos a versão atual da divisão (coluna `versao`), só usamos a
+#     entrada se a versão bater.
+#   - Toda entrada vale por poucos segundos (TTL), o que limita o tempo de vida
+#     de qualquer dado antigo vindo de alterações feitas por outros workers.
+#
+# IMPORTANTE: os dicionários devolvidos são compartilhados. Não altere!
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+TTL_SEGUNDOS = float(os.getenv("CACHE_DIVISOES_TTL", "30"))
+MAX_DIVISOES = int(os.getenv("CACHE_DIVISOES_MAX", "512"))
+
+_cache: "OrderedDict[str, tuple]" = OrderedDict()  # divisao_id -> (guardado_em, divisao)
+_lock = threading.Lock()
+
+
+def obter(divisao_id: str, versao: Optional[int] = None) -> Optional[dict]:
+    """
+    Devolve a divisão completa em cache, ou None.
+    Com `versao`, só devolve se a versão em cache for a mesma.
+    """
+    with _lock:
+        entrada = _cache.get(divisao_id)
+        if not entrada:
+            return None
+        guardado_em, divisao = entrada
+        if time.monotonic() - guardado_em > TTL_SEGUNDOS:
+            del _cache[divisao_id]
+            return None
+        if versao is not None and divisao.get("versao") != versao:
+            return None
+        _cache.move_to_end(divisao_id)
+        return divisao
+
+
+def guardar(divisao: dict) -> None:
+    """Guarda uma divisão completa no cache (descarta a menos usada se estiver cheio)."""
+    if MAX_DIVISOES <= 0:
+        return
+    divisao_id = str(divisao["id"])
+    with _lock:
+        _cache[divisao_id] = (time.monotonic(), divisao)
+        _cache.move_to_end(divisao_id)
+        while len(_cache) > MAX_DIVISOES:
+            _cache.popitem(last=False)
+
+
+def invalidar(divisao_id: str) -> None:
+    """Remove uma divisão do cache (chamado antes de qualquer alteração)."""
+    with _lock:
+        _cache.pop(str(divisao_id), None)
+
+
+def limpar() -> None:
+    """Esvazia o cache."""
+    with _lock:
+        _cache.clear()
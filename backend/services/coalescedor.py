@@ -0,0 +1,208 @@
+# --- Anotações para Iniciantes ---
+# "Juntador" de escritas da distribuição de itens.
+# Quando o usuário toca rápido no +/- da quantidade, cada toque vira uma
+# chamada a /api/distribuir-item. Em vez de gravar cada estado intermediário,
+# guardamos só o ÚLTIMO estado de cada (divisão, item) por uma janela curta
+# e gravamos tudo de uma vez quando a janela termina.
+#
+# Desligado por padrão: ligue com COALESCER_JANELA_MS (ex: 300).
+#
+# Versões:
+#   - Cada toque reserva uma versão nova (db.reservar_versao, com a mesma
+#     checagem do If-Match) e a resposta leva o ETag dela: dois dispositivos
+#     na mesma versão não conseguem os dois "ganhar" (o segundo leva 412).
+#   - A gravação juntada confere que a divisão ainda está na versão do último
+#     toque e gera mais uma. `versao_equivalente` traduz a versão do último
+#     toque para essa, para o próprio cliente não levar 412 da gravação dele.
+#
+# Garantias:
+#   - Quem lê a divisão NESTE processo já vê as alterações pendentes:
+#     `sobrepor` aplica o estado pendente por cima do que veio do banco.
+#     Em outro processo (outro worker), só depois da gravação, que muda a
+#     versão e invalida o que foi lido antes.
+#   - Qualquer outra alteração da divisão (incluindo finalizar e excluir)
+#     chama `descarregar` antes, então a ordem das escritas é preservada.
+#   - A janela é reiniciada a cada toque, mas nunca passa de JANELA_MAXIMA,
+#     para que um usuário que não para de tocar não adie a gravação para sempre.
+#   - Se a gravação falha (erro no banco), o estado pendente fica guardado e é
+#     gravado de novo depois, até MAX_TENTATIVAS. Se a divisão mudou por fora
+#     (excluída, finalizada ou alterada em outro processo) ou as tentativas
+#     acabam, as distribuições pendentes são descartadas e quem acompanha a
+#     divisão recebe um "ressincronizar" (busca a divisão de novo).
+#
+# Tudo roda no event loop do servidor (uma thread), então não há locks.
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from . import db_service as db
+from . import eventos
+
+logger = logging.getLogger(__name__)
+
+JANELA_SEGUNDOS = float(os.getenv("COALESCER_JANELA_MS", "0")) / 1000
+JANELA_MAXIMA = 4 * JANELA_SEGUNDOS
+MAX_TENTATIVAS = 3
+MAX_VERSOES_GRAVADAS = 4096  # divisões com a tradução da última gravação lembrada
+
+# divisao_id -> {item_id: {pessoa_id: quantidade}} (último estado de cada item)
+_pendentes: Dict[str, Dict[str, Dict[str, float]]] = {}
+# divisao_id -> versão reservada pelo último toque
+_versoes_reservadas: Dict[str, int] = {}
+# divisao_id -> (instante da primeira escrita pendente, timer da gravação)
+_timers: Dict[str, tuple] = {}
+# divisao_id -> gravações que falharam seguidas
+_tentativas: Dict[str, int] = {}
+# divisao_id -> (versão do último toque, versão criada pela gravação juntada)
+_versoes_gravadas: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+
+
+def ativo() -> bool:
+    """Indica se as escritas de distribuição estão sendo juntadas."""
+    return JANELA_SEGUNDOS > 0
+
+
+def tem_pendentes(divisao_id: str) -> bool:
+    """Indica se a divisão tem distribuições ainda não gravadas."""
+    return divisao_id in _pendentes
+
+
+def versao_equivalente(divisao_id: str, versao: Optional[int]) -> Optional[int]:
+    """
+    Versão do If-Match já considerando a gravação juntada: quem tem a versão
+    do último toque tem o mesmo conteúdo da versão que a gravação criou.
+    """
+    reservada, gravada = _versoes_gravadas.get(divisao_id, (None, None))
+    return gravada if versao is not None and versao == reservada else versao
+
+
+def registrar(divisao_id: str, item_id: str, distribuicao: Dict[str, float], versao: int) -> None:
+    """
+    Guarda o novo estado de um item, com a versão já reservada para ele, e
+    (re)agenda a gravação da divisão.
+    """
+    _pendentes.setdefault(divisao_id, {})[item_id] = {
+        pessoa_id: quantidade for pessoa_id, quantidade in distribuicao.items() if quantidade > 0
+    }
+    _versoes_reservadas[divisao_id] = versao
+
+    agora = time.monotonic()
+    primeira_escrita, _ = _timers.get(divisao_id, (agora, None))
+    _agendar(divisao_id, max(min(JANELA_SEGUNDOS, primeira_escrita + JANELA_MAXIMA - agora), 0), primeira_escrita)
+
+
+def _agendar(divisao_id: str, espera: float, primeira_escrita: float) -> None:
+    """
+    Troca o timer da gravação da divisão por um novo. O timer roda num
+    contexto vazio, e não numa cópia do da requisição que o agendou: a
+    gravação não entra nas métricas de uma requisição que já terminou.
+    """
+    _, timer = _timers.get(divisao_id, (None, None))
+    if timer:
+        timer.cancel()
+    timer = asyncio.get_running_loop().call_later(espera, descarregar, divisao_id, context=contextvars.Context())
+    _timers[divisao_id] = (primeira_escrita, timer)
+
+
+def descarregar(divisao_id: str, tentar_de_novo: bool = True) -> bool:
+    """
+    Grava agora as distribuições pendentes da divisão (uma chamada RPC, na
+    mesma transação da versão, para todos os itens).
+    Retorna False se a gravação falhou e as distribuições continuam pendentes
+    (serão gravadas de novo ao fim de outra janela); True nos demais casos.
+    """
+    _, timer = _timers.pop(divisao_id, (None, None))
+    if timer:
+        timer.cancel()
+    itens = _pendentes.get(divisao_id)
+    if not itens:
+        return True
+    versao = _versoes_reservadas[divisao_id]
+
+    operacoes = [
+        {"tipo": "distribuir_item", "item_id": item_id, "distribuicao": [
+            {"pessoa_id": pessoa_id, "quantidade": quantidade} for pessoa_id, quantidade in distribuicao.items()
+        ]}
+        for item_id, distribuicao in itens.items()
+    ]
+    try:
+        alteracao = db.alterar_divisao(divisao_id, operacoes, versao)
+    except Exception as e:
+        tentativas = _tentativas.get(divisao_id, 0) + 1
+        if tentar_de_novo and tentativas < MAX_TENTATIVAS:
+            _tentativas[divisao_id] = tentativas
+            logger.warning(f"Erro ao gravar distribuições pendentes da divisão '{divisao_id}' "
+                           f"(tentativa {tentativas} de {MAX_TENTATIVAS}): {e}")
+            _agendar(divisao_id, JANELA_SEGUNDOS, time.monotonic())
+            return False
+        logger.error(f"Distribuições pendentes da divisão '{divisao_id}' descartadas após {tentativas} tentativas: {e}")
+        _descartar(divisao_id)
+        return True
+
+    _esquecer(divisao_id)
+    if not alteracao:
+        # A divisão foi excluída, finalizada ou alterada em outro processo
+        # depois do último toque: o estado pendente não vale mais
+        logger.warning(f"Distribuições pendentes da divisão '{divisao_id}' descartadas: "
+                       f"a divisão não está mais na versão {versao}.")
+        eventos.publicar(divisao_id, "ressincronizar")
+        return True
+
+    _versoes_gravadas[divisao_id] = (versao, alteracao["divisao"]["versao"])
+    _versoes_gravadas.move_to_end(divisao_id)
+    while len(_versoes_gravadas) > MAX_VERSOES_GRAVADAS:
+        _versoes_gravadas.popitem(last=False)
+    logger.info(f"{len(itens)} distribuições juntadas gravadas na divisão '{divisao_id}'.")
+    return True
+
+
+def _esquecer(divisao_id: str) -> None:
+    """Remove o estado pendente da divisão (gravado ou descartado)."""
+    _pendentes.pop(divisao_id, None)
+    _versoes_reservadas.pop(divisao_id, None)
+    _tentativas.pop(divisao_id, None)
+
+
+def _descartar(divisao_id: str) -> None:
+    """
+    Desiste das distribuições pendentes. Os clientes viram o estado pendente
+    na versão reservada, então ela é trocada por outra (se o banco deixar)
+    para ninguém ficar com esse conteúdo num 304, e todos ressincronizam.
+    """
+    versao = _versoes_reservadas.get(divisao_id)
+    _esquecer(divisao_id)
+    try:
+        db.reservar_versao(divisao_id, versao)
+    except Exception as e:
+        logger.error(f"Erro ao trocar a versão da divisão '{divisao_id}': {e}")
+    eventos.publicar(divisao_id, "ressincronizar")
+
+
+def descarregar_tudo() -> None:
+    """Grava as pendências de todas as divisões (ex: ao desligar o servidor)."""
+    for divisao_id in list(_pendentes):
+        descarregar(divisao_id, tentar_de_novo=False)
+
+
+def sobrepor(divisao: Optional[dict]) -> Optional[dict]:
+    """
+    Devolve a divisão completa com as distribuições pendentes aplicadas.
+    Sem pendências, devolve o próprio dicionário (que pode estar em cache: não altere).
+    """
+    if not divisao:
+        return divisao
+    itens_pendentes = _pendentes.get(str(divisao["id"]))
+    if not itens_pendentes:
+        return divisao
+
+    itens = [
+        {**item, "atribuido_a": dict(itens_pendentes[str(item["id"])])}
+        if str(item["id"]) in itens_pendentes else item
+        for item in divisao.get("itens", [])
+    ]
+    return {**divisao, "itens": itens}
@@ -0,0 +1,109 @@
+# --- Anotações para Iniciantes ---
+# Cache das páginas públicas de divisões finalizadas (GET /api/publico/{token}).
+# Um link compartilhado costuma ser aberto pela mesa inteira em poucos minutos,
+# e o conteúdo nunca muda (só existe link para divisão finalizada). Então a
+# resposta é montada uma vez e guardada JÁ SERIALIZADA:
+#   1. em memória (LRU com até MAX_MEMORIA links), e
+#   2. em disco (CACHE_DIR), para sobreviver a reinícios do servidor.
+# Com o cache quente, abrir o link não toca no banco nem valida login.
+#
+# O ETag é o sha256 do corpo (ETag "forte": bytes idênticos, mesmo ETag).
+# Quando a divisão é excluída, `esquecer` apaga os links dela dos dois caches.
+
+import hashlib
+import os
+import re
+import secrets
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+import orjson
+
+CACHE_DIR = os.getenv(
+    "COMPARTILHAMENTO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "compartilha-ai-publico")
+)
+MAX_MEMORIA = int(os.getenv("COMPARTILHAMENTO_CACHE_MAX", "1024"))
+
+# O token também vira nome de arquivo: só aceitamos o alfabeto do token_urlsafe
+_FORMATO_TOKEN = re.compile(r"[A-Za-z0-9_-]{16,64}")
+
+_memoria: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()  # token -> (corpo, etag)
+_lock = threading.Lock()
+
+
+def novo_token() -> str:
+    """Gera um token aleatório para um link novo (22 caracteres, 128 bits)."""
+    return secrets.token_urlsafe(16)
+
+
+def token_valido(token: str) -> bool:
+    """Confere o formato do token (antes de usá-lo no banco ou no disco)."""
+    return bool(_FORMATO_TOKEN.fullmatch(token))
+
+
+def gerar_etag(corpo: bytes) -> str:
+    """ETag forte a partir do conteúdo."""
+    return f'"{hashlib.sha256(corpo).hexdigest()}"'
+
+
+def _caminho(token: str) -> str:
+    return os.path.join(CACHE_DIR, f"{token}.json")
+
+
+def _guardar_em_memoria(token: str, entrada: Tuple[bytes, str]) -> None:
+    if MAX_MEMORIA <= 0:
+        return
+    with _lock:
+        _memoria[token] = entrada
+        _memoria.move_to_end(token)
+        while len(_memoria) > MAX_MEMORIA:
+            _memoria.popitem(last=False)
+
+
+def obter(token: str) -> Optional[Tuple[bytes, str]]:
+    """Devolve (corpo, etag) do link em cache (memória, depois disco) ou None."""
+    with _lock:
+        entrada = _memoria.get(token)
+        if entrada:
+            _memoria.move_to_end(token)
+            return entrada
+
+    try:
+        with open(_caminho(token), "rb") as arquivo:
+            corpo = arquivo.read()
+    except OSError:
+        return None
+    entrada = (corpo, gerar_etag(corpo))
+    _guardar_em_memoria(token, entrada)
+    return entrada
+
+
+def guardar(token: str, conteudo: dict) -> Tuple[bytes, str]:
+    """Serializa o conteúdo do link, guarda nos dois caches e devolve (corpo, etag)."""
+    corpo = orjson.dumps(conteudo)
+    entrada = (corpo, gerar_etag(corpo))
+    _guardar_em_memoria(token, entrada)
+
+    # Escreve num arquivo temporário e renomeia: quem lê nunca vê um arquivo pela metade
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temporario = f"{_caminho(token)}.{os.getpid()}.tmp"
+        with open(temporario, "wb") as arquivo:
+            arquivo.write(corpo)
+        os.replace(temporario, _caminho(token))
+    except OSError:
+        pass  # sem disco, o cache em memória continua valendo
+    return entrada
+
+
+def esquecer(tokens: Iterable[str]) -> None:
+    """Remove links dos caches (ex: a divisão foi excluída)."""
+    for token in tokens:
+        with _lock:
+            _memoria.pop(token, None)
+        try:
+            os.remove(_caminho(token))
+        except OSError:
+            pass
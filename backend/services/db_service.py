@@ -1,18 +1,63 @@
 # --- Anotações para Iniciantes ---
 # Este arquivo contém todas as operações de banco de dados.
-# Ele abstrai o Supabase, facilitando manutenção e testes.
+# Ele abstrai o banco (Supabase ou SQLite local, ver armazenamento.py),
+# facilitando manutenção e testes.
 # Cada função faz uma operação específica (criar, ler, atualizar, deletar).
+# As funções de alteração também publicam um evento (services/eventos.py)
+# para quem está acompanhando a divisão em tempo real.
 # OTIMIZADO: Reduzido N+1 queries usando batch e JOINs
 
+from datetime import datetime, timezone
 from typing import Optional
-from .supabase_client import get_supabase_admin
+from . import armazenamento
+from .serializacao import divisao_para_dict
+from .totais import calcular_totais
+from . import cache_divisoes
+from . import eventos
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Usamos o cliente admin para operações do backend
+# Usamos o cliente admin para operações do backend (ou o SQLite local)
 # O RLS será aplicado via user_id nas queries
-db = get_supabase_admin()
+# O cliente é criado no primeiro uso (ver armazenamento.ClientePreguicoso)
+db = armazenamento.ClientePreguicoso()
+
+
+class RegraDivisaoViolada(ValueError):
+    """O banco recusou a alteração (ex: quantidade distribuída acima da disponível)."""
+
+
+class RegistroNaoEncontrado(LookupError):
+    """Item ou pessoa informado não pertence à divisão."""
+
+
+def verificar_conexao() -> bool:
+    """Consulta mínima: cria o cliente e abre a conexão com o banco. False se não configurado."""
+    if not db:
+        return False
+    db.table("profiles").select("id").limit(1).execute()
+    return True
+
+
+def _rpc_com_regras(nome: str, params: dict):
+    """
+    Chama uma função SQL e traduz os erros de regra de negócio
+    (ver database/07atribuicoes_em_lote.md e 08operacoes_em_lote.md)
+    em exceções do Python.
+    """
+    try:
+        return db.rpc(nome, params).execute()
+    except Exception as e:
+        # Importado só aqui: o postgrest (e o httpx) pesam ~200 ms no import do backend.main
+        from postgrest.exceptions import APIError
+        if not isinstance(e, APIError):
+            raise
+        if e.code == "P0002":
+            raise RegistroNaoEncontrado(e.message) from e
+        if e.code in ("22023", "23514"):
+            raise RegraDivisaoViolada(e.message) from e
+        raise
 
 
 # ============================================
@@ -79,15 +124,170 @@ def update_divisao(divisao_id: str, data: dict) -> Optional[dict]:
     if not db:
         return None
     result = db.table("divisoes").update(data).eq("id", divisao_id).execute()
+    if result.data:
+        eventos.publicar(divisao_id, "divisao_atualizada", dados=data)
     return result.data[0] if result.data else None
 
 
-def delete_divisao(divisao_id: str) -> bool:
-    """Deleta uma divisão."""
+def reservar_versao(divisao_id: str, versao_esperada: Optional[int] = None,
+                    user_id: str = None, permitir_finalizada: bool = False) -> Optional[dict]:
+    """
+    Incrementa a versão da divisão antes de uma alteração (uma única query).
+    Se `versao_esperada` for informada, só incrementa quando a versão atual bate
+    (controle de concorrência otimista). Divisões finalizadas são recusadas,
+    exceto com `permitir_finalizada` (exclusão). Retorna a divisão atualizada ou None.
+    """
+    if not db:
+        return None
+    cache_divisoes.invalidar(divisao_id)
+    params = {
+        "p_divisao_id": divisao_id,
+        "p_versao_esperada": versao_esperada,
+        "p_user_id": user_id,
+        "p_permitir_finalizada": permitir_finalizada
+    }
+    result = db.rpc("reservar_versao_divisao", params).execute()
+    if not result.data:
+        return None
+    eventos.abrir_versao(divisao_id, result.data[0].get("versao"))
+    return result.data[0]
+
+
+def alterar_divisao(divisao_id: str, operacoes: list, versao_esperada: Optional[int] = None,
+                    user_id: str = None) -> Optional[dict]:
+    """
+    Incrementa a versão e aplica as operações (formato dos schemas Op*) em UMA
+    chamada e uma transação (database/15alteracoes_atomicas.md): se uma
+    operação falha, a versão também não muda. Mesmas checagens do
+    reservar_versao (If-Match, dono, finalizada): se não passarem, retorna None.
+    Retorna {"divisao": linha já alterada, "referencias": ref -> ID}.
+    """
+    if not db:
+        return None
+    result = _rpc_com_regras("alterar_divisao", {
+        "p_divisao_id": divisao_id,
+        "p_operacoes": operacoes,
+        "p_versao_esperada": versao_esperada,
+        "p_user_id": user_id,
+    })
+    if not result.data:
+        return None
+    # Só agora (gravado) a versão nova existe para os outros: o cache sai aqui
+    cache_divisoes.invalidar(divisao_id)
+    eventos.abrir_versao(divisao_id, result.data["divisao"].get("versao"))
+    referencias = result.data.get("referencias") or {}
+    for tipo, dados in _eventos_das_operacoes(operacoes, referencias):
+        eventos.publicar(divisao_id, tipo, **dados)
+    return {"divisao": result.data["divisao"], "referencias": referencias}
+
+
+def _eventos_das_operacoes(operacoes: list, referencias: dict) -> list:
+    """
+    Eventos (tipo, dados) equivalentes às operações aplicadas. Se alguma não
+    tem evento próprio (ex: distribuir_lote, calculada no banco), vira um
+    "ressincronizar" só: os clientes buscam a divisão de novo.
+    """
+    def resolver(referencia) -> str:
+        return str(referencias.get(referencia, referencia))
+
+    lista = []
+    for op in operacoes:
+        tipo = op.get("tipo")
+        if tipo == "renomear":
+            lista.append(("divisao_atualizada", {"dados": {"nome": op["nome"]}}))
+        elif tipo == "configurar":
+            lista.append(("divisao_atualizada", {"dados": {
+                "taxa_servico_percentual": op["taxa_servico_percentual"], "desconto_valor": op["desconto_valor"],
+            }}))
+        elif tipo == "adicionar_item" and op.get("ref") in referencias:
+            item = {**op, "id": resolver(op["ref"])}
+            lista.append(("item_adicionado", {"item": eventos.item_para_evento(item)}))
+        elif tipo == "editar_item":
+            item = {**op, "id": resolver(op["item_id"])}
+            lista.append(("item_atualizado", {"item": eventos.item_para_evento(item)}))
+        elif tipo == "remover_item":
+            lista.append(("item_removido", {"item_id": resolver(op["item_id"])}))
+        elif tipo == "adicionar_pessoa" and op.get("ref") in referencias:
+            lista.append(("pessoa_adicionada", {"pessoa": {"id": resolver(op["ref"]), "nome": op["nome"]}}))
+        elif tipo == "remover_pessoa":
+            lista.append(("pessoa_removida", {"pessoa_id": resolver(op["pessoa_id"])}))
+        elif tipo == "distribuir_item":
+            distribuicao = {}
+            for parte in op.get("distribuicao") or []:
+                if parte["quantidade"] > 0:
+                    pessoa_id = resolver(parte["pessoa_id"])
+                    distribuicao[pessoa_id] = distribuicao.get(pessoa_id, 0) + float(parte["quantidade"])
+            lista.append(("atribuicoes_substituidas", {"atribuicoes": {resolver(op["item_id"]): distribuicao}}))
+        else:
+            return [("ressincronizar", {})]
+    return lista
+
+
+def montar_snapshot(divisao_completa: dict) -> dict:
+    """
+    Monta o snapshot de uma divisão finalizada: a divisão no formato da API
+    e os totais já calculados (ver database/10snapshots.md).
+    """
+    divisao = divisao_para_dict(divisao_completa)
+    divisao["status"] = "finalizada"
+    return {"divisao": divisao, "totais": calcular_totais(divisao_completa)}
+
+
+def finalizar_divisao(divisao_id: str, snapshot: dict, versao: int) -> Optional[dict]:
+    """
+    Marca a divisão como finalizada, grava o snapshot (divisão + totais) e
+    incrementa a versão, num único UPDATE. Só vale se a divisão ainda está na
+    `versao` de onde o snapshot saiu (e em andamento); senão retorna None.
+    """
+    if not db:
+        return None
+    data = {
+        "status": "finalizada",
+        "finalizada_at": datetime.now(timezone.utc).isoformat(),
+        "snapshot": snapshot,
+        "versao": versao + 1
+    }
+    result = (
+        db.table("divisoes").update(data)
+        .eq("id", divisao_id).eq("versao", versao).neq("status", "finalizada")
+        .execute()
+    )
+    if not result.data:
+        return None
+    cache_divisoes.invalidar(divisao_id)
+    eventos.abrir_versao(divisao_id, versao + 1)
+    # O evento leva só o status: o snapshot é a própria divisão, que o cliente já tem
+    eventos.publicar(divisao_id, "divisao_atualizada",
+                     dados={"status": "finalizada", "finalizada_at": data["finalizada_at"]})
+    return result.data[0]
+
+
+def _divisao_do_snapshot(divisao: dict) -> dict:
+    """
+    Divisão completa de uma divisão finalizada, montada a partir do snapshot
+    (sem buscar itens, pessoas e atribuições). Os totais congelados vão em "totais".
+    """
+    snapshot = divisao["snapshot"]
+    congelada = {chave: valor for chave, valor in divisao.items() if chave != "snapshot"}
+    congelada["itens"] = snapshot["divisao"]["itens"]
+    congelada["pessoas"] = snapshot["divisao"]["pessoas"]
+    congelada["totais"] = snapshot["totais"]
+    return congelada
+
+
+def delete_divisao(divisao_id: str, versao: Optional[int] = None) -> bool:
+    """Deleta uma divisão. Com `versao`, só se ela ainda estiver nessa versão."""
     if not db:
         return False
-    result = db.table("divisoes").delete().eq("id", divisao_id).execute()
-    return len(result.data) > 0 if result.data else False
+    query = db.table("divisoes").delete().eq("id", divisao_id)
+    if versao is not None:
+        query = query.eq("versao", versao)
+    result = query.execute()
+    if not result.data:
+        return False
+    cache_divisoes.invalidar(divisao_id)
+    eventos.publicar(divisao_id, "divisao_excluida")
+    return True
 
 
 # ============================================
@@ -105,6 +305,8 @@ def create_item(divisao_id: str, nome: str, quantidade: float, valor_unitario: f
         "valor_unitario": valor_unitario
     }
     result = db.table("itens").insert(data).execute()
+    if result.data:
+        eventos.publicar(divisao_id, "item_adicionado", item=eventos.item_para_evento(result.data[0]))
     return result.data[0] if result.data else None
 
 
@@ -120,7 +322,8 @@ def get_itens_by_divisao(divisao_id: str) -> list:
     """Lista todos os itens de uma divisão."""
     if not db:
         return []
-    result = db.table("itens").select("*").eq("divisao_id", divisao_id).order("ordem").execute()
+    result = (db.table("itens").select("*").eq("divisao_id", divisao_id)
+              .order("ordem").order("created_at").order("id").execute())
     return result.data if result.data else []
 
 
@@ -137,6 +340,9 @@ def update_item(item_id: str, data: dict) -> Optional[dict]:
     if not db:
         return None
     result = db.table("itens").update(data).eq("id", item_id).execute()
+    if result.data:
+        item = result.data[0]
+        eventos.publicar(item["divisao_id"], "item_atualizado", item=eventos.item_para_evento(item))
     return result.data[0] if result.data else None
 
 
@@ -145,6 +351,8 @@ def delete_item(item_id: str) -> bool:
     if not db:
         return False
     result = db.table("itens").delete().eq("id", item_id).execute()
+    if result.data:
+        eventos.publicar(result.data[0]["divisao_id"], "item_removido", item_id=str(item_id))
     return len(result.data) > 0 if result.data else False
 
 
@@ -161,6 +369,9 @@ def create_pessoa(divisao_id: str, nome: str) -> Optional[dict]:
         "nome": nome
     }
     result = db.table("pessoas").insert(data).execute()
+    if result.data:
+        pessoa = result.data[0]
+        eventos.publicar(divisao_id, "pessoa_adicionada", pessoa={"id": str(pessoa["id"]), "nome": pessoa["nome"]})
     return result.data[0] if result.data else None
 
 
@@ -176,7 +387,8 @@ def get_pessoas_by_divisao(divisao_id: str) -> list:
     """Lista todas as pessoas de uma divisão."""
     if not db:
         return []
-    result = db.table("pessoas").select("*").eq("divisao_id", divisao_id).execute()
+    result = (db.table("pessoas").select("*").eq("divisao_id", divisao_id)
+              .order("created_at").order("id").execute())
     return result.data if result.data else []
 
 
@@ -193,6 +405,9 @@ def update_pessoa(pessoa_id: str, data: dict) -> Optional[dict]:
     if not db:
         return None
     result = db.table("pessoas").update(data).eq("id", pessoa_id).execute()
+    if result.data:
+        pessoa = result.data[0]
+        eventos.publicar(pessoa["divisao_id"], "pessoa_atualizada", pessoa={"id": str(pessoa["id"]), "nome": pessoa["nome"]})
     return result.data[0] if result.data else None
 
 
@@ -201,6 +416,8 @@ def delete_pessoa(pessoa_id: str) -> bool:
     if not db:
         return False
     result = db.table("pessoas").delete().eq("id", pessoa_id).execute()
+    if result.data:
+        eventos.publicar(result.data[0]["divisao_id"], "pessoa_removida", pessoa_id=str(pessoa_id))
     return len(result.data) > 0 if result.data else False
 
 
@@ -221,6 +438,14 @@ def create_atribuicao(item_id: str, pessoa_id: str, quantidade: float) -> Option
     return result.data[0] if result.data else None
 
 
+def create_atribuicoes_bulk(atribuicoes: list) -> list:
+    """Cria várias atribuições de uma vez."""
+    if not db or not atribuicoes:
+        return []
+    result = db.table("atribuicoes").insert(atribuicoes).execute()
+    return result.data if result.data else []
+
+
 def upsert_atribuicao(item_id: str, pessoa_id: str, quantidade: float) -> Optional[dict]:
     """Cria ou atualiza uma atribuição."""
     if not db:
@@ -266,22 +491,138 @@ def delete_atribuicao(item_id: str, pessoa_id: str) -> bool:
     return len(result.data) > 0 if result.data else False
 
 
+# ============================================
+# BUSCA NO HISTÓRICO
+# ============================================
+
+def buscar_historico(user_id: str, termo: str, limite: int = 20, offset: int = 0) -> dict:
+    """
+    Busca `termo` no nome das divisões e dos itens do usuário (função SQL
+    buscar_historico, com índices de trigramas). Uma chamada, só a página pedida.
+    Retorna {"resultados": [...], "tem_mais": bool}.
+    """
+    if not db:
+        return {"resultados": [], "tem_mais": False}
+    params = {"p_user_id": user_id, "p_termo": termo, "p_limite": limite, "p_offset": offset}
+    result = db.rpc("buscar_historico", params).execute()
+    return result.data if result.data else {"resultados": [], "tem_mais": False}
+
+
+# ============================================
+# ESTATÍSTICAS (tabelas de resumo, ver database/13estatisticas.md)
+# ============================================
+
+def get_estatisticas_mensais(user_id: str, meses: int = 12) -> list:
+    """Gasto por mês dos últimos `meses` meses com divisões (mais recente primeiro)."""
+    if not db:
+        return []
+    result = (db.table("estatisticas_mensais").select("mes, divisoes, total_gasto")
+              .eq("user_id", user_id).order("mes", desc=True).limit(meses).execute())
+    return result.data if result.data else []
+
+
+def get_estatisticas_itens(user_id: str, limite: int = 10) -> list:
+    """Itens pedidos com mais frequência pelo usuário."""
+    if not db:
+        return []
+    result = (db.table("estatisticas_itens").select("nome, vezes, quantidade, total_gasto, ultima_vez")
+              .eq("user_id", user_id).order("vezes", desc=True).limit(limite).execute())
+    return result.data if result.data else []
+
+
+def get_estatisticas_companhias(user_id: str, limite: int = 10) -> list:
+    """Pessoas que mais aparecem nas divisões do usuário."""
+    if not db:
+        return []
+    result = (db.table("estatisticas_companhias").select("nome, divisoes, total_pago, ultima_vez")
+              .eq("user_id", user_id).order("divisoes", desc=True).limit(limite).execute())
+    return result.data if result.data else []
+
+
+def get_divisoes_finalizadas_sem_snapshot(limite: int = 100) -> list:
+    """Divisões finalizadas antes do snapshot existir (só a linha da divisão)."""
+    if not db:
+        return []
+    result = (db.table("divisoes").select("*").eq("status", "finalizada")
+              .is_("snapshot", "null").limit(limite).execute())
+    return result.data if result.data else []
+
+
+def processar_estatisticas_pendentes(lote: int = 200) -> int:
+    """
+    Conta nas estatísticas até `lote` divisões finalizadas que ainda não
+    entraram nelas. Retorna quantas foram processadas (0 = não há mais).
+    """
+    if not db:
+        return 0
+    result = db.rpc("processar_estatisticas_pendentes", {"p_lote": lote}).execute()
+    return int(result.data or 0)
+
+
+# ============================================
+# COMPARTILHAMENTOS (links públicos)
+# ============================================
+
+def get_compartilhamento(divisao_id: str) -> Optional[dict]:
+    """Busca o link público de uma divisão (se já existir)."""
+    if not db:
+        return None
+    result = db.table("compartilhamentos").select("*").eq("divisao_id", divisao_id).execute()
+    return result.data[0] if result.data else None
+
+
+def create_compartilhamento(token: str, divisao_id: str, user_id: str) -> Optional[dict]:
+    """Cria o link público de uma divisão."""
+    if not db:
+        return None
+    data = {"token": token, "divisao_id": divisao_id, "user_id": user_id}
+    result = db.table("compartilhamentos").insert(data).execute()
+    return result.data[0] if result.data else None
+
+
+def get_divisao_compartilhada(token: str) -> Optional[dict]:
+    """
+    Busca, em UMA chamada, o conteúdo da página pública de um link
+    (função SQL divisao_compartilhada). Retorna None se o token não existe.
+    """
+    if not db:
+        return None
+    result = db.rpc("divisao_compartilhada", {"p_token": token}).execute()
+    return result.data if result.data else None
+
+
 # ============================================
 # FUNÇÕES AUXILIARES - OTIMIZADAS
 # ============================================
 
-def get_divisao_completa(divisao_id: str) -> Optional[dict]:
+def get_divisao_completa(divisao_id: str, divisao: Optional[dict] = None) -> Optional[dict]:
     """
     Busca uma divisão com todos os dados relacionados.
     OTIMIZADO: Usa batch query para atribuições ao invés de N+1 queries.
+    Se a linha da divisão já foi buscada (ex: para conferir a versão), ela pode
+    ser passada em `divisao` para economizar uma query; se a versão dela bater
+    com a do cache, nenhuma outra query é feita.
+    O resultado fica no cache_divisoes (não altere o dicionário devolvido).
     """
     if not db:
         return None
     
-    divisao = get_divisao(divisao_id)
+    if divisao is None:
+        divisao = get_divisao(divisao_id)
     if not divisao:
         return None
     
+    if divisao.get("versao") is not None:
+        cacheada = cache_divisoes.obter(divisao_id, versao=divisao["versao"])
+        if cacheada:
+            return cacheada
+    
+    # Divisão finalizada: tudo já está no snapshot (nenhuma query a mais)
+    if divisao.get("snapshot"):
+        congelada = _divisao_do_snapshot(divisao)
+        cache_divisoes.guardar(congelada)
+        return congelada
+    
     itens = get_itens_by_divisao(divisao_id)
     pessoas = get_pessoas_by_divisao(divisao_id)
     
@@ -304,9 +645,46 @@ def get_divisao_completa(divisao_id: str) -> Optional[dict]:
     divisao["itens"] = itens
     divisao["pessoas"] = pessoas
     
+    # Finalizada antes de existir o snapshot: grava agora, as próximas leituras usam ele
+    if divisao.get("status") == "finalizada":
+        snapshot = montar_snapshot(divisao)
+        db.table("divisoes").update({"snapshot": snapshot}).eq("id", divisao_id).execute()
+        divisao["totais"] = snapshot["totais"]
+    
+    cache_divisoes.guardar(divisao)
     return divisao
 
 
+def renovar_cache(divisao_completa: dict, divisao: dict) -> dict:
+    """
+    Guarda no cache a divisão completa com a linha `divisao` já numa versão
+    nova em que só a versão mudou (ex: reservada pelo coalescedor), para a
+    próxima leitura não buscar itens, pessoas e atribuições de novo.
+    """
+    renovada = {**divisao_completa, **divisao}
+    cache_divisoes.guardar(renovada)
+    return renovada
+
+
+def get_divisao_completa_em_cache(divisao_id: str, versao: Optional[int] = None) -> Optional[dict]:
+    """
+    Devolve a divisão completa se ela estiver no cache (sem tocar no banco).
+    Com `versao` (lida da linha da divisão), só se o cache estiver nessa versão.
+    """
+    return cache_divisoes.obter(divisao_id, versao=versao)
+
+
+def get_totais_compactos(divisao_id: str) -> Optional[dict]:
+    """
+    Busca, em UMA chamada, o consumo de cada pessoa e o progresso da divisão
+    (função SQL totais_divisao_compacto). Retorna None se a divisão não existe.
+    """
+    if not db:
+        return None
+    result = db.rpc("totais_divisao_compacto", {"p_divisao_id": divisao_id}).execute()
+    return result.data if result.data else None
+
+
 def get_divisoes_completas_by_user(user_id: str) -> list:
     """
     Lista todas as divisões de um usuário com dados completos.
@@ -320,17 +698,84 @@ def get_divisoes_completas_by_user(user_id: str) -> list:
     
     # Query 1: Busca todas as divisões do usuário
     divisoes = get_divisoes_by_user(user_id)
+    return _montar_divisoes_completas(divisoes)
+
+
+def get_divisoes_completas_pagina(user_id: str, limite: int = 100, depois: Optional[dict] = None) -> list:
+    """
+    Uma página do histórico com dados completos, da mais nova para a mais antiga.
+    Paginação por chave: `depois` é a última divisão da página anterior
+    ({"created_at", "id"}), então cada página custa o mesmo, não importa o
+    quanto já foi lido (ao contrário de OFFSET). Usa até 4 queries por página.
+    """
+    if not db:
+        return []
+    
+    query = db.table("divisoes").select("*").eq("user_id", user_id)
+    if depois:
+        criada = depois["created_at"]
+        query = query.or_(f'created_at.lt."{criada}",and(created_at.eq."{criada}",id.lt.{depois["id"]})')
+    result = query.order("created_at", desc=True).order("id", desc=True).limit(limite).execute()
+    return _montar_divisoes_completas(result.data if result.data else [])
+
+
+def get_divisoes_completas_by_ids(divisao_ids: list, user_id: str = None) -> list:
+    """
+    Busca várias divisões pelo ID com dados completos (4 queries no total).
+    Se `user_id` for informado, ignora as divisões de outros usuários.
+    """
+    if not db or not divisao_ids:
+        return []
+    
+    query = db.table("divisoes").select("*").in_("id", divisao_ids)
+    if user_id:
+        query = query.eq("user_id", user_id)
+    result = query.execute()
+    return _montar_divisoes_completas(result.data if result.data else [])
+
+
+def get_alteracoes_desde(user_id: str, desde: str) -> Optional[dict]:
+    """
+    Sincronização incremental do histórico (função SQL divisoes_alteradas_desde).
+    Uma chamada responde tudo quando nada mudou; itens, pessoas e atribuições
+    são buscados (3 queries) só para as divisões que mudaram.
+    Retorna {"divisoes": [...completas], "excluidas": [ids], "sincronizado_em": ...}.
+    """
+    if not db:
+        return None
+    result = db.rpc("divisoes_alteradas_desde", {"p_user_id": user_id, "p_desde": desde}).execute()
+    if not result.data:
+        return None
+    alteracoes = result.data
+    return {
+        "divisoes": _montar_divisoes_completas(alteracoes.get("divisoes") or []),
+        "excluidas": [str(divisao_id) for divisao_id in alteracoes.get("excluidas") or []],
+        "sincronizado_em": alteracoes.get("sincronizado_em"),
+    }
+
+
+def _montar_divisoes_completas(divisoes: list) -> list:
+    """
+    Busca itens, pessoas e atribuições de uma lista de divisões (3 queries) e agrupa.
+    Divisões finalizadas vêm do snapshot e ficam de fora dessas queries.
+    """
     if not divisoes:
         return []
     
-    divisao_ids = [d["id"] for d in divisoes]
+    divisao_ids = [d["id"] for d in divisoes if not d.get("snapshot")]
+    if not divisao_ids:
+        return [_divisao_do_snapshot(d) for d in divisoes]
     
+    # Mesma ordem da função SQL totais_divisao_compacto (16ordem_dos_totais.md):
+    # as estratégias "banco" e "local" dos totais fecham os centavos igual.
     # Query 2: Busca todos os itens de todas as divisões
-    itens_result = db.table("itens").select("*").in_("divisao_id", divisao_ids).order("ordem").execute()
+    itens_result = (db.table("itens").select("*").in_("divisao_id", divisao_ids)
+                    .order("ordem").order("created_at").order("id").execute())
     todos_itens = itens_result.data if itens_result.data else []
     
     # Query 3: Busca todas as pessoas de todas as divisões
-    pessoas_result = db.table("pessoas").select("*").in_("divisao_id", divisao_ids).execute()
+    pessoas_result = (db.table("pessoas").select("*").in_("divisao_id", divisao_ids)
+                      .order("created_at").order("id").execute())
     todas_pessoas = pessoas_result.data if pessoas_result.data else []
     
     # Query 4: Busca todas as atribuições via item_ids
@@ -366,6 +811,9 @@ def get_divisoes_completas_by_user(user_id: str) -> list:
     # Monta as divisões completas
     result = []
     for divisao in divisoes:
+        if divisao.get("snapshot"):
+            result.append(_divisao_do_snapshot(divisao))
+            continue
         div_id = divisao["id"]
         
         # Pega itens dessa divisão
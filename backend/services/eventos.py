@@ -0,0 +1,160 @@
+# --- Anotações para Iniciantes ---
+# Central de eventos das divisões (tempo real).
+# Quando duas pessoas estão com a mesma divisão aberta, cada alteração feita
+# por uma delas vira um pequeno "evento" (ex: item_atualizado) enviado na hora
+# para a outra, via Server-Sent Events (/api/divisao/{id}/eventos).
+#
+# Quem publica são as funções de alteração do db_service. Cada evento leva a
+# versão da divisão (a mesma do ETag), registrada por db_service.alterar_divisao.
+#
+# Os eventos também ficam num histórico curto por divisão (últimas versões),
+# usado para responder "o que mudou desde a versão N" (/api/divisao/{id}/mudancas)
+# e para reenviar o que um cliente perdeu ao reconectar. Se o histórico não
+# cobre o pedido (versões antigas, alterações feitas por outro processo,
+# operações em lote), quem chama cai para a divisão completa.
+#
+# Proteções para um cliente lento não travar o servidor:
+#   - Cada assinante tem uma fila com tamanho máximo (TAMANHO_FILA).
+#     Se ela encher, descartamos o que está nela e deixamos só um evento
+#     "ressincronizar": o cliente então busca a divisão inteira de novo.
+#   - Cada divisão aceita no máximo MAX_ASSINANTES_POR_DIVISAO conexões.
+#
+# Tudo roda no event loop do servidor (uma thread), então não há locks.
+
+import asyncio
+import os
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Set
+
+import orjson
+
+MAX_ASSINANTES_POR_DIVISAO = int(os.getenv("EVENTOS_MAX_ASSINANTES", "20"))
+TAMANHO_FILA = int(os.getenv("EVENTOS_TAMANHO_FILA", "100"))
+TAMANHO_HISTORICO = int(os.getenv("EVENTOS_HISTORICO", "200"))  # versões guardadas por divisão
+MAX_VERSOES = 4096  # quantas divisões têm a versão (e o histórico) lembrados
+
+_assinantes: Dict[str, Set["Assinatura"]] = {}
+_versoes: "OrderedDict[str, int]" = OrderedDict()  # divisao_id -> última versão conhecida
+_historico: Dict[str, deque] = {}  # divisao_id -> deque de (versao, [eventos])
+
+
+class Assinatura:
+    """Uma conexão acompanhando uma divisão: guarda os eventos ainda não enviados."""
+
+    def __init__(self, divisao_id: str):
+        self.divisao_id = divisao_id
+        self.fila: asyncio.Queue = asyncio.Queue(maxsize=TAMANHO_FILA)
+
+    def entregar(self, mensagem: bytes, versao: Optional[int]) -> None:
+        """Coloca um evento na fila sem nunca esperar pelo cliente."""
+        try:
+            self.fila.put_nowait(mensagem)
+        except asyncio.QueueFull:
+            while not self.fila.empty():
+                self.fila.get_nowait()
+            self.fila.put_nowait(formatar_evento({"tipo": "ressincronizar", "versao": versao}))
+
+
+def formatar_evento(evento: dict) -> bytes:
+    """Monta um evento no formato Server-Sent Events (o `id` é a versão da divisão)."""
+    versao = evento.get("versao")
+    linha_id = f"id: {versao}\n".encode() if versao is not None else b""
+    return linha_id + f"event: {evento['tipo']}\n".encode() + b"data: " + orjson.dumps(evento) + b"\n\n"
+
+
+def registrar_versao(divisao_id: str, versao: Optional[int]) -> None:
+    """Guarda a versão atual da divisão (usada nos próximos eventos)."""
+    if versao is None:
+        return
+    _versoes[divisao_id] = versao
+    _versoes.move_to_end(divisao_id)
+    while len(_versoes) > MAX_VERSOES:
+        antiga, _ = _versoes.popitem(last=False)
+        _historico.pop(antiga, None)
+
+
+def abrir_versao(divisao_id: str, versao: Optional[int]) -> None:
+    """
+    Registra que ESTE processo criou uma nova versão da divisão
+    (db_service.alterar_divisao). Os eventos publicados a seguir ficam nela.
+    """
+    if versao is None:
+        return
+    registrar_versao(divisao_id, versao)
+    historico = _historico.get(divisao_id)
+    if historico is None:
+        historico = _historico[divisao_id] = deque(maxlen=TAMANHO_HISTORICO)
+    historico.append((versao, []))
+
+
+def mudancas_desde(divisao_id: str, desde: int, versao_atual: int) -> Optional[List[dict]]:
+    """
+    Eventos das versões desde+1 até versao_atual, em ordem.
+    Devolve None quando o histórico não cobre o intervalo inteiro
+    (quem chama deve mandar a divisão completa).
+    """
+    if desde == versao_atual:
+        return []
+    if desde > versao_atual:
+        return None
+    entradas = {versao: lista for versao, lista in _historico.get(divisao_id, ())}
+    mudancas = []
+    for versao in range(desde + 1, versao_atual + 1):
+        lista = entradas.get(versao)
+        if lista is None or any(evento["tipo"] == "ressincronizar" for evento in lista):
+            return None
+        mudancas.extend(lista)
+    return mudancas
+
+
+def versao_atual(divisao_id: str) -> Optional[int]:
+    """Última versão conhecida da divisão neste processo (ou None)."""
+    return _versoes.get(divisao_id)
+
+
+def assinar(divisao_id: str) -> Optional[Assinatura]:
+    """Cria uma assinatura, ou devolve None se a divisão já tem conexões demais."""
+    assinantes = _assinantes.setdefault(divisao_id, set())
+    if len(assinantes) >= MAX_ASSINANTES_POR_DIVISAO:
+        return None
+    assinatura = Assinatura(divisao_id)
+    assinantes.add(assinatura)
+    return assinatura
+
+
+def cancelar(assinatura: Assinatura) -> None:
+    """Remove a assinatura (cliente desconectou)."""
+    assinantes = _assinantes.get(assinatura.divisao_id)
+    if assinantes is None:
+        return
+    assinantes.discard(assinatura)
+    if not assinantes:
+        del _assinantes[assinatura.divisao_id]
+
+
+def publicar(divisao_id: str, tipo: str, **dados) -> None:
+    """Guarda o evento no histórico e envia para quem acompanha a divisão."""
+    divisao_id = str(divisao_id)
+    versao = versao_atual(divisao_id)
+    evento = {"tipo": tipo, "versao": versao, **dados}
+
+    historico = _historico.get(divisao_id)
+    if historico and historico[-1][0] == versao:
+        historico[-1][1].append(evento)
+
+    assinantes = _assinantes.get(divisao_id)
+    if not assinantes:
+        return
+    mensagem = formatar_evento(evento)
+    for assinatura in assinantes:
+        assinatura.entregar(mensagem, versao)
+
+
+def item_para_evento(item: dict) -> dict:
+    """Campos de um item que vão nos eventos (sem as atribuições)."""
+    return {
+        "id": str(item["id"]),
+        "nome": item["nome"],
+        "quantidade": float(item["quantidade"]),
+        "valor_unitario": float(item["valor_unitario"]),
+    }
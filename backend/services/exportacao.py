@@ -0,0 +1,92 @@
+# --- Anotações para Iniciantes ---
+# Exportação do histórico de divisões em CSV (GET /api/exportar).
+# O arquivo é gerado aos poucos: buscamos uma página de divisões (paginação
+# por chave, ver db_service.get_divisoes_completas_pagina), escrevemos as
+# linhas dela e já mandamos para o cliente antes de buscar a próxima.
+# Assim a memória usada é a de UMA página, não importa o tamanho do histórico.
+#
+# Formato pensado para o Excel em português: separador ";", vírgula decimal
+# e BOM no início (para os acentos aparecerem certos).
+#
+# Níveis:
+#   - "divisoes": uma linha por divisão (subtotal, desconto, taxa e total da conta)
+#   - "pessoas":  uma linha por pessoa de cada divisão (quanto cada uma pagou)
+
+import csv
+import io
+import os
+from typing import Iterator, List
+
+from . import coalescedor
+from . import db_service as db
+from .totais import calcular_totais, totais_da_conta
+
+TAMANHO_PAGINA = int(os.getenv("EXPORTACAO_TAMANHO_PAGINA", "100"))
+
+NIVEIS = ("divisoes", "pessoas")
+CABECALHOS = {
+    "divisoes": ["data", "divisao", "status", "pessoas", "subtotal", "desconto", "taxa_servico", "total"],
+    "pessoas": ["data", "divisao", "status", "pessoa", "subtotal", "desconto", "taxa_servico", "total"],
+}
+BOM = "\ufeff"
+
+
+def _texto(valor) -> str:
+    """Texto seguro para planilhas: impede que um nome vire fórmula (=, +, -, @)."""
+    texto = str(valor or "")
+    if texto[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        return "'" + texto
+    return texto
+
+
+def _reais(valor: float) -> str:
+    """Valor em reais com vírgula decimal (ex: 12,50)."""
+    return f"{valor:.2f}".replace(".", ",")
+
+
+def linhas_da_divisao(divisao: dict, nivel: str) -> List[list]:
+    """As linhas do CSV de uma divisão completa."""
+    inicio = [
+        (divisao.get("created_at") or "")[:10],
+        _texto(divisao.get("nome") or "Divisão sem nome"),
+        divisao.get("status", "em_andamento"),
+    ]
+    if nivel == "divisoes":
+        conta = totais_da_conta(divisao)
+        return [inicio + [
+            len(divisao.get("pessoas", [])),
+            _reais(conta["subtotal"]), _reais(conta["desconto"]), _reais(conta["taxa"]), _reais(conta["total"]),
+        ]]
+
+    totais = divisao.get("totais") or calcular_totais(divisao)
+    return [
+        inicio + [
+            _texto(pessoa["nome"]),
+            _reais(pessoa["subtotal"]), _reais(pessoa["desconto"]), _reais(pessoa["taxa"]), _reais(pessoa["total"]),
+        ]
+        for pessoa in totais["pessoas"]
+    ]
+
+
+def gerar_csv(user_id: str, nivel: str = "divisoes") -> Iterator[bytes]:
+    """Gera o CSV do histórico do usuário, uma página de divisões por vez."""
+    if nivel not in NIVEIS:
+        raise ValueError(f"Nível inválido: {nivel}")
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=";")
+    buffer.write(BOM)
+    escritor.writerow(CABECALHOS[nivel])
+
+    depois = None
+    while True:
+        divisoes = db.get_divisoes_completas_pagina(user_id, TAMANHO_PAGINA, depois)
+        for divisao in divisoes:
+            escritor.writerows(linhas_da_divisao(coalescedor.sobrepor(divisao), nivel))
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+        if len(divisoes) < TAMANHO_PAGINA:
+            return
+        depois = {"created_at": divisoes[-1]["created_at"], "id": divisoes[-1]["id"]}
@@ -1,19 +1,37 @@
-import google.generativeai as genai
+# --- Anotações para Iniciantes ---
+# Leitura da comanda pela IA (Gemini).
+# O SDK do Gemini e o PIL são importados no primeiro scan (ou no /api/ready),
+# não no import deste módulo: sozinhos, eles são mais da metade do tempo de
+# subida do servidor, e a maioria das requisições nem usa o scanner.
+
 import os
-from dotenv import load_dotenv
-import PIL.Image
+import threading
 import json
 import logging
 
+from . import ambiente  # noqa: F401 (carrega o .env)
+
 # Configura logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Carrega variáveis de ambiente
-load_dotenv()
+_genai = None
+_lock = threading.Lock()
+
 
-# Configura a API Key do Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+def carregar_gemini():
+    """Importa e configura o SDK do Gemini (só na primeira chamada)."""
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as genai
+                import PIL.Image  # noqa: F401 (usado no scan; importado junto para aquecer)
+
+                # Configura a API Key do Gemini
+                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                _genai = genai
+    return _genai
 
 # Modelos com fallback
 FALLBACK_MODELS = [
@@ -44,6 +62,9 @@ def scan_receipt_to_json(image_path: str) -> dict | None:
     Analisa uma imagem de uma comanda usando o Gemini,
     extrai os itens e seus preços, e retorna um JSON estruturado.
     """
+    genai = carregar_gemini()
+    import PIL.Image
+
     # Carrega a imagem
     try:
         img = PIL.Image.open(image_path)
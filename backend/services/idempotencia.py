@@ -0,0 +1,246 @@
+# --- Anotações para Iniciantes ---
+# Chaves de idempotência: o app manda um header "Idempotency-Key" (ex: um UUID
+# gerado quando o usuário toca em "Criar divisão") e repete o MESMO valor se
+# precisar reenviar (timeout, rede ruim). O servidor executa a requisição uma
+# vez só e devolve a mesma resposta às repetições, então um reenvio não cria
+# uma divisão duplicada nem paga uma segunda leitura da comanda pela IA.
+#
+# Como funciona (MiddlewareIdempotencia, ASGI puro, só em POST com o header):
+#   - a primeira requisição com a chave executa normalmente; a resposta
+#     completa (status, headers e corpo) fica guardada por TTL_SEGUNDOS;
+#   - uma repetição que chega DURANTE a execução espera a original terminar
+#     e recebe a resposta dela (em vez de executar de novo);
+#   - uma repetição depois disso recebe a resposta guardada, com o header
+#     "Idempotent-Replayed: true";
+#   - a mesma chave com outro corpo é recusada (422): a chave foi reaproveitada
+#     por engano.
+# Respostas 5xx não são guardadas (a repetição executa de novo), e as chaves
+# são separadas por usuário: o middleware identifica quem chama (auth.identificar,
+# e o get_current_user reaproveita o resultado), então dois usuários com a
+# mesma chave não se misturam e um reenvio depois de renovar o JWT continua
+# sendo reconhecido. Sem usuário identificado, a requisição segue sem a chave
+# (e o endpoint responde 401).
+#
+# Um corpo maior que IDEMPOTENCIA_MAX_CORPO é recusado (413) antes de ser lido
+# (pelo Content-Length) ou assim que passa do limite, sem ficar todo na memória.
+#
+# O armazenamento é em memória, por worker (como o cache_divisoes), limitado
+# em número de respostas (IDEMPOTENCIA_MAX) e em bytes (IDEMPOTENCIA_MAX_BYTES):
+# com vários workers, a proteção vale para repetições que caem no mesmo worker.
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import orjson
+
+from . import auth
+
+TTL_SEGUNDOS = float(os.getenv("IDEMPOTENCIA_TTL", "86400"))  # 24 h
+MAX_RESPOSTAS = int(os.getenv("IDEMPOTENCIA_MAX", "2048"))
+MAX_BYTES = int(os.getenv("IDEMPOTENCIA_MAX_BYTES", str(64 * 1024 * 1024)))  # soma das respostas guardadas
+TAMANHO_MAXIMO_RESPOSTA = 1024 * 1024  # respostas maiores não são guardadas
+# Corpo lido na memória para comparar os reenvios: a foto do scan (10 MB) mais o multipart
+TAMANHO_MAXIMO_CORPO = int(os.getenv("IDEMPOTENCIA_MAX_CORPO", str(11 * 1024 * 1024)))
+TAMANHO_MAXIMO_CHAVE = 255
+
+_respostas: "OrderedDict[str, tuple]" = OrderedDict()  # chave -> (guardada_em, impressão, resposta, bytes)
+_bytes_guardados = 0
+_em_andamento: Dict[str, tuple] = {}  # chave -> (impressão, asyncio.Event)
+_lock = threading.Lock()
+
+
+def obter(chave: str) -> Optional[tuple]:
+    """(impressão do corpo, resposta) guardados para a chave, ou None."""
+    with _lock:
+        entrada = _respostas.get(chave)
+        if not entrada:
+            return None
+        guardada_em, impressao, resposta, _ = entrada
+        if time.monotonic() - guardada_em > TTL_SEGUNDOS:
+            _remover(chave)
+            return None
+        _respostas.move_to_end(chave)
+        return impressao, resposta
+
+
+def guardar(chave: str, impressao: str, resposta: dict) -> None:
+    """Guarda a resposta (descarta as menos usadas se passar do número ou dos bytes)."""
+    global _bytes_guardados
+    tamanho = len(chave) + len(resposta["corpo"]) + sum(len(nome) + len(valor) for nome, valor in resposta["headers"])
+    if MAX_RESPOSTAS <= 0 or tamanho > MAX_BYTES:
+        return
+    with _lock:
+        _remover(chave)
+        _respostas[chave] = (time.monotonic(), impressao, resposta, tamanho)
+        _bytes_guardados += tamanho
+        while len(_respostas) > MAX_RESPOSTAS or _bytes_guardados > MAX_BYTES:
+            _remover(next(iter(_respostas)))
+
+
+def _remover(chave: str) -> None:
+    """Tira uma resposta do armazenamento (chamar com o _lock)."""
+    global _bytes_guardados
+    entrada = _respostas.pop(chave, None)
+    if entrada:
+        _bytes_guardados -= entrada[3]
+
+
+def bytes_guardados() -> int:
+    """Total de bytes das respostas guardadas."""
+    return _bytes_guardados
+
+
+def limpar() -> None:
+    """Esvazia as respostas guardadas."""
+    global _bytes_guardados
+    with _lock:
+        _respostas.clear()
+        _bytes_guardados = 0
+
+
+def _cabecalho(scope, nome: bytes) -> Optional[bytes]:
+    for chave, valor in scope.get("headers", []):
+        if chave == nome:
+            return valor
+    return None
+
+
+async def _usuario(scope) -> Optional[dict]:
+    """Usuário da requisição (auth.identificar), guardado no scope para o get_current_user."""
+    authorization = _cabecalho(scope, b"authorization")
+    api_key = _cabecalho(scope, b"x-api-key")
+    usuario = await auth.identificar(auth.token_bearer(authorization.decode("latin-1") if authorization else None),
+                                     api_key.decode("latin-1") if api_key else None)
+    if usuario is not None:
+        scope.setdefault("state", {})["usuario"] = usuario
+    return usuario
+
+
+def _chave(scope, usuario: dict, valor: bytes) -> str:
+    # Em modo API Key com Supabase não há user_id: todos são o mesmo usuário de desenvolvimento
+    partes = [str(usuario.get("user_id") or usuario.get("method")), scope["method"], scope["path"],
+              valor.decode("latin-1")]
+    return "\0".join(partes)
+
+
+def _impressao(scope, corpo: bytes) -> str:
+    """Hash do corpo. No multipart, sem o boundary (que muda quando o app remonta o envio)."""
+    tipo = (_cabecalho(scope, b"content-type") or b"").decode("latin-1")
+    if "boundary=" in tipo:
+        boundary = tipo.split("boundary=", 1)[1].split(";")[0].strip().strip('"')
+        corpo = corpo.replace(boundary.encode("latin-1"), b"")
+    return hashlib.sha256(corpo).hexdigest()
+
+
+async def _enviar_json(send, status: int, conteudo: dict) -> None:
+    corpo = orjson.dumps(conteudo)
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": corpo})
+
+
+async def _corpo_grande_demais(send) -> None:
+    await _enviar_json(send, 413, {"detail": f"Corpo maior que {TAMANHO_MAXIMO_CORPO} bytes."})
+
+
+async def _repetir(send, resposta: dict) -> None:
+    await send({"type": "http.response.start", "status": resposta["status"],
+                "headers": resposta["headers"] + [(b"idempotent-replayed", b"true")]})
+    await send({"type": "http.response.body", "body": resposta["corpo"]})
+
+
+class MiddlewareIdempotencia:
+    """Middleware ASGI: executa uma vez cada POST com Idempotency-Key e repete a resposta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        valor = _cabecalho(scope, b"idempotency-key") if scope["type"] == "http" else None
+        if valor is None or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        if not valor or len(valor) > TAMANHO_MAXIMO_CHAVE:
+            await _enviar_json(send, 400, {"detail": f"Idempotency-Key deve ter de 1 a {TAMANHO_MAXIMO_CHAVE} caracteres."})
+            return
+        tamanho = _cabecalho(scope, b"content-length")
+        if tamanho is not None and tamanho.isdigit() and int(tamanho) > TAMANHO_MAXIMO_CORPO:
+            await _corpo_grande_demais(send)
+            return
+        usuario = await _usuario(scope)
+        if usuario is None:
+            await self.app(scope, receive, send)  # sem usuário, o endpoint responde 401
+            return
+
+        # O corpo inteiro é lido antes, para comparar as repetições com a original
+        corpo = bytearray()
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "http.disconnect":
+                return
+            corpo += mensagem.get("body", b"")
+            if len(corpo) > TAMANHO_MAXIMO_CORPO:  # sem Content-Length (chunked) ou mentindo
+                await _corpo_grande_demais(send)
+                return
+            if not mensagem.get("more_body"):
+                break
+        chave, impressao = _chave(scope, usuario, valor), _impressao(scope, bytes(corpo))
+
+        while True:
+            guardada = obter(chave)
+            if guardada is not None:
+                conflito = guardada[0] != impressao
+                if not conflito:
+                    await _repetir(send, guardada[1])
+                    return
+                break
+            andamento = _em_andamento.get(chave)
+            conflito = andamento is not None and andamento[0] != impressao
+            if andamento is None or conflito:
+                break
+            await andamento[1].wait()  # a original terminou: usa a resposta dela (ou executa, se não guardou)
+
+        if conflito:
+            await _enviar_json(send, 422, {"detail": "Idempotency-Key já usada com outra requisição."})
+            return
+
+        terminou = asyncio.Event()
+        _em_andamento[chave] = (impressao, terminou)
+        try:
+            await self._executar(scope, bytes(corpo), receive, send, chave, impressao)
+        finally:
+            del _em_andamento[chave]
+            terminou.set()
+
+    async def _executar(self, scope, corpo: bytes, receive, send, chave: str, impressao: str) -> None:
+        entregue = False
+
+        async def receber():
+            nonlocal entregue
+            if not entregue:
+                entregue = True
+                return {"type": "http.request", "body": corpo, "more_body": False}
+            return await receive()  # depois do corpo, só resta esperar a desconexão
+
+        resposta = {"status": None, "headers": [], "corpo": bytearray()}
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                resposta["status"] = mensagem["status"]
+                resposta["headers"] = list(mensagem.get("headers", []))
+            elif mensagem["type"] == "http.response.body" and resposta["corpo"] is not None:
+                resposta["corpo"] += mensagem.get("body", b"")
+                if len(resposta["corpo"]) > TAMANHO_MAXIMO_RESPOSTA:
+                    resposta["corpo"] = None
+            await send(mensagem)
+
+        await self.app(scope, receber, enviar)
+        if resposta["status"] is not None and resposta["status"] < 500 and resposta["corpo"] is not None:
+            guardar(chave, impressao, {"status": resposta["status"], "headers": resposta["headers"],
+                                       "corpo": bytes(resposta["corpo"])})
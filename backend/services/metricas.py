@@ -0,0 +1,248 @@
+# --- Anotações para Iniciantes ---
+# Medição do tempo de cada requisição, separado por fase:
+#   - auth: validação do token (services/auth.py)
+#   - db: chamadas ao db_service (cada função, com quantas vezes foi chamada)
+#   - scanner: leitura da comanda pela IA
+#   - serializacao: geração do JSON da resposta (resposta_json)
+#
+# O MiddlewareMetricas (ASGI puro, sem o custo do BaseHTTPMiddleware) abre uma
+# "medição" por requisição, guardada numa ContextVar: o código das fases só
+# soma o próprio tempo nela, sem precisar receber nada por parâmetro (vale
+# também para os endpoints síncronos, que rodam no threadpool com uma cópia
+# do contexto). Fora de uma requisição (ex: o coalescedor gravando depois),
+# nada é medido.
+#
+# Cada resposta sai com o header Server-Timing (aparece na aba Network do
+# navegador), ex:  auth;dur=0.1, db;dur=12.3;desc="4 chamadas", total;dur=15.0
+# e tudo é somado por rota (histograma de latência, tempo por fase e chamadas
+# ao banco), exposto em /api/metrics no formato texto do Prometheus.
+# A latência registrada é até o início da resposta: em respostas em stream
+# (CSV, eventos SSE) o envio do corpo não entra.
+
+import functools
+import inspect
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+# Limites (em segundos) dos baldes do histograma de latência
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROTA_DESCONHECIDA = "desconhecida"  # 404: não usamos o caminho (seria uma série por URL)
+
+
+class Medicao:
+    """Tempos de UMA requisição."""
+
+    __slots__ = ("inicio", "fases", "chamadas_db", "profundidade_db")
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.fases: Dict[str, float] = defaultdict(float)  # fase -> segundos
+        self.chamadas_db: Dict[str, list] = {}  # função do db_service -> [chamadas, segundos]
+        self.profundidade_db = 0  # funções do db_service chamando umas às outras contam uma vez
+
+    def server_timing(self, total: float) -> str:
+        """Valor do header Server-Timing (durações em milissegundos)."""
+        partes = []
+        for fase, segundos in self.fases.items():
+            if fase == "db":
+                chamadas = sum(c for c, _ in self.chamadas_db.values())
+                partes.append(f'db;dur={segundos * 1000:.1f};desc="{chamadas} chamadas"')
+            else:
+                partes.append(f"{fase};dur={segundos * 1000:.1f}")
+        for funcao, (chamadas, segundos) in self.chamadas_db.items():
+            partes.append(f'db.{funcao};dur={segundos * 1000:.1f};desc="{chamadas}x"')
+        partes.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(partes)
+
+
+_medicao: ContextVar[Optional[Medicao]] = ContextVar("medicao", default=None)
+
+
+# ============================================
+# MEDIÇÃO DAS FASES
+# ============================================
+
+@contextmanager
+def fase(nome: str):
+    """Soma o tempo do bloco `with` na fase `nome` da requisição atual."""
+    medicao = _medicao.get()
+    if medicao is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicao.fases[nome] += time.perf_counter() - inicio
+
+
+def cronometrado(nome: str):
+    """Decorator: soma o tempo da função (síncrona ou async) na fase `nome`."""
+    def decorar(funcao):
+        if inspect.iscoroutinefunction(funcao):
+            @functools.wraps(funcao)
+            async def medida_async(*args, **kwargs):
+                with fase(nome):
+                    return await funcao(*args, **kwargs)
+            return medida_async
+
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with fase(nome):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorar
+
+
+def _chamada_db_medida(funcao):
+    @functools.wraps(funcao)
+    def medida(*args, **kwargs):
+        medicao = _medicao.get()
+        if medicao is None or medicao.profundidade_db:
+            return funcao(*args, **kwargs)
+        medicao.profundidade_db += 1
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            segundos = time.perf_counter() - inicio
+            medicao.profundidade_db -= 1
+            medicao.fases["db"] += segundos
+            chamadas = medicao.chamadas_db.setdefault(funcao.__name__, [0, 0.0])
+            chamadas[0] += 1
+            chamadas[1] += segundos
+    return medida
+
+
+def instrumentar_db(modulo) -> None:
+    """
+    Mede todas as funções públicas do módulo (o db_service) na fase "db".
+    Troca as funções no próprio módulo, então valem para quem chama `db.funcao(...)`.
+    """
+    for nome, funcao in list(vars(modulo).items()):
+        if (inspect.isfunction(funcao) and funcao.__module__ == modulo.__name__
+                and not nome.startswith("_") and not hasattr(funcao, "__wrapped__")):
+            setattr(modulo, nome, _chamada_db_medida(funcao))
+
+
+# ============================================
+# AGREGADOS POR ROTA
+# ============================================
+
+_lock = threading.Lock()
+_latencias: Dict[Tuple[str, str], list] = {}  # (método, rota) -> [contagens por balde..., soma, total]
+_fases: Dict[Tuple[str, str, str], float] = defaultdict(float)  # (método, rota, fase) -> segundos
+_chamadas_db: Dict[Tuple[str, str, str], int] = defaultdict(int)  # (método, rota, função) -> chamadas
+_respostas: Dict[Tuple[str, str, str], int] = defaultdict(int)  # (método, rota, status) -> respostas
+
+
+def registrar(metodo: str, rota: str, status: int, medicao: Medicao, total: float) -> None:
+    """Soma uma requisição concluída nos agregados da rota."""
+    chave = (metodo, rota)
+    with _lock:
+        latencia = _latencias.get(chave)
+        if latencia is None:
+            latencia = _latencias[chave] = [0] * len(LIMITES_HISTOGRAMA) + [0.0, 0]
+        for i, limite in enumerate(LIMITES_HISTOGRAMA):
+            if total <= limite:
+                latencia[i] += 1
+        latencia[-2] += total
+        latencia[-1] += 1
+        for nome, segundos in medicao.fases.items():
+            _fases[(metodo, rota, nome)] += segundos
+        for funcao, (chamadas, _) in medicao.chamadas_db.items():
+            _chamadas_db[(metodo, rota, funcao)] += chamadas
+        _respostas[(metodo, rota, str(status))] += 1
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(**valores) -> str:
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in valores.items()) + "}"
+
+
+def _numero(valor: float) -> str:
+    return f"{valor:.6f}".rstrip("0").rstrip(".") if isinstance(valor, float) else str(valor)
+
+
+def texto_prometheus() -> str:
+    """Todos os agregados no formato texto do Prometheus (versão 0.0.4)."""
+    linhas = [
+        "# HELP compartilha_requisicao_segundos Tempo até o início da resposta, por rota.",
+        "# TYPE compartilha_requisicao_segundos histogram",
+    ]
+    with _lock:
+        for (metodo, rota), latencia in sorted(_latencias.items()):
+            for limite, contagem in zip(LIMITES_HISTOGRAMA, latencia):
+                rotulos = _rotulos(metodo=metodo, rota=rota, le=_numero(limite))
+                linhas.append(f"compartilha_requisicao_segundos_bucket{rotulos} {contagem}")
+            rotulos = _rotulos(metodo=metodo, rota=rota, le="+Inf")
+            linhas.append(f"compartilha_requisicao_segundos_bucket{rotulos} {latencia[-1]}")
+            rotulos = _rotulos(metodo=metodo, rota=rota)
+            linhas.append(f"compartilha_requisicao_segundos_sum{rotulos} {_numero(latencia[-2])}")
+            linhas.append(f"compartilha_requisicao_segundos_count{rotulos} {latencia[-1]}")
+
+        linhas += [
+            "# HELP compartilha_fase_segundos_total Tempo gasto em cada fase (auth, db, scanner, serializacao).",
+            "# TYPE compartilha_fase_segundos_total counter",
+        ]
+        for (metodo, rota, nome), segundos in sorted(_fases.items()):
+            linhas.append(f"compartilha_fase_segundos_total{_rotulos(metodo=metodo, rota=rota, fase=nome)} {_numero(segundos)}")
+
+        linhas += [
+            "# HELP compartilha_db_chamadas_total Chamadas ao db_service, por rota e função.",
+            "# TYPE compartilha_db_chamadas_total counter",
+        ]
+        for (metodo, rota, funcao), chamadas in sorted(_chamadas_db.items()):
+            linhas.append(f"compartilha_db_chamadas_total{_rotulos(metodo=metodo, rota=rota, funcao=funcao)} {chamadas}")
+
+        linhas += [
+            "# HELP compartilha_respostas_total Respostas por rota e status HTTP.",
+            "# TYPE compartilha_respostas_total counter",
+        ]
+        for (metodo, rota, status), total in sorted(_respostas.items()):
+            linhas.append(f"compartilha_respostas_total{_rotulos(metodo=metodo, rota=rota, status=status)} {total}")
+    return "\n".join(linhas) + "\n"
+
+
+# ============================================
+# MIDDLEWARE
+# ============================================
+
+class MiddlewareMetricas:
+    """Middleware ASGI: mede cada requisição HTTP e anexa o header Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        medicao = Medicao()
+        token = _medicao.set(medicao)
+        resposta = {"status": 500, "total": None}
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                total = time.perf_counter() - medicao.inicio
+                resposta["status"], resposta["total"] = mensagem["status"], total
+                cabecalhos = list(mensagem.get("headers", []))
+                cabecalhos.append((b"server-timing", medicao.server_timing(total).encode("latin-1")))
+                mensagem = {**mensagem, "headers": cabecalhos}
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _medicao.reset(token)
+            rota = getattr(scope.get("route"), "path", ROTA_DESCONHECIDA)
+            total = resposta["total"] if resposta["total"] is not None else time.perf_counter() - medicao.inicio
+            registrar(scope["method"], rota, resposta["status"], medicao, total)
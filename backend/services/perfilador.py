@@ -0,0 +1,237 @@
+# --- Anotações para Iniciantes ---
+# Perfilador por amostragem, para descobrir ONDE a CPU vai num worker lento
+# em produção, sem reiniciar nada. Duas formas (ambas desligadas por padrão):
+#
+#   1. Perfil sob demanda: POST /api/admin/perfil?segundos=30 (precisa do
+#      ADMIN_TOKEN). Uma thread "fotografa" a pilha de todas as threads a cada
+#      poucos milissegundos (sys._current_frames) durante N segundos.
+#   2. Requisições lentas: com PERFIL_LENTO_MS no .env, uma thread vigia as
+#      requisições em andamento; as que passam do limite têm a pilha
+#      fotografada (enquanto continuam lentas) com a rota como raiz. Conta só
+#      até o cabeçalho da resposta sair: um streaming (SSE, exportação) que
+#      demora a terminar não é requisição lenta.
+#      Se o event loop estiver travado por código síncrono, a pilha mostra quem.
+#
+# Os resultados são arquivos ".folded" (uma pilha por linha, "a;b;c contagem"),
+# o formato de entrada do flamegraph.pl e do speedscope (https://speedscope.app).
+# Ficam em PERFIL_DIR e podem ser baixados por /api/admin/perfis/{nome}.
+#
+# Custo: zero quando desligado. Ligado, cada amostra custa alguns
+# microssegundos por thread (sem instrumentar o código, como o cProfile faria).
+# A memória é limitada: cada perfil (e o arquivo das lentas, que acumula
+# enquanto o processo vive) guarda no máximo PERFIL_MAX_PILHAS pilhas
+# distintas; as amostras de pilhas novas além disso são somadas numa linha só.
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PERFIL_DIR = os.getenv("PERFIL_DIR", os.path.join(tempfile.gettempdir(), "compartilha-ai-perfis"))
+LIMITE_LENTO_MS = float(os.getenv("PERFIL_LENTO_MS", "0"))  # 0 = não captura requisições lentas
+MAX_AMOSTRAS_POR_REQUISICAO = 50
+MAX_PILHAS = int(os.getenv("PERFIL_MAX_PILHAS", "5000"))  # pilhas distintas por perfil
+PILHA_DESCARTADA = "(outras pilhas)"
+ARQUIVO_LENTAS = "requisicoes-lentas.folded"
+
+_PASTA_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _quadro(frame) -> str:
+    codigo = frame.f_code
+    caminho = codigo.co_filename
+    if caminho.startswith(_PASTA_BACKEND):
+        caminho = os.path.relpath(caminho, os.path.dirname(_PASTA_BACKEND))
+    else:
+        caminho = os.path.basename(caminho)
+    # ";" separa os quadros no formato folded
+    return f"{codigo.co_name} ({caminho}:{codigo.co_firstlineno})".replace(";", ",")
+
+
+def pilha(frame) -> List[str]:
+    """Quadros da pilha, do mais externo para o mais interno."""
+    quadros = []
+    while frame is not None:
+        quadros.append(_quadro(frame))
+        frame = frame.f_back
+    quadros.reverse()
+    return quadros
+
+
+def _nomes_das_threads() -> Dict[int, str]:
+    return {t.ident: t.name for t in threading.enumerate()}
+
+
+def contar(contagens: Counter, linha: str) -> None:
+    """Soma uma amostra da pilha `linha`, sem passar de MAX_PILHAS pilhas distintas."""
+    if linha not in contagens and len(contagens) >= MAX_PILHAS:
+        linha = PILHA_DESCARTADA
+    contagens[linha] += 1
+
+
+def gravar_folded(contagens: Counter, nome: str) -> str:
+    """Grava as pilhas no formato folded e devolve o caminho do arquivo."""
+    os.makedirs(PERFIL_DIR, exist_ok=True)
+    caminho = os.path.join(PERFIL_DIR, nome)
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        for linha, contagem in contagens.most_common():
+            arquivo.write(f"{linha} {contagem}\n")
+    os.replace(temporario, caminho)
+    return caminho
+
+
+def arquivos() -> List[dict]:
+    """Perfis gravados, do mais novo para o mais antigo."""
+    if not os.path.isdir(PERFIL_DIR):
+        return []
+    encontrados = []
+    for nome in os.listdir(PERFIL_DIR):
+        if nome.endswith(".folded"):
+            info = os.stat(os.path.join(PERFIL_DIR, nome))
+            encontrados.append({"nome": nome, "bytes": info.st_size, "modificado_em": info.st_mtime})
+    return sorted(encontrados, key=lambda a: a["modificado_em"], reverse=True)
+
+
+def caminho_do_arquivo(nome: str) -> Optional[str]:
+    """Caminho de um perfil pelo nome (None se não existe ou o nome é inválido)."""
+    if os.path.basename(nome) != nome or not nome.endswith(".folded"):
+        return None
+    caminho = os.path.join(PERFIL_DIR, nome)
+    return caminho if os.path.isfile(caminho) else None
+
+
+# ============================================
+# PERFIL SOB DEMANDA
+# ============================================
+
+_perfil_atual: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def _amostrar(segundos: float, intervalo: float, nome: str) -> None:
+    contagens: Counter = Counter()
+    propria = threading.get_ident()
+    fim = time.monotonic() + segundos
+    while time.monotonic() < fim:
+        nomes = _nomes_das_threads()
+        for ident, frame in sys._current_frames().items():
+            if ident != propria:
+                contar(contagens, ";".join([nomes.get(ident, str(ident))] + pilha(frame)))
+        time.sleep(intervalo)
+    gravar_folded(contagens, nome)
+
+
+def iniciar_perfil(segundos: float, intervalo_ms: float = 5) -> Optional[str]:
+    """
+    Começa um perfil de `segundos` em segundo plano e devolve o nome do arquivo
+    que será gravado ao final. Devolve None se já há um perfil rodando.
+    """
+    global _perfil_atual
+    with _lock:
+        if _perfil_atual is not None and _perfil_atual.is_alive():
+            return None
+        nome = f"perfil-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.folded"
+        _perfil_atual = threading.Thread(
+            target=_amostrar, args=(segundos, intervalo_ms / 1000, nome), name="perfilador", daemon=True
+        )
+        _perfil_atual.start()
+        return nome
+
+
+# ============================================
+# REQUISIÇÕES LENTAS
+# ============================================
+
+class _Vigia:
+    """Thread que fotografa a pilha das requisições que passaram do limite."""
+
+    def __init__(self, limite_ms: float):
+        self.limite = limite_ms / 1000
+        self.intervalo = max(self.limite / 4, 0.01)
+        self.em_andamento: Dict[int, list] = {}  # id -> [início, scope, thread do loop, amostras]
+        self.contagens: Counter = Counter()
+        self.lock = threading.Lock()
+        self.sujo = False
+        threading.Thread(target=self._vigiar, name="perfilador-lentas", daemon=True).start()
+
+    def _vigiar(self) -> None:
+        while True:
+            time.sleep(self.intervalo)
+            agora = time.perf_counter()
+            with self.lock:
+                lentas = [r for r in self.em_andamento.values()
+                          if agora - r[0] >= self.limite and r[3] < MAX_AMOSTRAS_POR_REQUISICAO]
+            if lentas:
+                self._fotografar(lentas)
+            elif self.sujo:
+                with self.lock:
+                    self.sujo = False
+                    contagens = Counter(self.contagens)
+                gravar_folded(contagens, ARQUIVO_LENTAS)
+
+    def _fotografar(self, lentas: list) -> None:
+        frames = sys._current_frames()
+        nomes = _nomes_das_threads()
+        # Threads do threadpool (endpoints síncronos) rodando código do backend.
+        # Com várias requisições lentas ao mesmo tempo, elas entram em todas.
+        trabalhando = {}
+        for ident, frame in frames.items():
+            if nomes.get(ident, "").startswith("AnyIO worker"):
+                quadros = pilha(frame)
+                if any(f"backend{os.sep}" in quadro for quadro in quadros):
+                    trabalhando[ident] = quadros
+        with self.lock:
+            for requisicao in lentas:
+                _, scope, thread_loop, _ = requisicao
+                rota = getattr(scope.get("route"), "path", scope.get("path", "?"))
+                raiz = f"{scope.get('method', '')} {rota}"
+                if thread_loop in frames:
+                    contar(self.contagens, ";".join([raiz, "event-loop"] + pilha(frames[thread_loop])))
+                for ident, quadros in trabalhando.items():
+                    contar(self.contagens, ";".join([raiz, nomes.get(ident, str(ident))] + quadros))
+                requisicao[3] += 1
+            self.sujo = True
+
+    def entrar(self, scope) -> int:
+        chave = id(scope)
+        with self.lock:
+            self.em_andamento[chave] = [time.perf_counter(), scope, threading.get_ident(), 0]
+        return chave
+
+    def sair(self, chave: int) -> None:
+        with self.lock:
+            self.em_andamento.pop(chave, None)
+
+
+class MiddlewareRequisicoesLentas:
+    """
+    Middleware ASGI: avisa o vigia do início de cada requisição HTTP e do envio
+    do cabeçalho da resposta. Mede só até o "http.response.start": depois dele o
+    tempo é do corpo (SSE em /api/divisao/{id}/eventos, /api/exportar em
+    streaming), que fica aberto ou esperando o cliente sem gastar CPU.
+    """
+
+    def __init__(self, app, limite_ms: float = LIMITE_LENTO_MS):
+        self.app = app
+        self.vigia = _Vigia(limite_ms)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        chave = self.vigia.entrar(scope)
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                self.vigia.sair(chave)
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            self.vigia.sair(chave)
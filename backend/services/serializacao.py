@@ -0,0 +1,53 @@
+# --- Anotações para Iniciantes ---
+# Este arquivo transforma as divisões que vêm do banco em JSON de resposta.
+# Os dados do banco já foram validados na escrita (pelos schemas e pelas
+# constraints das tabelas), então aqui montamos os dicionários direto,
+# sem passar de novo pela validação do Pydantic a cada requisição.
+# O formato é exatamente o mesmo dos schemas `Divisao`, `Item` e `Pessoa`.
+
+from fastapi.responses import ORJSONResponse
+
+from . import metricas
+
+# Respostas acima desse tamanho são comprimidas com gzip (ver main.py)
+TAMANHO_MINIMO_COMPRESSAO = 1024  # bytes
+
+
+def item_para_dict(item: dict) -> dict:
+    """Monta o JSON de um item (formato do schema Item)."""
+    return {
+        "id": str(item["id"]),
+        "nome": item["nome"],
+        "quantidade": float(item["quantidade"]),
+        "valor_unitario": float(item["valor_unitario"]),
+        "atribuido_a": {
+            str(pessoa_id): float(quantidade)
+            for pessoa_id, quantidade in item.get("atribuido_a", {}).items()
+        },
+    }
+
+
+def divisao_para_dict(divisao_db: dict) -> dict:
+    """Monta o JSON de uma divisão completa (formato do schema Divisao)."""
+    return {
+        "id": str(divisao_db["id"]),
+        "nome": divisao_db.get("nome") or "Divisão sem nome",
+        "itens": [item_para_dict(item) for item in divisao_db.get("itens", [])],
+        "pessoas": [
+            {"id": str(p["id"]), "nome": p["nome"]} for p in divisao_db.get("pessoas", [])
+        ],
+        "status": divisao_db.get("status", "em_andamento"),
+        "taxa_servico_percentual": float(divisao_db.get("taxa_servico_percentual", 10.0)),
+        "desconto_valor": float(divisao_db.get("desconto_valor", 0.0)),
+        "created_at": divisao_db.get("created_at"),
+        "versao": divisao_db.get("versao"),
+    }
+
+
+def resposta_json(conteudo, headers: dict = None, status_code: int = 200) -> ORJSONResponse:
+    """
+    Devolve o conteúdo já serializado com orjson.
+    Retornar uma Response direto faz o FastAPI pular a revalidação do response_model.
+    """
+    with metricas.fase("serializacao"):
+        return ORJSONResponse(content=conteudo, status_code=status_code, headers=headers)
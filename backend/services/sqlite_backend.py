@@ -0,0 +1,1143 @@
+# --- Anotações para Iniciantes ---
+# Banco local em SQLite, para rodar a API inteira sem internet (desenvolvimento,
+# benchmarks e instalações pequenas, de um servidor só). Ativado com
+# DB_BACKEND=sqlite (ver armazenamento.py).
+#
+# O ClienteSQLite imita a parte do cliente do Supabase que o db_service usa:
+#   db.table("itens").select("*").eq("divisao_id", id).order("ordem").execute()
+#   db.rpc("alterar_divisao", {...}).execute()
+# então o db_service funciona igual com qualquer um dos dois bancos.
+#
+# As tabelas seguem o database/01schema.md, com as colunas e tabelas dos
+# scripts seguintes (versao, snapshot, lápides, links e estatísticas). O que
+# no Postgres é trigger (tocar a divisão, lápides, estatísticas e o limite da
+# quantidade distribuída) também é trigger aqui. As funções SQL chamadas por
+# rpc() foram reescritas em Python, cada chamada em UMA transação e com os
+# mesmos códigos de erro (P0002, 22023, 23514).
+#
+# Diferenças em relação ao Supabase:
+#   - DECIMAL vira REAL e as datas são texto ISO 8601 em UTC;
+#   - updated_at é preenchido pelo próprio cliente em todo UPDATE;
+#   - as colunas agregadas do 06totais_incrementais.md não existem:
+#     totais_divisao_compacto soma as atribuições na hora (GROUP BY);
+#   - a busca só encontra "contém" (sem a busca aproximada do pg_trgm);
+#   - não há RLS: o backend já filtra por user_id, como com o service_role.
+#
+# Uma conexão só, protegida por um lock: as requisições são atendidas uma de
+# cada vez no banco (o SQLite só aceita uma escrita por vez de qualquer jeito).
+
+import re
+import sqlite3
+import threading
+import unicodedata
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Iterator, List, Optional
+
+import orjson
+from postgrest.exceptions import APIError
+
+
+# ============================================
+# ESQUEMA
+# ============================================
+
+ESQUEMA = """
+-- 01schema.md (sem a FK para auth.users: não há Supabase Auth aqui)
+CREATE TABLE IF NOT EXISTS profiles (
+    id TEXT PRIMARY KEY,
+    nome TEXT NOT NULL,
+    telefone TEXT,
+    avatar_url TEXT,
+    created_at TEXT NOT NULL DEFAULT (agora()),
+    updated_at TEXT NOT NULL DEFAULT (agora())
+);
+
+CREATE TABLE IF NOT EXISTS divisoes (
+    id TEXT PRIMARY KEY DEFAULT (novo_uuid()),
+    user_id TEXT NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    nome TEXT DEFAULT 'Divisão sem nome',
+    status TEXT NOT NULL DEFAULT 'em_andamento'
+        CHECK (status IN ('em_andamento', 'finalizada', 'cancelada')),
+    taxa_servico_percentual REAL NOT NULL DEFAULT 10.0
+        CHECK (taxa_servico_percentual >= 0 AND taxa_servico_percentual <= 100),
+    desconto_valor REAL NOT NULL DEFAULT 0.0 CHECK (desconto_valor >= 0),
+    created_at TEXT NOT NULL DEFAULT (agora()),
+    updated_at TEXT NOT NULL DEFAULT (agora()),
+    finalizada_at TEXT,
+    versao INTEGER NOT NULL DEFAULT 1,      -- 04versionamento.md
+    snapshot TEXT,                          -- 10snapshots.md (JSON)
+    estatisticas_em TEXT                    -- 13estatisticas.md
+);
+
+CREATE INDEX IF NOT EXISTS divisoes_status_idx ON divisoes(status);
+CREATE INDEX IF NOT EXISTS divisoes_user_id_updated_at_idx ON divisoes(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS divisoes_user_id_created_at_id_idx ON divisoes(user_id, created_at, id);
+
+CREATE TABLE IF NOT EXISTS itens (
+    id TEXT PRIMARY KEY DEFAULT (novo_uuid()),
+    divisao_id TEXT NOT NULL REFERENCES divisoes(id) ON DELETE CASCADE,
+    nome TEXT NOT NULL CHECK (length(nome) >= 1),
+    quantidade REAL NOT NULL DEFAULT 1 CHECK (quantidade >= 0),
+    valor_unitario REAL NOT NULL CHECK (valor_unitario >= 0),
+    ordem INTEGER DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT (agora()),
+    updated_at TEXT NOT NULL DEFAULT (agora())
+);
+
+CREATE INDEX IF NOT EXISTS itens_divisao_id_idx ON itens(divisao_id);
+
+CREATE TABLE IF NOT EXISTS pessoas (
+    id TEXT PRIMARY KEY DEFAULT (novo_uuid()),
+    divisao_id TEXT NOT NULL REFERENCES divisoes(id) ON DELETE CASCADE,
+    nome TEXT NOT NULL CHECK (length(nome) >= 1),
+    created_at TEXT NOT NULL DEFAULT (agora()),
+    updated_at TEXT NOT NULL DEFAULT (agora())
+);
+
+CREATE INDEX IF NOT EXISTS pessoas_divisao_id_idx ON pessoas(divisao_id);
+
+CREATE TABLE IF NOT EXISTS atribuicoes (
+    id TEXT PRIMARY KEY DEFAULT (novo_uuid()),
+    item_id TEXT NOT NULL REFERENCES itens(id) ON DELETE CASCADE,
+    pessoa_id TEXT NOT NULL REFERENCES pessoas(id) ON DELETE CASCADE,
+    quantidade REAL NOT NULL CHECK (quantidade >= 0),
+    created_at TEXT NOT NULL DEFAULT (agora()),
+    updated_at TEXT NOT NULL DEFAULT (agora()),
+    UNIQUE (item_id, pessoa_id)
+);
+
+CREATE INDEX IF NOT EXISTS atribuicoes_pessoa_id_idx ON atribuicoes(pessoa_id);
+
+-- 09sincronizacao.md
+CREATE TABLE IF NOT EXISTS divisoes_excluidas (
+    divisao_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    excluida_em TEXT NOT NULL DEFAULT (agora())
+);
+
+CREATE INDEX IF NOT EXISTS divisoes_excluidas_user_id_excluida_em_idx
+    ON divisoes_excluidas(user_id, excluida_em);
+
+-- 11compartilhamentos.md
+CREATE TABLE IF NOT EXISTS compartilhamentos (
+    token TEXT PRIMARY KEY,
+    divisao_id TEXT NOT NULL UNIQUE REFERENCES divisoes(id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    created_at TEXT NOT NULL DEFAULT (agora())
+);
+
+-- 13estatisticas.md
+CREATE TABLE IF NOT EXISTS estatisticas_mensais (
+    user_id TEXT NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    mes TEXT NOT NULL,
+    divisoes INTEGER NOT NULL DEFAULT 0,
+    total_gasto REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, mes)
+);
+
+CREATE TABLE IF NOT EXISTS estatisticas_itens (
+    user_id TEXT NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    nome_normalizado TEXT NOT NULL,
+    nome TEXT NOT NULL,
+    vezes INTEGER NOT NULL DEFAULT 0,
+    quantidade REAL NOT NULL DEFAULT 0,
+    total_gasto REAL NOT NULL DEFAULT 0,
+    ultima_vez TEXT,
+    PRIMARY KEY (user_id, nome_normalizado)
+);
+
+CREATE INDEX IF NOT EXISTS estatisticas_itens_user_id_vezes_idx
+    ON estatisticas_itens(user_id, vezes DESC);
+
+CREATE TABLE IF NOT EXISTS estatisticas_companhias (
+    user_id TEXT NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    nome_normalizado TEXT NOT NULL,
+    nome TEXT NOT NULL,
+    divisoes INTEGER NOT NULL DEFAULT 0,
+    total_pago REAL NOT NULL DEFAULT 0,
+    ultima_vez TEXT,
+    PRIMARY KEY (user_id, nome_normalizado)
+);
+
+CREATE INDEX IF NOT EXISTS estatisticas_companhias_user_id_divisoes_idx
+    ON estatisticas_companhias(user_id, divisoes DESC);
+
+
+-- TRIGGER: não distribuir mais do que a quantidade do item (06totais_incrementais.md)
+CREATE TRIGGER IF NOT EXISTS limitar_atribuicao_insert
+AFTER INSERT ON atribuicoes
+WHEN NEW.quantidade > 0
+BEGIN
+    SELECT RAISE(ABORT, 'Quantidade distribuída maior que disponível no item.')
+    WHERE (SELECT SUM(quantidade) FROM atribuicoes WHERE item_id = NEW.item_id)
+        > (SELECT quantidade FROM itens WHERE id = NEW.item_id) + 1e-9;
+END;
+
+CREATE TRIGGER IF NOT EXISTS limitar_atribuicao_update
+AFTER UPDATE OF quantidade ON atribuicoes
+WHEN NEW.quantidade > OLD.quantidade
+BEGIN
+    SELECT RAISE(ABORT, 'Quantidade distribuída maior que disponível no item.')
+    WHERE (SELECT SUM(quantidade) FROM atribuicoes WHERE item_id = NEW.item_id)
+        > (SELECT quantidade FROM itens WHERE id = NEW.item_id) + 1e-9;
+END;
+
+
+-- TRIGGER: lápide das divisões excluídas (09sincronizacao.md)
+CREATE TRIGGER IF NOT EXISTS registrar_divisao_excluida
+AFTER DELETE ON divisoes
+BEGIN
+    INSERT INTO divisoes_excluidas (divisao_id, user_id)
+    VALUES (OLD.id, OLD.user_id)
+    ON CONFLICT (divisao_id) DO UPDATE SET excluida_em = agora();
+END;
+
+
+-- TRIGGER: estatísticas ao excluir (13estatisticas.md); a de finalizar fica abaixo
+
+CREATE TRIGGER IF NOT EXISTS estatisticas_ao_excluir
+BEFORE DELETE ON divisoes
+WHEN OLD.estatisticas_em IS NOT NULL AND OLD.snapshot IS NOT NULL
+BEGIN
+    UPDATE estatisticas_mensais
+    SET divisoes = divisoes - 1,
+        total_gasto = total_gasto - total_do_snapshot(OLD.snapshot, OLD.desconto_valor, OLD.taxa_servico_percentual)
+    WHERE user_id = OLD.user_id AND mes = mes_local(COALESCE(OLD.finalizada_at, OLD.created_at));
+
+    UPDATE estatisticas_itens
+    SET vezes = vezes - 1,
+        quantidade = quantidade - (
+            SELECT SUM(json_extract(value, '$.quantidade'))
+            FROM json_each(OLD.snapshot, '$.divisao.itens')
+            WHERE normalizar_busca(json_extract(value, '$.nome')) = estatisticas_itens.nome_normalizado),
+        total_gasto = total_gasto - (
+            SELECT ROUND(SUM(json_extract(value, '$.quantidade') * json_extract(value, '$.valor_unitario')), 2)
+            FROM json_each(OLD.snapshot, '$.divisao.itens')
+            WHERE normalizar_busca(json_extract(value, '$.nome')) = estatisticas_itens.nome_normalizado)
+    WHERE user_id = OLD.user_id
+      AND nome_normalizado IN (
+          SELECT normalizar_busca(json_extract(value, '$.nome'))
+          FROM json_each(OLD.snapshot, '$.divisao.itens'));
+
+    UPDATE estatisticas_companhias
+    SET divisoes = divisoes - 1,
+        total_pago = total_pago - (
+            SELECT SUM(json_extract(value, '$.total'))
+            FROM json_each(OLD.snapshot, '$.totais.pessoas')
+            WHERE normalizar_busca(json_extract(value, '$.nome')) = estatisticas_companhias.nome_normalizado)
+    WHERE user_id = OLD.user_id
+      AND nome_normalizado IN (
+          SELECT normalizar_busca(json_extract(value, '$.nome'))
+          FROM json_each(OLD.snapshot, '$.totais.pessoas'));
+
+    DELETE FROM estatisticas_mensais WHERE user_id = OLD.user_id AND divisoes <= 0;
+    DELETE FROM estatisticas_itens WHERE user_id = OLD.user_id AND vezes <= 0;
+    DELETE FROM estatisticas_companhias WHERE user_id = OLD.user_id AND divisoes <= 0;
+END;
+"""
+
+# TRIGGER: estatísticas ao finalizar (13estatisticas.md). No Postgres é um
+# BEFORE que preenche NEW.estatisticas_em; aqui um AFTER grava a coluna.
+_ESTATISTICAS_AO_FINALIZAR = """
+CREATE TRIGGER IF NOT EXISTS estatisticas_ao_finalizar_{evento}
+AFTER {EVENTO} ON divisoes
+WHEN NEW.status = 'finalizada' AND NEW.snapshot IS NOT NULL AND NEW.estatisticas_em IS NULL
+BEGIN
+    INSERT INTO estatisticas_mensais (user_id, mes, divisoes, total_gasto)
+    VALUES (NEW.user_id, mes_local(COALESCE(NEW.finalizada_at, NEW.created_at)), 1,
+            total_do_snapshot(NEW.snapshot, NEW.desconto_valor, NEW.taxa_servico_percentual))
+    ON CONFLICT (user_id, mes) DO UPDATE
+    SET divisoes = divisoes + 1,
+        total_gasto = total_gasto + excluded.total_gasto;
+
+    INSERT INTO estatisticas_itens (user_id, nome_normalizado, nome, vezes, quantidade, total_gasto, ultima_vez)
+    SELECT NEW.user_id, normalizar_busca(json_extract(value, '$.nome')), MAX(json_extract(value, '$.nome')), 1,
+           SUM(json_extract(value, '$.quantidade')),
+           ROUND(SUM(json_extract(value, '$.quantidade') * json_extract(value, '$.valor_unitario')), 2),
+           COALESCE(NEW.finalizada_at, NEW.created_at)
+    FROM json_each(NEW.snapshot, '$.divisao.itens')
+    GROUP BY 2
+    ON CONFLICT (user_id, nome_normalizado) DO UPDATE
+    SET nome = excluded.nome,
+        vezes = vezes + 1,
+        quantidade = quantidade + excluded.quantidade,
+        total_gasto = total_gasto + excluded.total_gasto,
+        ultima_vez = MAX(COALESCE(ultima_vez, ''), excluded.ultima_vez);
+
+    INSERT INTO estatisticas_companhias (user_id, nome_normalizado, nome, divisoes, total_pago, ultima_vez)
+    SELECT NEW.user_id, normalizar_busca(json_extract(value, '$.nome')), MAX(json_extract(value, '$.nome')), 1,
+           SUM(json_extract(value, '$.total')), COALESCE(NEW.finalizada_at, NEW.created_at)
+    FROM json_each(NEW.snapshot, '$.totais.pessoas')
+    GROUP BY 2
+    ON CONFLICT (user_id, nome_normalizado) DO UPDATE
+    SET nome = excluded.nome,
+        divisoes = divisoes + 1,
+        total_pago = total_pago + excluded.total_pago,
+        ultima_vez = MAX(COALESCE(ultima_vez, ''), excluded.ultima_vez);
+
+    UPDATE divisoes SET estatisticas_em = agora() WHERE id = NEW.id;
+END;
+"""
+for _evento in ("INSERT", "UPDATE"):
+    ESQUEMA += _ESTATISTICAS_AO_FINALIZAR.replace("{evento}", _evento.lower()).replace("{EVENTO}", _evento)
+
+# TRIGGER: itens e pessoas alterados "tocam" a divisão (09sincronizacao.md)
+for _tabela in ("itens", "pessoas"):
+    for _evento, _linha in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        ESQUEMA += f"""
+CREATE TRIGGER IF NOT EXISTS tocar_divisao_{_tabela}_{_evento.lower()}
+AFTER {_evento} ON {_tabela}
+BEGIN
+    UPDATE divisoes SET updated_at = agora()
+    WHERE id = {_linha}.divisao_id AND updated_at < agora();
+END;
+"""
+
+# Chave de cada tabela (upsert sem on_conflict) e tabelas com updated_at
+CHAVES = {
+    "profiles": "id", "divisoes": "id", "itens": "id", "pessoas": "id", "atribuicoes": "id",
+    "divisoes_excluidas": "divisao_id", "compartilhamentos": "token",
+    "estatisticas_mensais": "user_id,mes",
+    "estatisticas_itens": "user_id,nome_normalizado",
+    "estatisticas_companhias": "user_id,nome_normalizado",
+}
+COM_UPDATED_AT = {"profiles", "divisoes", "itens", "pessoas", "atribuicoes"}
+COLUNAS_JSON = {"divisoes": {"snapshot"}}
+
+# Relações usadas em select("*, itens!inner(divisao_id)"): (tabela, embutida) -> coluna da FK
+RELACOES = {
+    ("atribuicoes", "itens"): "item_id",
+    ("atribuicoes", "pessoas"): "pessoa_id",
+    ("itens", "divisoes"): "divisao_id",
+    ("pessoas", "divisoes"): "divisao_id",
+    ("divisoes", "profiles"): "user_id",
+    ("compartilhamentos", "divisoes"): "divisao_id",
+}
+
+MARGEM_SINCRONIZACAO = timedelta(seconds=5)  # mesma margem do divisoes_alteradas_desde
+
+_IDENTIFICADOR = re.compile(r"[a-z_][a-z0-9_]*")
+_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE)
+_OPERADORES = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+# ============================================
+# FUNÇÕES SQL (registradas na conexão)
+# ============================================
+
+def agora() -> str:
+    """Instante atual no formato usado em todas as colunas de data."""
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+def instante(texto: str) -> str:
+    """Normaliza uma data ISO recebida de fora (ex: ...Z) para o formato das colunas."""
+    data = datetime.fromisoformat(texto.replace("Z", "+00:00"))
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=timezone.utc)
+    return data.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def normalizar_busca(texto: Optional[str]) -> Optional[str]:
+    """Minúsculas e sem acentos, como a normalizar_busca do 12busca.md."""
+    if texto is None:
+        return None
+    sem_acentos = "".join(
+        letra for letra in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(letra)
+    )
+    return sem_acentos.lower()
+
+
+def _centavos(valor: Decimal) -> Decimal:
+    return valor.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def total_do_snapshot(snapshot: str, desconto: float, taxa: float) -> float:
+    """Total da conta de uma divisão finalizada (mesma conta do aplicar_estatisticas_divisao)."""
+    itens = orjson.loads(snapshot)["divisao"]["itens"]
+    subtotal = _centavos(sum(
+        (Decimal(str(i["quantidade"])) * Decimal(str(i["valor_unitario"])) for i in itens), Decimal(0)
+    )) - Decimal(str(desconto))
+    return float(subtotal + _centavos(subtotal * Decimal(str(taxa)) / 100))
+
+
+def mes_local(quando: str) -> str:
+    """Primeiro dia do mês de `quando` no horário de Brasília (UTC-3, sem horário de verão)."""
+    data = datetime.fromisoformat(quando).astimezone(timezone(timedelta(hours=-3)))
+    return data.strftime("%Y-%m-01")
+
+
+def _registrar_funcoes(conexao: sqlite3.Connection) -> None:
+    conexao.create_function("agora", 0, agora)
+    conexao.create_function("novo_uuid", 0, lambda: str(uuid.uuid4()))
+    conexao.create_function("normalizar_busca", 1, normalizar_busca, deterministic=True)
+    conexao.create_function("total_do_snapshot", 3, total_do_snapshot, deterministic=True)
+    conexao.create_function("mes_local", 1, mes_local, deterministic=True)
+
+
+# ============================================
+# AUXILIARES
+# ============================================
+
+class Resposta:
+    """Mesmo formato da resposta do cliente do Supabase (`.data` e `.count`)."""
+
+    def __init__(self, data, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _erro(codigo: str, mensagem: str, detalhes: Optional[str] = None) -> APIError:
+    return APIError({"code": codigo, "message": mensagem, "details": detalhes, "hint": None})
+
+
+def _erro_de_integridade(e: sqlite3.IntegrityError) -> APIError:
+    """Traduz a violação de constraint do SQLite para o código do Postgres."""
+    mensagem = str(e)
+    if mensagem.startswith("UNIQUE"):
+        return _erro("23505", mensagem)
+    if mensagem.startswith("FOREIGN KEY"):
+        return _erro("23503", mensagem)
+    if mensagem.startswith("NOT NULL"):
+        return _erro("23502", mensagem)
+    return _erro("23514", mensagem)  # CHECK e o limite da quantidade distribuída
+
+
+def _ident(nome: str) -> str:
+    """Nome de tabela/coluna entre aspas (só aceita nomes simples, nada de SQL)."""
+    nome = nome.strip()
+    if not _IDENTIFICADOR.fullmatch(nome):
+        raise _erro("42703", f"Nome inválido: {nome}")
+    return f'"{nome}"'
+
+
+def _valor(valor):
+    """Valor Python -> parâmetro do SQLite (dicionários e listas viram JSON)."""
+    if isinstance(valor, (dict, list)):
+        return orjson.dumps(valor).decode()
+    if isinstance(valor, uuid.UUID):
+        return str(valor)
+    return valor
+
+
+def _json(valor) -> Optional[str]:
+    """Lista/objeto como texto JSON (para json_each); None continua None."""
+    return None if valor is None else orjson.dumps([str(v) for v in valor] if isinstance(valor, list) else valor).decode()
+
+
+def _separar(texto: str) -> List[str]:
+    """Separa por vírgulas fora de parênteses e aspas: 'a.eq.1,and(b.eq.2,c.eq.3)'."""
+    partes, atual, nivel, aspas = [], "", 0, False
+    for letra in texto:
+        if letra == '"':
+            aspas = not aspas
+        elif not aspas and letra == "(":
+            nivel += 1
+        elif not aspas and letra == ")":
+            nivel -= 1
+        elif not aspas and nivel == 0 and letra == ",":
+            partes.append(atual.strip())
+            atual = ""
+            continue
+        atual += letra
+    if atual.strip():
+        partes.append(atual.strip())
+    return partes
+
+
+def _sem_aspas(valor: str) -> str:
+    return valor[1:-1] if len(valor) >= 2 and valor[0] == valor[-1] == '"' else valor
+
+
+def _decodificar(linha: sqlite3.Row, colunas_json=()) -> dict:
+    registro = dict(linha)
+    for coluna in colunas_json:
+        if isinstance(registro.get(coluna), str):
+            registro[coluna] = orjson.loads(registro[coluna])
+    return registro
+
+
+def _linhas(conexao, sql: str, params=(), tabela: str = None) -> List[dict]:
+    colunas_json = COLUNAS_JSON.get(tabela, ())
+    return [_decodificar(linha, colunas_json) for linha in conexao.execute(sql, params).fetchall()]
+
+
+# ============================================
+# CONSULTAS (table(...).select/insert/update/delete)
+# ============================================
+
+class ConsultaLocal:
+    """Construtor de consultas no estilo do postgrest-py, executado no SQLite."""
+
+    def __init__(self, cliente: "ClienteSQLite", tabela: str):
+        self._cliente = cliente
+        self._tabela = tabela
+        self._nome = _ident(tabela)
+        self._operacao = "select"
+        self._colunas = "*"
+        self._filtros: List[str] = []
+        self._params: list = []
+        self._ordem: List[str] = []
+        self._limite: Optional[int] = None
+        self._deslocamento: Optional[int] = None
+        self._unico = False
+        self._talvez_unico = False
+        self._dados = None
+        self._conflito: Optional[str] = None
+        self._ignorar_duplicados = False
+
+    # --- Operações ---
+
+    def select(self, *colunas, count=None):
+        self._colunas = ",".join(colunas) or "*"
+        return self
+
+    def insert(self, dados, **_opcoes):
+        self._operacao, self._dados = "insert", dados
+        return self
+
+    def upsert(self, dados, on_conflict: str = "", ignore_duplicates: bool = False, **_opcoes):
+        self._operacao, self._dados = "upsert", dados
+        self._conflito = on_conflict or CHAVES[self._tabela]
+        self._ignorar_duplicados = ignore_duplicates
+        return self
+
+    def update(self, dados, **_opcoes):
+        self._operacao, self._dados = "update", dados
+        return self
+
+    def delete(self, **_opcoes):
+        self._operacao = "delete"
+        return self
+
+    # --- Filtros ---
+
+    def _coluna(self, nome: str) -> str:
+        if "." in nome:
+            tabela, coluna = nome.split(".", 1)
+            return f"{_ident(tabela)}.{_ident(coluna)}"
+        return f"t.{_ident(nome)}"
+
+    def _comparacao(self, coluna: str, operador: str, valor):
+        """Uma condição (sql, params) no formato dos filtros do PostgREST."""
+        if operador in _OPERADORES:
+            return f"{self._coluna(coluna)} {_OPERADORES[operador]} ?", [_valor(valor)]
+        if operador == "is":
+            literal = {"null": "NULL", "true": "1", "false": "0"}[str(valor).lower()]
+            return f"{self._coluna(coluna)} IS {literal}", []
+        if operador == "in":
+            if isinstance(valor, str):
+                valor = [_sem_aspas(v) for v in _separar(valor.strip("()"))]
+            valores = [_valor(v) for v in valor]
+            if not valores:
+                return "0", []
+            return f"{self._coluna(coluna)} IN ({', '.join('?' * len(valores))})", valores
+        raise _erro("PGRST100", f"Operador não suportado: {operador}")
+
+    def _filtrar(self, coluna: str, operador: str, valor):
+        sql, params = self._comparacao(coluna, operador, valor)
+        self._filtros.append(sql)
+        self._params.extend(params)
+        return self
+
+    def eq(self, coluna, valor): return self._filtrar(coluna, "eq", valor)
+    def neq(self, coluna, valor): return self._filtrar(coluna, "neq", valor)
+    def gt(self, coluna, valor): return self._filtrar(coluna, "gt", valor)
+    def gte(self, coluna, valor): return self._filtrar(coluna, "gte", valor)
+    def lt(self, coluna, valor): return self._filtrar(coluna, "lt", valor)
+    def lte(self, coluna, valor): return self._filtrar(coluna, "lte", valor)
+    def is_(self, coluna, valor): return self._filtrar(coluna, "is", "null" if valor is None else valor)
+    def in_(self, coluna, valores): return self._filtrar(coluna, "in", list(valores))
+
+    def _logica(self, texto: str, juncao: str):
+        condicoes, params = [], []
+        for parte in _separar(texto):
+            grupo = re.fullmatch(r"(and|or)\((.*)\)", parte, re.DOTALL)
+            if grupo:
+                sql, valores = self._logica(grupo.group(2), grupo.group(1).upper())
+            else:
+                coluna, operador, valor = parte.split(".", 2)
+                sql, valores = self._comparacao(coluna, operador, _sem_aspas(valor))
+            condicoes.append(sql)
+            params.extend(valores)
+        return "(" + f" {juncao} ".join(condicoes) + ")", params
+
+    def or_(self, filtros: str, **_opcoes):
+        """Filtro composto: 'created_at.lt."x",and(created_at.eq."x",id.lt.y)'."""
+        sql, params = self._logica(filtros, "OR")
+        self._filtros.append(sql)
+        self._params.extend(params)
+        return self
+
+    # --- Ordem e paginação ---
+
+    def order(self, coluna: str, desc: bool = False, nullsfirst: bool = False, **_opcoes):
+        # Mesma ordem dos nulos do Postgres: por último no ASC, primeiro no DESC
+        nulos = "FIRST" if desc or nullsfirst else "LAST"
+        self._ordem.append(f"{self._coluna(coluna)} {'DESC' if desc else 'ASC'} NULLS {nulos}")
+        return self
+
+    def limit(self, quantidade: int, **_opcoes):
+        self._limite = int(quantidade)
+        return self
+
+    def offset(self, quantidade: int, **_opcoes):
+        self._deslocamento = int(quantidade)
+        return self
+
+    def range(self, inicio: int, fim: int, **_opcoes):
+        self._deslocamento, self._limite = int(inicio), int(fim) - int(inicio) + 1
+        return self
+
+    def single(self):
+        self._unico = True
+        return self
+
+    def maybe_single(self):
+        self._talvez_unico = True
+        return self
+
+    # --- Execução ---
+
+    def _where(self) -> str:
+        return f" WHERE {' AND '.join(self._filtros)}" if self._filtros else ""
+
+    def _sql_select(self):
+        colunas, juncoes, colunas_json = [], [], set(COLUNAS_JSON.get(self._tabela, ()))
+        for parte in _separar(self._colunas):
+            embutida = re.fullmatch(r"(\w+)(!inner)?\(([^)]*)\)", parte)
+            if embutida:
+                tabela, interna, campos = embutida.groups()
+                chave = RELACOES.get((self._tabela, tabela))
+                if not chave:
+                    raise _erro("PGRST200", f"Sem relação entre {self._tabela} e {tabela}")
+                nome = _ident(tabela)
+                juncoes.append(f"{'JOIN' if interna else 'LEFT JOIN'} {nome} ON {nome}.id = t.{_ident(chave)}")
+                pares = ", ".join(f"'{c.strip()}', {nome}.{_ident(c)}" for c in campos.split(","))
+                colunas.append(f"CASE WHEN {nome}.id IS NULL THEN NULL ELSE json_object({pares}) END AS {nome}")
+                colunas_json.add(tabela)
+            elif parte == "*":
+                colunas.append("t.*")
+            else:
+                colunas.append(f"t.{_ident(parte)}")
+
+        sql = f"SELECT {', '.join(colunas)} FROM {self._nome} AS t {' '.join(juncoes)}{self._where()}"
+        if self._ordem:
+            sql += f" ORDER BY {', '.join(self._ordem)}"
+        if self._limite is not None or self._deslocamento is not None:
+            sql += f" LIMIT {self._limite if self._limite is not None else -1} OFFSET {self._deslocamento or 0}"
+        return sql, colunas_json
+
+    def _inserir(self, conexao) -> List[dict]:
+        linhas = self._dados if isinstance(self._dados, list) else [self._dados]
+        criadas = []
+        for linha in linhas:
+            colunas = [_ident(c) for c in linha]
+            sql = f"INSERT INTO {self._nome} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})"
+            if self._operacao == "upsert":
+                conflito = [_ident(c) for c in self._conflito.split(",")]
+                alteradas = [c for c in colunas if c not in conflito]
+                if self._tabela in COM_UPDATED_AT and '"updated_at"' not in colunas:
+                    alteradas.append('"updated_at"')
+                if self._ignorar_duplicados or not alteradas:
+                    sql += f" ON CONFLICT ({', '.join(conflito)}) DO NOTHING"
+                else:
+                    atribuicoes = ", ".join(
+                        "\"updated_at\" = agora()" if c == '"updated_at"' and c not in colunas else f"{c} = excluded.{c}"
+                        for c in alteradas
+                    )
+                    sql += f" ON CONFLICT ({', '.join(conflito)}) DO UPDATE SET {atribuicoes}"
+            criadas.extend(_linhas(conexao, sql + " RETURNING *", [_valor(v) for v in linha.values()], self._tabela))
+        return criadas
+
+    def _atualizar(self, conexao) -> List[dict]:
+        colunas = [_ident(c) for c in self._dados]
+        atribuicoes = [f"{c} = ?" for c in colunas]
+        if self._tabela in COM_UPDATED_AT and '"updated_at"' not in colunas:
+            atribuicoes.append('"updated_at" = agora()')
+        sql = f"UPDATE {self._nome} AS t SET {', '.join(atribuicoes)}{self._where()} RETURNING *"
+        return _linhas(conexao, sql, [_valor(v) for v in self._dados.values()] + self._params, self._tabela)
+
+    def execute(self) -> Resposta:
+        if self._operacao == "select":
+            sql, colunas_json = self._sql_select()
+            with self._cliente.leitura() as conexao:
+                linhas = [_decodificar(linha, colunas_json) for linha in conexao.execute(sql, self._params).fetchall()]
+        else:
+            with self._cliente.transacao() as conexao:
+                if self._operacao in ("insert", "upsert"):
+                    linhas = self._inserir(conexao)
+                elif self._operacao == "update":
+                    linhas = self._atualizar(conexao)
+                else:
+                    sql = f"DELETE FROM {self._nome} AS t{self._where()} RETURNING *"
+                    linhas = _linhas(conexao, sql, self._params, self._tabela)
+
+        if self._unico:
+            if len(linhas) != 1:
+                raise _erro("PGRST116", "JSON object requested, multiple (or no) rows returned",
+                            f"The result contains {len(linhas)} rows")
+            return Resposta(linhas[0])
+        if self._talvez_unico:
+            return Resposta(linhas[0] if linhas else None)
+        return Resposta(linhas, count=len(linhas))
+
+
+class ChamadaLocal:
+    """Equivalente ao db.rpc(nome, params): executa a função em UMA transação."""
+
+    def __init__(self, cliente: "ClienteSQLite", nome: str, params: Optional[dict]):
+        self._cliente = cliente
+        self._nome = nome
+        self._params = params or {}
+
+    def execute(self) -> Resposta:
+        funcao = FUNCOES.get(self._nome)
+        if funcao is None:
+            raise _erro("PGRST202", f"Could not find the function public.{self._nome}")
+        with self._cliente.transacao() as conexao:
+            return Resposta(funcao(conexao, **self._params))
+
+
+# ============================================
+# CLIENTE
+# ============================================
+
+class ClienteSQLite:
+    """Cliente com a mesma interface do cliente admin do Supabase, sobre um arquivo SQLite."""
+
+    def __init__(self, caminho: str, usuario_local: Optional[str] = None):
+        self.caminho = caminho
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conexao.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        self._em_transacao = 0
+        _registrar_funcoes(self._conexao)
+        self._conexao.execute("PRAGMA foreign_keys = ON")
+        if caminho != ":memory:":
+            self._conexao.execute("PRAGMA journal_mode = WAL")
+            self._conexao.execute("PRAGMA synchronous = NORMAL")
+        self._conexao.executescript(ESQUEMA)
+        if usuario_local:
+            # Sem Supabase Auth, o perfil do usuário local é criado aqui
+            self._conexao.execute(
+                "INSERT OR IGNORE INTO profiles (id, nome) VALUES (?, ?)", (usuario_local, "Usuário local")
+            )
+
+    def table(self, tabela: str) -> ConsultaLocal:
+        return ConsultaLocal(self, tabela)
+
+    from_ = table
+
+    def rpc(self, nome: str, params: Optional[dict] = None) -> ChamadaLocal:
+        return ChamadaLocal(self, nome, params)
+
+    @contextmanager
+    def leitura(self) -> Iterator[sqlite3.Connection]:
+        """Conexão para uma leitura (dentro ou fora de uma transação)."""
+        with self._lock:
+            yield self._conexao
+
+    @contextmanager
+    def transacao(self) -> Iterator[sqlite3.Connection]:
+        """
+        Transação: tudo o que for feito dentro do bloco é gravado junto ou
+        desfeito junto (em caso de exceção). Pode ser aninhada; só a de fora
+        faz o COMMIT/ROLLBACK.
+        """
+        with self._lock:
+            externa = self._em_transacao == 0
+            if externa:
+                self._conexao.execute("BEGIN IMMEDIATE")
+            self._em_transacao += 1
+            try:
+                yield self._conexao
+            except BaseException as e:
+                self._em_transacao -= 1
+                if externa:
+                    self._conexao.execute("ROLLBACK")
+                if isinstance(e, sqlite3.IntegrityError):
+                    raise _erro_de_integridade(e) from e
+                raise
+            else:
+                self._em_transacao -= 1
+                if externa:
+                    self._conexao.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conexao.close()
+
+
+# ============================================
+# FUNÇÕES RPC (mesmos nomes e parâmetros das funções SQL)
+# Recebem a conexão já dentro de uma transação.
+# ============================================
+
+def reservar_versao_divisao(conexao, p_divisao_id, p_versao_esperada=None, p_user_id=None,
+                            p_permitir_finalizada=False) -> List[dict]:
+    """10snapshots.md: incrementa a versão (If-Match) e recusa divisões finalizadas."""
+    return _linhas(conexao, """
+        UPDATE divisoes
+        SET versao = versao + 1, updated_at = agora()
+        WHERE id = :divisao_id
+          AND (:versao IS NULL OR versao = :versao)
+          AND (:user_id IS NULL OR user_id = :user_id)
+          AND (:permitir OR status <> 'finalizada')
+        RETURNING *
+    """, {"divisao_id": p_divisao_id, "versao": p_versao_esperada, "user_id": p_user_id,
+          "permitir": bool(p_permitir_finalizada)}, "divisoes")
+
+
+def _conferir_ids_da_divisao(conexao, divisao_id, item_ids, pessoa_ids) -> None:
+    """07atribuicoes_em_lote.md: todos os IDs informados são da divisão?"""
+    for tabela, ids, mensagem in (("itens", item_ids, "Item não encontrado na divisão."),
+                                  ("pessoas", pessoa_ids, "Pessoa não encontrada na divisão.")):
+        if ids is None:
+            continue
+        distintos = {str(i) for i in ids}
+        encontrados = conexao.execute(
+            f"SELECT COUNT(*) FROM {tabela} WHERE divisao_id = ? AND id IN (SELECT value FROM json_each(?))",
+            (divisao_id, _json(list(distintos))),
+        ).fetchone()[0]
+        if encontrados != len(distintos):
+            raise _erro("P0002", mensagem)
+
+
+def substituir_atribuicoes(conexao, p_divisao_id, p_item_ids, p_atribuicoes=None) -> int:
+    """07atribuicoes_em_lote.md: troca as atribuições de vários itens de uma vez."""
+    atribuicoes = p_atribuicoes or []
+    item_ids = [str(i) for i in p_item_ids or []]
+    if not {str(a["item_id"]) for a in atribuicoes} <= set(item_ids):
+        raise _erro("22023", "Atribuição para item fora da lista de itens substituídos.")
+    _conferir_ids_da_divisao(conexao, p_divisao_id, item_ids, [str(a["pessoa_id"]) for a in atribuicoes])
+
+    conexao.execute("DELETE FROM atribuicoes WHERE item_id IN (SELECT value FROM json_each(?))", (_json(item_ids),))
+    cursor = conexao.execute("""
+        INSERT INTO atribuicoes (item_id, pessoa_id, quantidade)
+        SELECT json_extract(value, '$.item_id'), json_extract(value, '$.pessoa_id'),
+               CAST(json_extract(value, '$.quantidade') AS REAL)
+        FROM json_each(?)
+        WHERE CAST(json_extract(value, '$.quantidade') AS REAL) > 0
+    """, (orjson.dumps(atribuicoes, default=str).decode(),))
+    return cursor.rowcount
+
+
+def distribuir_em_lote(conexao, p_divisao_id, p_operacao, p_item_ids=None, p_pessoa_ids=None) -> int:
+    """07atribuicoes_em_lote.md: dividir igualmente, atribuir tudo a uma pessoa ou limpar."""
+    if p_operacao not in ("dividir_igualmente", "atribuir_tudo", "limpar"):
+        raise _erro("22023", f"Operação inválida: {p_operacao}")
+    if p_operacao == "atribuir_tudo" and len(p_pessoa_ids or []) != 1:
+        raise _erro("22023", "Informe exatamente uma pessoa para atribuir tudo.")
+    _conferir_ids_da_divisao(conexao, p_divisao_id, p_item_ids, p_pessoa_ids)
+
+    params = {"divisao_id": p_divisao_id, "item_ids": _json(p_item_ids), "pessoa_ids": _json(p_pessoa_ids)}
+    filtro_itens = "divisao_id = :divisao_id AND (:item_ids IS NULL OR id IN (SELECT value FROM json_each(:item_ids)))"
+    filtro_pessoas = "divisao_id = :divisao_id AND (:pessoa_ids IS NULL OR id IN (SELECT value FROM json_each(:pessoa_ids)))"
+
+    conexao.execute(f"DELETE FROM atribuicoes WHERE item_id IN (SELECT id FROM itens WHERE {filtro_itens})", params)
+
+    if p_operacao == "atribuir_tudo":
+        cursor = conexao.execute(f"""
+            INSERT INTO atribuicoes (item_id, pessoa_id, quantidade)
+            SELECT id, :pessoa_id, quantidade FROM itens
+            WHERE {filtro_itens} AND quantidade > 0
+        """, {**params, "pessoa_id": str(p_pessoa_ids[0])})
+        return cursor.rowcount
+
+    if p_operacao == "dividir_igualmente":
+        # Milésimos divididos em partes iguais; o resto vai para pessoas diferentes
+        # em cada item (rodízio pela posição), exatamente como no Postgres
+        cursor = conexao.execute(f"""
+            INSERT INTO atribuicoes (item_id, pessoa_id, quantidade)
+            SELECT item_id, pessoa_id, milesimos / 1000.0
+            FROM (
+                SELECT i.id AS item_id, p.id AS pessoa_id,
+                       i.milesimos / n.total
+                           + CASE WHEN ((p.posicao - i.posicao) % n.total + n.total) % n.total
+                                       < i.milesimos % n.total
+                                  THEN 1 ELSE 0 END AS milesimos
+                FROM (
+                    SELECT id, CAST(ROUND(quantidade * 1000) AS INTEGER) AS milesimos,
+                           ROW_NUMBER() OVER (ORDER BY ordem, created_at, id) - 1 AS posicao
+                    FROM itens WHERE {filtro_itens}
+                ) i
+                CROSS JOIN (
+                    SELECT id, ROW_NUMBER() OVER (ORDER BY created_at, id) - 1 AS posicao
+                    FROM pessoas WHERE {filtro_pessoas}
+                ) p
+                CROSS JOIN (SELECT COUNT(*) AS total FROM pessoas WHERE {filtro_pessoas}) n
+            )
+            WHERE milesimos > 0
+        """, params)
+        return cursor.rowcount
+
+    return 0
+
+
+def _resolver_referencia(refs: dict, referencia: str) -> str:
+    """08operacoes_em_lote.md: ref temporária (ex: "item-1") ou UUID."""
+    if referencia in refs:
+        return refs[referencia]
+    if referencia and _UUID.fullmatch(referencia):
+        return referencia.lower()
+    raise _erro("P0002", f"Referência desconhecida: {referencia}")
+
+
+def _aplicar_operacao(conexao, divisao_id: str, op: dict, refs: dict) -> None:
+    tipo = op.get("tipo")
+
+    if tipo == "renomear":
+        conexao.execute("UPDATE divisoes SET nome = ?, updated_at = agora() WHERE id = ?", (op.get("nome"), divisao_id))
+
+    elif tipo == "configurar":
+        conexao.execute(
+            "UPDATE divisoes SET taxa_servico_percentual = ?, desconto_valor = ?, updated_at = agora() WHERE id = ?",
+            (op.get("taxa_servico_percentual"), op.get("desconto_valor"), divisao_id),
+        )
+
+    elif tipo == "adicionar_item":
+        novo_id = conexao.execute(
+            "INSERT INTO itens (divisao_id, nome, quantidade, valor_unitario) VALUES (?, ?, ?, ?) RETURNING id",
+            (divisao_id, op.get("nome"), op.get("quantidade"), op.get("valor_unitario")),
+        ).fetchone()[0]
+        if op.get("ref") is not None:
+            refs[op["ref"]] = novo_id
+
+    elif tipo in ("editar_item", "remover_item"):
+        item_id = _resolver_referencia(refs, op.get("item_id"))
+        if tipo == "editar_item":
+            cursor = conexao.execute(
+                "UPDATE itens SET nome = ?, quantidade = ?, valor_unitario = ?, updated_at = agora() "
+                "WHERE id = ? AND divisao_id = ?",
+                (op.get("nome"), op.get("quantidade"), op.get("valor_unitario"), item_id, divisao_id),
+            )
+        else:
+            cursor = conexao.execute("DELETE FROM itens WHERE id = ? AND divisao_id = ?", (item_id, divisao_id))
+        if cursor.rowcount == 0:
+            raise _erro("P0002", "Item não encontrado na divisão.")
+
+    elif tipo == "adicionar_pessoa":
+        nome = op.get("nome") or ""
+        existentes = conexao.execute("SELECT nome FROM pessoas WHERE divisao_id = ?", (divisao_id,)).fetchall()
+        if any(linha[0].lower() == nome.lower() for linha in existentes):
+            raise _erro("22023", f"Pessoa '{nome}' já existe na divisão.")
+        novo_id = conexao.execute(
+            "INSERT INTO pessoas (divisao_id, nome) VALUES (?, ?) RETURNING id", (divisao_id, nome)
+        ).fetchone()[0]
+        if op.get("ref") is not None:
+            refs[op["ref"]] = novo_id
+
+    elif tipo == "remover_pessoa":
+        pessoa_id = _resolver_referencia(refs, op.get("pessoa_id"))
+        cursor = conexao.execute("DELETE FROM pessoas WHERE id = ? AND divisao_id = ?", (pessoa_id, divisao_id))
+        if cursor.rowcount == 0:
+            raise _erro("P0002", "Pessoa não encontrada na divisão.")
+
+    elif tipo == "distribuir_item":
+        item_id = _resolver_referencia(refs, op.get("item_id"))
+        substituir_atribuicoes(conexao, divisao_id, [item_id], [
+            {"item_id": item_id,
+             "pessoa_id": _resolver_referencia(refs, parte.get("pessoa_id")),
+             "quantidade": parte.get("quantidade")}
+            for parte in op.get("distribuicao") or []
+        ])
+
+    elif tipo == "distribuir_lote":
+        # Lista vazia ou ausente = todos (como o array_agg vazio do Postgres)
+        item_ids = [_resolver_referencia(refs, x) for x in op.get("item_ids") or []] or None
+        pessoa_ids = [_resolver_referencia(refs, x) for x in op.get("pessoa_ids") or []] or None
+        distribuir_em_lote(conexao, divisao_id, op.get("operacao"), item_ids, pessoa_ids)
+
+    else:
+        raise _erro("22023", f"Tipo de operação desconhecido: {tipo}")
+
+
+def aplicar_operacoes_divisao(conexao, p_divisao_id, p_operacoes) -> dict:
+    """08operacoes_em_lote.md: aplica as operações em ordem; se uma falha, nenhuma vale."""
+    refs = {}
+    for indice, op in enumerate(p_operacoes or [], start=1):
+        try:
+            _aplicar_operacao(conexao, p_divisao_id, op, refs)
+        except APIError as e:
+            raise _erro(e.code, f"Operação {indice}: {e.message}") from e
+        except sqlite3.IntegrityError as e:
+            erro = _erro_de_integridade(e)
+            raise _erro(erro.code, f"Operação {indice}: {erro.message}") from e
+    return refs
+
+
+def alterar_divisao(conexao, p_divisao_id, p_operacoes, p_versao_esperada=None, p_user_id=None) -> Optional[dict]:
+    """15alteracoes_atomicas.md: incrementa a versão e aplica as operações na mesma transação."""
+    if not reservar_versao_divisao(conexao, p_divisao_id, p_versao_esperada, p_user_id):
+        return None
+    refs = aplicar_operacoes_divisao(conexao, p_divisao_id, p_operacoes)
+    divisao = _linhas(conexao, "SELECT * FROM divisoes WHERE id = ?", (p_divisao_id,), "divisoes")[0]
+    return {"divisao": divisao, "referencias": refs}
+
+
+def totais_divisao_compacto(conexao, p_divisao_id) -> Optional[dict]:
+    """
+    06totais_incrementais.md: consumo de cada pessoa e progresso da divisão.
+    Sem as colunas agregadas, as somas são feitas aqui mesmo (GROUP BY).
+    """
+    divisao = conexao.execute(
+        "SELECT taxa_servico_percentual, desconto_valor FROM divisoes WHERE id = ?", (p_divisao_id,)
+    ).fetchone()
+    if divisao is None:
+        return None
+
+    itens = conexao.execute("""
+        SELECT COALESCE(SUM(i.quantidade * i.valor_unitario), 0),
+               COALESCE(SUM(i.quantidade), 0),
+               COALESCE(SUM(COALESCE(a.atribuida, 0)), 0),
+               COUNT(i.id),
+               COALESCE(SUM(ROUND(i.quantidade, 3) > ROUND(COALESCE(a.atribuida, 0), 3)), 0)
+        FROM itens i
+        LEFT JOIN (
+            SELECT item_id, SUM(quantidade) AS atribuida FROM atribuicoes GROUP BY item_id
+        ) a ON a.item_id = i.id
+        WHERE i.divisao_id = ?
+    """, (p_divisao_id,)).fetchone()
+
+    pessoas = conexao.execute("""
+        SELECT p.id, p.nome, COALESCE(SUM(a.quantidade * i.valor_unitario), 0)
+        FROM pessoas p
+        LEFT JOIN atribuicoes a ON a.pessoa_id = p.id
+        LEFT JOIN itens i ON i.id = a.item_id
+        WHERE p.divisao_id = ?
+        GROUP BY p.id
+        ORDER BY p.created_at, p.id
+    """, (p_divisao_id,)).fetchall()
+
+    consumo = {}
+    for pessoa_id, nome, quantidade, valor in conexao.execute("""
+        SELECT a.pessoa_id, i.nome, a.quantidade, a.quantidade * i.valor_unitario
+        FROM atribuicoes a
+        JOIN itens i ON i.id = a.item_id
+        WHERE i.divisao_id = ? AND a.quantidade > 0
+        ORDER BY i.ordem, i.created_at, i.id
+    """, (p_divisao_id,)):
+        consumo.setdefault(pessoa_id, []).append([nome, quantidade, valor])
+
+    return {
+        "taxa_servico_percentual": divisao[0],
+        "desconto_valor": divisao[1],
+        "subtotal_geral": itens[0],
+        "quantidade_total": itens[1],
+        "quantidade_distribuida": itens[2],
+        "itens_total": itens[3],
+        "itens_restantes": itens[4],
+        "pessoas": [
+            {"nome": nome, "subtotal": subtotal, "itens": consumo.get(pessoa_id, [])}
+            for pessoa_id, nome, subtotal in pessoas
+        ],
+    }
+
+
+def divisoes_alteradas_desde(conexao, p_user_id, p_desde, p_margem=None) -> dict:
+    """09sincronizacao.md: divisões alteradas e excluídas depois de `p_desde`."""
+    desde = instante(p_desde)
+    divisoes = _linhas(
+        conexao, "SELECT * FROM divisoes WHERE user_id = ? AND updated_at > ? ORDER BY created_at DESC",
+        (p_user_id, desde), "divisoes",
+    )
+    excluidas = [linha[0] for linha in conexao.execute(
+        "SELECT divisao_id FROM divisoes_excluidas WHERE user_id = ? AND excluida_em > ?", (p_user_id, desde)
+    )]
+    sincronizado_em = datetime.now(timezone.utc) - MARGEM_SINCRONIZACAO
+    return {
+        "divisoes": divisoes,
+        "excluidas": excluidas,
+        "sincronizado_em": sincronizado_em.isoformat(timespec="microseconds"),
+    }
+
+
+def limpar_divisoes_excluidas(conexao, p_dias=90) -> int:
+    """09sincronizacao.md: apaga as lápides mais antigas que `p_dias` dias."""
+    limite = (datetime.now(timezone.utc) - timedelta(days=p_dias)).isoformat(timespec="microseconds")
+    return conexao.execute("DELETE FROM divisoes_excluidas WHERE excluida_em < ?", (limite,)).rowcount
+
+
+def divisao_compartilhada(conexao, p_token) -> Optional[dict]:
+    """11compartilhamentos.md: conteúdo da página pública de um link."""
+    linha = conexao.execute("""
+        SELECT d.nome, d.finalizada_at, d.taxa_servico_percentual, d.desconto_valor,
+               json_extract(d.snapshot, '$.totais')
+        FROM compartilhamentos c
+        JOIN divisoes d ON d.id = c.divisao_id
+        WHERE c.token = ? AND d.snapshot IS NOT NULL
+    """, (p_token,)).fetchone()
+    if linha is None:
+        return None
+    return {
+        "nome": linha[0],
+        "finalizada_at": linha[1],
+        "taxa_servico_percentual": linha[2],
+        "desconto_valor": linha[3],
+        "totais": orjson.loads(linha[4]),
+    }
+
+
+def buscar_historico(conexao, p_user_id, p_termo, p_limite=20, p_offset=0) -> dict:
+    """12busca.md, só com o "contém" (o SQLite não tem a busca aproximada do pg_trgm)."""
+    termo = normalizar_busca(p_termo.strip())
+    padrao = "%" + termo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    linhas = conexao.execute("""
+        WITH encontrados AS (
+            SELECT 'divisao' AS tipo, d.id AS divisao_id, NULL AS item_id, d.created_at, 0 AS ordem
+            FROM divisoes d
+            WHERE d.user_id = :user_id AND normalizar_busca(d.nome) LIKE :padrao ESCAPE '\\'
+            UNION ALL
+            SELECT 'item', d.id, i.id, d.created_at, 1 + i.ordem
+            FROM itens i
+            JOIN divisoes d ON d.id = i.divisao_id
+            WHERE d.user_id = :user_id AND normalizar_busca(i.nome) LIKE :padrao ESCAPE '\\'
+        )
+        SELECT e.tipo, d.id, d.nome, d.status, d.created_at, i.id, i.nome, i.quantidade, i.valor_unitario
+        FROM encontrados e
+        JOIN divisoes d ON d.id = e.divisao_id
+        LEFT JOIN itens i ON i.id = e.item_id
+        ORDER BY e.created_at DESC, e.divisao_id, e.ordem, e.item_id NULLS LAST
+        LIMIT :limite OFFSET :offset
+    """, {"user_id": p_user_id, "padrao": padrao, "limite": p_limite + 1, "offset": p_offset}).fetchall()
+
+    resultados = [
+        {
+            "tipo": linha[0],
+            "divisao": {"id": linha[1], "nome": linha[2], "status": linha[3], "created_at": linha[4]},
+            "item": None if linha[5] is None else {
+                "id": linha[5], "nome": linha[6], "quantidade": linha[7], "valor_unitario": linha[8]
+            },
+        }
+        for linha in linhas
+    ]
+    # A linha extra só indica a próxima página
+    return {"resultados": resultados[:p_limite], "tem_mais": len(resultados) > p_limite}
+
+
+def processar_estatisticas_pendentes(conexao, p_lote=200) -> int:
+    """13estatisticas.md: conta nas estatísticas até `p_lote` divisões finalizadas pendentes."""
+    return conexao.execute("""
+        UPDATE divisoes SET status = status, updated_at = agora()
+        WHERE id IN (
+            SELECT id FROM divisoes
+            WHERE status = 'finalizada' AND estatisticas_em IS NULL AND snapshot IS NOT NULL
+            LIMIT ?
+        )
+    """, (p_lote,)).rowcount
+
+
+FUNCOES = {
+    "reservar_versao_divisao": reservar_versao_divisao,
+    "alterar_divisao": alterar_divisao,
+    "totais_divisao_compacto": totais_divisao_compacto,
+    "divisoes_alteradas_desde": divisoes_alteradas_desde,
+    "limpar_divisoes_excluidas": limpar_divisoes_excluidas,
+    "divisao_compartilhada": divisao_compartilhada,
+    "buscar_historico": buscar_historico,
+    "processar_estatisticas_pendentes": processar_estatisticas_pendentes,
+}
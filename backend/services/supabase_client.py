@@ -2,48 +2,71 @@
 # Este arquivo configura a conexão com o Supabase.
 # O Supabase é nosso banco de dados e sistema de autenticação.
 # Exportamos o cliente 'supabase' para ser usado em outros arquivos.
+#
+# Os clientes são criados no primeiro uso (get_supabase / get_supabase_admin),
+# não no import: importar o pacote supabase e abrir os clientes custa tempo na
+# subida do servidor, e no modo sqlite eles nem são usados.
 
 import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
+import threading
 import logging
+from typing import TYPE_CHECKING
+
+from . import ambiente  # noqa: F401 (carrega o .env)
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 # Configura logging
 logger = logging.getLogger(__name__)
 
-# Carrega variáveis de ambiente
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
-
 # Pega as credenciais do .env
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-# Valida se as credenciais existem
-if not SUPABASE_URL or not SUPABASE_ANON_KEY:
-    logger.warning("⚠️ Credenciais do Supabase não configuradas. Algumas funcionalidades não vão funcionar.")
-    supabase: Client | None = None
-    supabase_admin: Client | None = None
-else:
-    # Cliente normal (respeita RLS - Row Level Security)
-    # Use este para operações de usuários logados
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-    
-    # Cliente admin (bypassa RLS)
-    # Use este APENAS para operações administrativas ou testes
-    if SUPABASE_SERVICE_KEY:
-        supabase_admin: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-    else:
-        supabase_admin = None
-    
-    logger.info(f"✅ Supabase conectado: {SUPABASE_URL[:30]}...")
-
-
-def get_supabase() -> Client | None:
+_clientes: dict = {}
+_lock = threading.Lock()
+
+
+def configurado() -> bool:
+    """Se as credenciais do Supabase estão no .env (sem criar cliente nenhum)."""
+    return bool(SUPABASE_URL and SUPABASE_ANON_KEY)
+
+
+def _cliente(nome: str, chave: str | None) -> "Client | None":
+    if nome not in _clientes:
+        with _lock:
+            if nome not in _clientes:
+                if not configurado():
+                    logger.warning("⚠️ Credenciais do Supabase não configuradas. Algumas funcionalidades não vão funcionar.")
+                    _clientes[nome] = None
+                elif not chave:
+                    _clientes[nome] = None
+                else:
+                    from supabase import create_client
+                    _clientes[nome] = create_client(SUPABASE_URL, chave)
+                    logger.info(f"✅ Supabase conectado ({nome}): {SUPABASE_URL[:30]}...")
+    return _clientes[nome]
+
+
+def get_supabase() -> "Client | None":
     """Retorna o cliente do Supabase (com RLS)."""
-    return supabase
+    # Use este para operações de usuários logados
+    return _cliente("supabase", SUPABASE_ANON_KEY)
 
 
-def get_supabase_admin() -> Client | None:
+def get_supabase_admin() -> "Client | None":
     """Retorna o cliente admin do Supabase (sem RLS). Use com cuidado!"""
-    return supabase_admin
\ No newline at end of file
+    # Use este APENAS para operações administrativas (o backend) ou testes
+    return _cliente("supabase_admin", SUPABASE_SERVICE_KEY)
+
+
+def __getattr__(nome: str):
+    # Compatibilidade: `from .supabase_client import supabase_admin` continua
+    # funcionando (e cria o cliente nessa hora)
+    if nome == "supabase":
+        return get_supabase()
+    if nome == "supabase_admin":
+        return get_supabase_admin()
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
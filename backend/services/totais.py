@@ -0,0 +1,279 @@
+# --- Anotações para Iniciantes ---
+# Este arquivo é o "motor" de cálculo de totais das divisões.
+# Toda a conta é feita com números INTEIROS (centavos e milésimos de quantidade),
+# nunca com float. Assim não existe erro de arredondamento acumulado:
+# quando a conta está toda distribuída, a soma do que cada pessoa paga
+# bate exatamente com o total da conta, centavo por centavo.
+#
+# O cálculo tem duas fases:
+#   1. `agregar`: transforma a divisão em vetores compactos (preço por item,
+#      matriz pessoa × item de quantidades) e soma o consumo exato de cada pessoa.
+#   2. `fechar_totais`: arredonda para centavos e reparte desconto, taxa e
+#      percentuais pelo método do maior resto (determinístico).
+#
+# As unidades usadas aqui:
+#   - preços e valores em CENTAVOS (R$ 8,50 -> 850)
+#   - quantidades em MILÉSIMOS (1,5 -> 1500), a mesma precisão do DECIMAL(10,3) do banco
+#   - consumo exato em MILICENTAVOS (quantidade em milésimos × preço em centavos)
+#   - taxa de serviço em CENTÉSIMOS DE PORCENTO (10% -> 1000)
+
+from dataclasses import dataclass
+from operator import mul
+from typing import Dict, List, Tuple
+
+MILESIMOS = 1000      # quantidade 1,000 em milésimos
+CENTAVOS = 100        # R$ 1,00 em centavos
+PERCENTUAL_BP = 10000  # 100% em centésimos de porcento
+
+
+# ============================================
+# ARREDONDAMENTO E RATEIO
+# ============================================
+
+def dividir_arredondando(numerador: int, denominador: int) -> int:
+    """Divisão inteira arredondando meio para longe do zero (como o ROUND do Postgres)."""
+    if numerador < 0:
+        return -dividir_arredondando(-numerador, denominador)
+    return (2 * numerador + denominador) // (2 * denominador)
+
+
+def ratear(total: int, pesos: List[int]) -> List[int]:
+    """
+    Reparte `total` proporcionalmente aos `pesos` pelo método do maior resto.
+    A soma das partes é SEMPRE igual a `total`. Empates são resolvidos pela ordem
+    dos pesos, então o resultado é determinístico.
+    """
+    pesos = [max(peso, 0) for peso in pesos]
+    soma = sum(pesos)
+    if soma == 0 or total == 0:
+        return [0] * len(pesos)
+    if total < 0:
+        return [-parte for parte in ratear(-total, pesos)]
+
+    cotas = [total * peso for peso in pesos]
+    partes = [cota // soma for cota in cotas]
+    sobra = total - sum(partes)
+    ordem = sorted(range(len(pesos)), key=lambda i: (-(cotas[i] % soma), i))
+    for i in ordem[:sobra]:
+        partes[i] += 1
+    return partes
+
+
+def para_centavos(valor) -> int:
+    """Converte um valor em reais (float/str/Decimal) para centavos."""
+    return int(round(float(valor) * CENTAVOS))
+
+
+def para_milesimos(quantidade) -> int:
+    """Converte uma quantidade para milésimos."""
+    return int(round(float(quantidade) * MILESIMOS))
+
+
+def para_milicentavos(valor) -> int:
+    """Converte um valor exato em reais (quantidade × preço) para milicentavos."""
+    return int(round(float(valor) * CENTAVOS * MILESIMOS))
+
+
+# ============================================
+# ESTRUTURAS COMPACTAS
+# ============================================
+
+@dataclass
+class MatrizDivisao:
+    """Divisão em forma de vetores: um preço por item e uma linha de quantidades por pessoa."""
+    item_nomes: List[str]
+    precos: List[int]          # centavos, um por item
+    quantidades: List[int]     # milésimos, um por item
+    pessoa_nomes: List[str]
+    matriz: List[List[int]]    # [pessoa][item] em milésimos
+    taxa_bp: int               # taxa de serviço em centésimos de porcento
+    desconto: int              # centavos
+
+
+@dataclass
+class Consumo:
+    """Resultado da fase 1: consumo exato (em milicentavos) de cada pessoa."""
+    pessoa_nomes: List[str]
+    subtotais: List[int]                           # milicentavos por pessoa
+    linhas: List[List[Tuple[str, int, int]]]       # por pessoa: (nome do item, milésimos, milicentavos)
+    subtotal_geral: int                            # milicentavos (todos os itens)
+    quantidade_total: int                          # milésimos
+    quantidade_distribuida: int                    # milésimos
+    itens_total: int
+    itens_restantes: int
+    taxa_bp: int
+    desconto: int
+
+
+def montar_matriz(divisao_db: dict) -> MatrizDivisao:
+    """Converte a divisão completa (formato do db_service) em vetores compactos."""
+    itens = divisao_db.get("itens", [])
+    pessoas = divisao_db.get("pessoas", [])
+    indice_pessoa = {str(p["id"]): i for i, p in enumerate(pessoas)}
+
+    matriz = [[0] * len(itens) for _ in pessoas]
+    for j, item in enumerate(itens):
+        for pessoa_id, quantidade in item.get("atribuido_a", {}).items():
+            i = indice_pessoa.get(str(pessoa_id))
+            if i is not None:
+                matriz[i][j] = para_milesimos(quantidade)
+
+    return MatrizDivisao(
+        item_nomes=[item["nome"] for item in itens],
+        precos=[para_centavos(item["valor_unitario"]) for item in itens],
+        quantidades=[para_milesimos(item["quantidade"]) for item in itens],
+        pessoa_nomes=[p["nome"] for p in pessoas],
+        matriz=matriz,
+        taxa_bp=para_centavos(divisao_db.get("taxa_servico_percentual", 10.0)),
+        desconto=para_centavos(divisao_db.get("desconto_valor", 0.0)),
+    )
+
+
+# ============================================
+# FASE 1: AGREGAÇÃO
+# ============================================
+
+def agregar(m: MatrizDivisao) -> Consumo:
+    """Soma o consumo exato de cada pessoa e o progresso da distribuição."""
+    subtotais = []
+    linhas = []
+    for linha in m.matriz:
+        subtotais.append(sum(map(mul, linha, m.precos)))
+        linhas.append([
+            (m.item_nomes[j], quantidade, quantidade * m.precos[j])
+            for j, quantidade in enumerate(linha) if quantidade
+        ])
+
+    distribuido_por_item = [sum(coluna) for coluna in zip(*m.matriz)] or [0] * len(m.precos)
+    return Consumo(
+        pessoa_nomes=m.pessoa_nomes,
+        subtotais=subtotais,
+        linhas=linhas,
+        subtotal_geral=sum(map(mul, m.quantidades, m.precos)),
+        quantidade_total=sum(m.quantidades),
+        quantidade_distribuida=sum(distribuido_por_item),
+        itens_total=len(m.precos),
+        itens_restantes=sum(
+            1 for total, distribuido in zip(m.quantidades, distribuido_por_item) if total > distribuido
+        ),
+        taxa_bp=m.taxa_bp,
+        desconto=m.desconto,
+    )
+
+
+def consumo_do_banco(dados: dict) -> Consumo:
+    """
+    Converte o resultado da função SQL totais_divisao_compacto em Consumo.
+    O banco já fez a agregação (fase 1); aqui só mudamos as unidades.
+    """
+    pessoas = dados.get("pessoas") or []
+    return Consumo(
+        pessoa_nomes=[p["nome"] for p in pessoas],
+        subtotais=[para_milicentavos(p["subtotal"]) for p in pessoas],
+        linhas=[
+            [(nome, para_milesimos(quantidade), para_milicentavos(valor))
+             for nome, quantidade, valor in p.get("itens") or []]
+            for p in pessoas
+        ],
+        subtotal_geral=para_milicentavos(dados.get("subtotal_geral", 0)),
+        quantidade_total=para_milesimos(dados.get("quantidade_total", 0)),
+        quantidade_distribuida=para_milesimos(dados.get("quantidade_distribuida", 0)),
+        itens_total=int(dados.get("itens_total") or 0),
+        itens_restantes=int(dados.get("itens_restantes") or 0),
+        taxa_bp=para_centavos(dados.get("taxa_servico_percentual", 10.0)),
+        desconto=para_centavos(dados.get("desconto_valor", 0.0)),
+    )
+
+
+# ============================================
+# FASE 2: FECHAMENTO (CENTAVOS)
+# ============================================
+
+def fechar_totais(c: Consumo) -> dict:
+    """
+    Arredonda o consumo para centavos e reparte desconto, taxa e percentuais.
+    Retorna um dicionário no formato do schema TotaisResponse.
+    """
+    # O que ainda não foi distribuído entra como um "participante" extra no rateio,
+    # assim as pessoas pagam só a parte delas e a soma fecha com o total da conta.
+    nao_distribuido = max(c.subtotal_geral - sum(c.subtotais), 0)
+    pesos = c.subtotais + [nao_distribuido]
+
+    subtotal_geral = dividir_arredondando(c.subtotal_geral, MILESIMOS)
+    taxa_geral = dividir_arredondando((subtotal_geral - c.desconto) * c.taxa_bp, PERCENTUAL_BP)
+    subtotais = ratear(subtotal_geral, pesos)
+    descontos = ratear(c.desconto, pesos)
+    taxas = ratear(taxa_geral, pesos)
+    totais = [s - d + t for s, d, t in zip(subtotais, descontos, taxas)]
+    percentuais = ratear(PERCENTUAL_BP, totais)
+
+    pessoas = []
+    for i, nome in enumerate(c.pessoa_nomes):
+        pesos_itens = [valor for _, _, valor in c.linhas[i]]
+        valores = ratear(subtotais[i], pesos_itens)
+        descontos_itens = ratear(descontos[i], pesos_itens)
+        pessoas.append({
+            "nome": nome,
+            "itens": [
+                {
+                    "nome": nome_item,
+                    "quantidade": quantidade / MILESIMOS,
+                    "valor": valor / CENTAVOS,
+                    "desconto_aplicado": desconto / CENTAVOS,
+                }
+                for (nome_item, quantidade, _), valor, desconto
+                in zip(c.linhas[i], valores, descontos_itens)
+            ],
+            "subtotal": subtotais[i] / CENTAVOS,
+            "taxa": taxas[i] / CENTAVOS,
+            "desconto": descontos[i] / CENTAVOS,
+            "total": totais[i] / CENTAVOS,
+            "percentual_da_conta": percentuais[i] / CENTAVOS,
+        })
+
+    if c.subtotal_geral == 0:
+        progresso = {"percentual_distribuido": 0, "itens_restantes": c.itens_total}
+    else:
+        percentual = dividir_arredondando(c.quantidade_distribuida * PERCENTUAL_BP, c.quantidade_total)
+        progresso = {"percentual_distribuido": percentual / CENTAVOS, "itens_restantes": c.itens_restantes}
+
+    return {"pessoas": pessoas, "progresso": progresso}
+
+
+# ============================================
+# API DO MÓDULO
+# ============================================
+
+def calcular_totais(divisao_db: dict) -> dict:
+    """Calcula os totais de uma divisão completa (formato TotaisResponse)."""
+    return fechar_totais(agregar(montar_matriz(divisao_db)))
+
+
+def totais_da_conta(divisao_db: dict) -> dict:
+    """
+    Totais da conta inteira (não por pessoa): subtotal, desconto, taxa e total,
+    com as mesmas regras de arredondamento do `fechar_totais`.
+    """
+    m = montar_matriz(divisao_db)
+    subtotal = dividir_arredondando(sum(map(mul, m.quantidades, m.precos)), MILESIMOS)
+    taxa = dividir_arredondando((subtotal - m.desconto) * m.taxa_bp, PERCENTUAL_BP)
+    return {
+        "subtotal": subtotal / CENTAVOS,
+        "desconto": m.desconto / CENTAVOS,
+        "taxa": taxa / CENTAVOS,
+        "total": (subtotal - m.desconto + taxa) / CENTAVOS,
+    }
+
+
+def calcular_totais_lote(divisoes_db: List[dict]) -> Dict[str, dict]:
+    """
+    Calcula os totais de várias divisões de uma vez, indexados pelo ID da divisão.
+    Divisões finalizadas lidas do snapshot já trazem os totais prontos em "totais".
+    É um laço pelo caminho de uma divisão só, de propósito: juntar todas numa
+    matriz única não economiza nada em Python puro (o rateio da fase 2 é por
+    divisão), ver backend/benchmarks/bench_totais_lote.py.
+    """
+    return {
+        str(divisao["id"]): divisao.get("totais") or calcular_totais(divisao)
+        for divisao in divisoes_db
+    }
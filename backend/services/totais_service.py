@@ -0,0 +1,146 @@
+# --- Anotações para Iniciantes ---
+# Serviço de totais: decide ONDE o consumo de cada pessoa é agregado.
+#
+# Estratégias:
+#   - "banco": uma chamada RPC (totais_divisao_compacto) faz a agregação no Postgres
+#     e devolve só o consumo por pessoa. Uma ida ao banco e payload pequeno.
+#   - "local": agrega em Python sobre a divisão completa. De graça se a divisão
+#     já está no cache_divisoes; senão custa as 3 queries de itens, pessoas e
+#     atribuições.
+#   - "auto" (padrão): usa "local" se a divisão está em cache NA VERSÃO ATUAL e
+#     "banco" se não está. Com distribuições ainda pendentes no coalescedor,
+#     sempre usa "local" (o banco ainda não tem esse estado).
+#
+# As duas começam lendo a linha da divisão (uma query): é a versão dela que
+# diz se o cache ainda vale. Sem isso, uma alteração feita em outro worker só
+# apareceria nos totais depois do TTL do cache.
+#
+# Divisões finalizadas guardam os totais prontos no snapshot
+# (database/10snapshots.md); quando a divisão vem do snapshot, nada é recalculado.
+#
+# Nas duas estratégias o arredondamento e o rateio em centavos são feitos pelo
+# mesmo código (services/totais.py), então o resultado é idêntico.
+#
+# `simular_totais_divisao` faz a mesma conta com alterações hipotéticas
+# (taxa, desconto, distribuição de itens) sem escrever nada no banco.
+
+import logging
+from typing import Dict, Optional
+
+from . import coalescedor
+from . import db_service as db
+from .totais import agregar, calcular_totais, consumo_do_banco, fechar_totais, montar_matriz
+
+logger = logging.getLogger(__name__)
+
+ESTRATEGIAS = ("auto", "banco", "local")
+
+
+def escolher_estrategia(divisao: dict, estrategia: str = "auto") -> str:
+    """
+    Resolve a estratégia "auto" olhando se a divisão (linha já lida do banco)
+    está em cache na mesma versão. Finalizadas têm os totais no snapshot da linha.
+    """
+    divisao_id = str(divisao["id"])
+    if coalescedor.tem_pendentes(divisao_id):
+        return "local"
+    if estrategia != "auto":
+        return estrategia
+    if divisao.get("snapshot") or db.get_divisao_completa_em_cache(divisao_id, divisao.get("versao")):
+        return "local"
+    return "banco"
+
+
+def calcular_totais_divisao(divisao_id: str, estrategia: str = "auto") -> Optional[dict]:
+    """
+    Calcula os totais (formato TotaisResponse) de uma divisão.
+    Retorna None se a divisão não existe.
+    """
+    if estrategia not in ESTRATEGIAS:
+        raise ValueError(f"Estratégia inválida: {estrategia}")
+    linha = db.get_divisao(divisao_id)
+    if not linha:
+        return None
+    estrategia = escolher_estrategia(linha, estrategia)
+
+    if estrategia == "banco":
+        dados = db.get_totais_compactos(divisao_id)
+        if not dados:
+            return None
+        return fechar_totais(consumo_do_banco(dados))
+
+    # Usa o cache só se a versão bater com a da linha (senão busca de novo)
+    divisao = db.get_divisao_completa(divisao_id, divisao=linha)
+    if not divisao:
+        return None
+    if divisao.get("totais"):
+        return divisao["totais"]  # divisão finalizada: totais congelados no snapshot
+    return fechar_totais(agregar(montar_matriz(coalescedor.sobrepor(divisao))))
+
+
+def aplicar_simulacao(
+    divisao: dict,
+    taxa_servico_percentual: Optional[float] = None,
+    desconto_valor: Optional[float] = None,
+    distribuicoes: Optional[Dict[str, Dict[str, float]]] = None,
+) -> dict:
+    """
+    Devolve uma CÓPIA da divisão completa com as alterações hipotéticas aplicadas.
+    `distribuicoes` mapeia item_id -> {pessoa_id: quantidade} e substitui a
+    distribuição atual desses itens. A divisão original (que pode estar em
+    cache) não é alterada. Lança ValueError se a simulação for inválida.
+    """
+    simulada = dict(divisao)
+    if taxa_servico_percentual is not None:
+        simulada["taxa_servico_percentual"] = taxa_servico_percentual
+    if desconto_valor is not None:
+        simulada["desconto_valor"] = desconto_valor
+    if not distribuicoes:
+        return simulada
+
+    pessoas_ids = {str(p["id"]) for p in divisao.get("pessoas", [])}
+    pendentes = dict(distribuicoes)
+    itens = []
+    for item in divisao.get("itens", []):
+        nova = pendentes.pop(str(item["id"]), None)
+        if nova is None:
+            itens.append(item)
+            continue
+
+        for pessoa_id in nova:
+            if pessoa_id not in pessoas_ids:
+                raise ValueError(f"Pessoa {pessoa_id} não encontrada na divisão.")
+        quantidade_distribuida = sum(nova.values())
+        if quantidade_distribuida > float(item["quantidade"]) + 0.001:
+            raise ValueError(
+                f"Quantidade distribuída ({quantidade_distribuida}) maior que disponível "
+                f"({item['quantidade']}) no item \"{item['nome']}\"."
+            )
+        itens.append({**item, "atribuido_a": {p: q for p, q in nova.items() if q > 0}})
+
+    if pendentes:
+        raise ValueError(f"Item {next(iter(pendentes))} não encontrado na divisão.")
+    simulada["itens"] = itens
+    return simulada
+
+
+def simular_totais_divisao(
+    divisao_id: str,
+    taxa_servico_percentual: Optional[float] = None,
+    desconto_valor: Optional[float] = None,
+    distribuicoes: Optional[Dict[str, Dict[str, float]]] = None,
+) -> Optional[dict]:
+    """
+    Calcula os totais (formato TotaisResponse) com alterações hipotéticas, sem
+    persistir nada. Usa a divisão em cache quando ela está na versão atual
+    (só a query da linha da divisão). Retorna None se a divisão não existe.
+    """
+    linha = db.get_divisao(divisao_id)
+    if not linha:
+        return None
+    divisao = coalescedor.sobrepor(db.get_divisao_completa(divisao_id, divisao=linha))
+    if not divisao:
+        return None
+    return calcular_totais(
+        aplicar_simulacao(divisao, taxa_servico_percentual, desconto_valor, distribuicoes)
+    )
@@ -0,0 +1,149 @@
+# --- Anotações para Iniciantes ---
+# Base dos testes do backend. Execute da raiz do projeto:
+#     python -m pytest backend/tests
+#
+# Os testes não precisam de Supabase nem de internet: a API roda sobre o
+# banco SQLite em memória (services/sqlite_backend.py), que tem a mesma
+# interface do cliente do Supabase. Por cima dele fica o ClienteContado, que
+# conta cada ida ao banco (cada .execute()), as linhas devolvidas e os bytes
+# enviados e recebidos, como se fosse o PostgREST do outro lado da rede.
+
+import os
+import tempfile
+import uuid
+from dataclasses import dataclass
+from typing import List
+
+# Precisa acontecer antes de importar o backend (as configurações são lidas no import)
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+os.environ["API_SECRET_TOKEN"] = ""  # sem autenticação (o usuário vem do fixture `usuario`)
+os.environ["COALESCER_JANELA_MS"] = "0"  # cada distribuição grava na hora
+os.environ["COMPARTILHAMENTO_CACHE_DIR"] = tempfile.mkdtemp(prefix="compartilha-ai-testes-")
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.services import auth, cache_divisoes
+from backend.services import db_service
+
+
+def _tamanho(dados) -> int:
+    """Bytes de `dados` em JSON (o que iria pela rede até o PostgREST)."""
+    if dados is None:
+        return 0
+    return len(orjson.dumps(dados, default=str))
+
+
+def _linhas(dados) -> int:
+    if isinstance(dados, list):
+        return len(dados)
+    return 0 if dados is None else 1
+
+
+@dataclass
+class Chamada:
+    """Uma ida ao banco: tabela (ou rpc:nome), linhas devolvidas e bytes trafegados."""
+    alvo: str
+    linhas: int
+    bytes_enviados: int
+    bytes_recebidos: int
+
+
+class ConsultaContada:
+    """Repassa a consulta para o cliente real e registra o `.execute()`."""
+
+    def __init__(self, contador: "ClienteContado", consulta, alvo: str, bytes_enviados: int = 0):
+        self._contador = contador
+        self._consulta = consulta
+        self._alvo = alvo
+        self._bytes_enviados = bytes_enviados
+
+    def __getattr__(self, nome):
+        metodo = getattr(self._consulta, nome)
+
+        def encadear(*args, **kwargs):
+            if nome in ("insert", "upsert", "update") and args:
+                self._bytes_enviados += _tamanho(args[0])
+            self._consulta = metodo(*args, **kwargs)
+            return self
+        return encadear
+
+    def execute(self):
+        try:
+            resposta = self._consulta.execute()
+        except Exception:
+            self._contador.registrar(Chamada(self._alvo, 0, self._bytes_enviados, 0))
+            raise
+        self._contador.registrar(
+            Chamada(self._alvo, _linhas(resposta.data), self._bytes_enviados, _tamanho(resposta.data))
+        )
+        return resposta
+
+
+class ClienteContado:
+    """Cliente do banco instrumentado: mesma interface (table/rpc), mas conta tudo."""
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self.chamadas: List[Chamada] = []
+
+    def table(self, tabela: str) -> ConsultaContada:
+        return ConsultaContada(self, self._cliente.table(tabela), tabela)
+
+    from_ = table
+
+    def rpc(self, nome: str, params=None) -> ConsultaContada:
+        return ConsultaContada(self, self._cliente.rpc(nome, params), f"rpc:{nome}", _tamanho(params))
+
+    def registrar(self, chamada: Chamada) -> None:
+        self.chamadas.append(chamada)
+
+    def zerar(self) -> None:
+        self.chamadas = []
+
+    @property
+    def consultas(self) -> int:
+        return len(self.chamadas)
+
+    @property
+    def linhas(self) -> int:
+        return sum(c.linhas for c in self.chamadas)
+
+    @property
+    def bytes(self) -> int:
+        return sum(c.bytes_enviados + c.bytes_recebidos for c in self.chamadas)
+
+    def relatorio(self) -> str:
+        """Uma linha por ida ao banco (para as mensagens de erro dos testes)."""
+        return "\n".join(
+            f"  {i}. {c.alvo}: {c.linhas} linhas, {c.bytes_enviados} B enviados, {c.bytes_recebidos} B recebidos"
+            for i, c in enumerate(self.chamadas, 1)
+        )
+
+
+@pytest.fixture
+def banco(monkeypatch) -> ClienteContado:
+    """Troca o cliente do db_service pelo instrumentado (só durante o teste)."""
+    contador = ClienteContado(db_service.db)
+    monkeypatch.setattr(db_service, "db", contador)
+    cache_divisoes.limpar()
+    return contador
+
+
+@pytest.fixture
+def usuario(banco) -> str:
+    """Um usuário novo por teste: o histórico de cada teste começa vazio."""
+    user_id = str(uuid.uuid4())
+    banco.table("profiles").insert({"id": user_id, "nome": "Teste"}).execute()
+    main.app.dependency_overrides[auth.get_current_user] = lambda: {"user_id": user_id, "method": "teste"}
+    yield user_id
+    main.app.dependency_overrides.pop(auth.get_current_user, None)
+
+
+@pytest.fixture
+def cliente(usuario) -> TestClient:
+    with TestClient(main.app) as cliente_http:
+        yield cliente_http
@@ -0,0 +1,134 @@
+# --- Anotações para Iniciantes ---
+# Testes do coalescedor (services/coalescedor.py) ligado: cada toque reserva
+# uma versão e responde com o ETag dela, a gravação juntada não derruba o
+# próprio cliente com 412, e uma gravação que não dá certo não some em
+# silêncio (fica pendente para tentar de novo, ou vira "ressincronizar").
+
+import asyncio
+
+import pytest
+
+from backend.services import coalescedor, db_service, eventos, metricas
+
+
+@pytest.fixture
+def divisao(cliente, monkeypatch) -> dict:
+    # Janela longa: nos testes, a gravação só acontece quando chamada
+    monkeypatch.setattr(coalescedor, "JANELA_SEGUNDOS", 60)
+    monkeypatch.setattr(coalescedor, "JANELA_MAXIMA", 60)
+    resposta = cliente.post("/api/criar-divisao", json={
+        "itens": [{"id": "item_0", "nome": "Chopp", "quantidade": 2, "valor_unitario": 12},
+                  {"id": "item_1", "nome": "Porção", "quantidade": 1, "valor_unitario": 40}],
+        "nomes_pessoas": ["Ana", "Bruno"],
+    })
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def _tocar(cliente, divisao: dict, item: int, pessoa: int, quantidade: float, etag: str):
+    return cliente.post(f"/api/distribuir-item/{divisao['id']}", json={
+        "item_id": divisao["itens"][item]["id"],
+        "distribuicao": [{"pessoa_id": divisao["pessoas"][pessoa]["id"], "quantidade": quantidade}],
+    }, headers={"If-Match": etag})
+
+
+def _etag(cliente, divisao_id: str) -> str:
+    return cliente.get(f"/api/divisao/{divisao_id}").headers["ETag"]
+
+
+def _gravado(divisao: dict, item: int) -> dict:
+    """Atribuições do item direto no banco (sem o estado pendente)."""
+    linhas = db_service.db.table("atribuicoes").select("*").eq("item_id", divisao["itens"][item]["id"]).execute()
+    return {a["pessoa_id"]: a["quantidade"] for a in linhas.data}
+
+
+def test_mesmo_cliente_toca_duas_vezes_seguidas(cliente, divisao):
+    etag = _etag(cliente, divisao["id"])
+
+    primeiro = _tocar(cliente, divisao, 0, 0, 1, etag)
+    segundo = _tocar(cliente, divisao, 1, 1, 1, primeiro.headers["ETag"])
+
+    assert primeiro.status_code == segundo.status_code == 200
+    assert len({etag, primeiro.headers["ETag"], segundo.headers["ETag"]}) == 3
+    assert _etag(cliente, divisao["id"]) == segundo.headers["ETag"]
+    assert [item["atribuido_a"] for item in segundo.json()["itens"]] == [
+        {divisao["pessoas"][0]["id"]: 1}, {divisao["pessoas"][1]["id"]: 1},
+    ]
+
+    # Depois da gravação juntada, o ETag do último toque continua aceito
+    assert cliente.portal.call(coalescedor.descarregar, divisao["id"])
+    nome = cliente.put(f"/api/divisao/{divisao['id']}/nome", json={"nome": "Bar"},
+                       headers={"If-Match": segundo.headers["ETag"]})
+
+    assert nome.status_code == 200, nome.text
+    assert _gravado(divisao, 0) == {divisao["pessoas"][0]["id"]: 1}
+    assert _gravado(divisao, 1) == {divisao["pessoas"][1]["id"]: 1}
+
+
+def test_dois_dispositivos_na_mesma_versao(cliente, divisao):
+    etag = _etag(cliente, divisao["id"])
+
+    celular = _tocar(cliente, divisao, 0, 0, 2, etag)
+    tablet = _tocar(cliente, divisao, 0, 1, 2, etag)
+    renomear = cliente.put(f"/api/divisao/{divisao['id']}/nome", json={"nome": "Bar"}, headers={"If-Match": etag})
+
+    assert celular.status_code == 200
+    assert tablet.status_code == renomear.status_code == 412
+    # O toque que ganhou foi gravado (antes da alteração recusada) e vale
+    assert not coalescedor.tem_pendentes(divisao["id"])
+    assert _gravado(divisao, 0) == {divisao["pessoas"][0]["id"]: 2}
+
+
+def test_gravacao_em_divisao_finalizada_por_fora(cliente, divisao):
+    assert _tocar(cliente, divisao, 0, 0, 1, _etag(cliente, divisao["id"])).status_code == 200
+    assinatura = eventos.assinar(divisao["id"])
+    # Outro processo finaliza a divisão (sem passar pelo coalescedor deste)
+    atual = db_service.get_divisao(divisao["id"])
+    snapshot = db_service.montar_snapshot(db_service.get_divisao_completa(divisao["id"], divisao=atual))
+    assert db_service.finalizar_divisao(divisao["id"], snapshot, atual["versao"])
+
+    assert cliente.portal.call(coalescedor.descarregar, divisao["id"])
+
+    assert not coalescedor.tem_pendentes(divisao["id"])
+    assert _gravado(divisao, 0) == {}
+    mensagens = []
+    while not assinatura.fila.empty():
+        mensagens.append(assinatura.fila.get_nowait())
+    eventos.cancelar(assinatura)
+    assert any(b"event: ressincronizar" in mensagem for mensagem in mensagens)
+
+
+def test_gravacao_que_falha_continua_pendente(cliente, divisao, monkeypatch):
+    etag = _tocar(cliente, divisao, 0, 0, 1, _etag(cliente, divisao["id"])).headers["ETag"]
+    alterar_divisao = db_service.alterar_divisao
+
+    def banco_fora_do_ar(*args, **kwargs):
+        raise ConnectionError("banco fora do ar")
+
+    monkeypatch.setattr(db_service, "alterar_divisao", banco_fora_do_ar)
+    assert not cliente.portal.call(coalescedor.descarregar, divisao["id"])
+    # Outra alteração não passa na frente da distribuição pendente
+    renomear = cliente.put(f"/api/divisao/{divisao['id']}/nome", json={"nome": "Bar"}, headers={"If-Match": etag})
+    assert renomear.status_code == 503
+    assert coalescedor.tem_pendentes(divisao["id"])
+
+    monkeypatch.setattr(db_service, "alterar_divisao", alterar_divisao)
+    assert cliente.portal.call(coalescedor.descarregar, divisao["id"])
+    assert _gravado(divisao, 0) == {divisao["pessoas"][0]["id"]: 1}
+
+
+def test_gravacao_agendada_fica_fora_das_metricas_da_requisicao(cliente, divisao, monkeypatch):
+    monkeypatch.setattr(coalescedor, "JANELA_SEGUNDOS", 0.01)
+    medicoes = []
+    descarregar = coalescedor.descarregar
+
+    def descarregar_anotando(divisao_id, *args, **kwargs):
+        medicoes.append(metricas._medicao.get())
+        return descarregar(divisao_id, *args, **kwargs)
+
+    monkeypatch.setattr(coalescedor, "descarregar", descarregar_anotando)
+    assert _tocar(cliente, divisao, 0, 0, 1, _etag(cliente, divisao["id"])).status_code == 200
+    cliente.portal.call(asyncio.sleep, 0.1)
+
+    assert medicoes == [None]
+    assert _gravado(divisao, 0) == {divisao["pessoas"][0]["id"]: 1}
@@ -0,0 +1,176 @@
+# --- Anotações para Iniciantes ---
+# Testes das chaves de idempotência (services/idempotencia.py): o reenvio com a
+# mesma Idempotency-Key recebe a resposta guardada sem executar de novo, um
+# reenvio que chega durante a execução espera pela original, as chaves são
+# separadas por usuário, o armazenamento tem limite de bytes e um corpo grande
+# demais é recusado sem ser lido inteiro.
+
+import asyncio
+
+import orjson
+import pytest
+
+from backend import main
+from backend.services import auth, idempotencia
+
+DIVISAO = {
+    "itens": [{"id": "item_0", "nome": "Chopp", "quantidade": 2, "valor_unitario": 12}],
+    "nomes_pessoas": ["Ana", "Bruno"],
+}
+
+
+@pytest.fixture(autouse=True)
+def _sem_respostas_guardadas():
+    idempotencia.limpar()
+    yield
+    idempotencia.limpar()
+
+
+def test_reenvio_de_criar_divisao_nao_duplica(cliente, banco):
+    cabecalhos = {"Idempotency-Key": "criar-1"}
+    original = cliente.post("/api/criar-divisao", json=DIVISAO, headers=cabecalhos)
+    assert original.status_code == 200, original.text
+
+    banco.zerar()
+    reenvio = cliente.post("/api/criar-divisao", json=DIVISAO, headers=cabecalhos)
+
+    assert reenvio.status_code == 200
+    assert reenvio.headers["idempotent-replayed"] == "true"
+    assert reenvio.json()["id"] == original.json()["id"]
+    assert banco.consultas == 0, banco.relatorio()
+    assert len(cliente.get("/api/divisoes").json()) == 1
+
+
+def test_mesma_chave_com_outro_corpo_e_recusada(cliente):
+    cabecalhos = {"Idempotency-Key": "criar-2"}
+    assert cliente.post("/api/criar-divisao", json=DIVISAO, headers=cabecalhos).status_code == 200
+
+    outra = cliente.post("/api/criar-divisao", json={**DIVISAO, "nome": "Outra"}, headers=cabecalhos)
+
+    assert outra.status_code == 422
+
+
+def test_reenvio_durante_a_execucao_espera_a_original():
+    execucoes = []
+
+    async def app(scope, receive, send):
+        corpo = (await receive())["body"]
+        execucoes.append(corpo)
+        await asyncio.sleep(0.05)  # a original ainda está rodando quando o reenvio chega
+        await send({"type": "http.response.start", "status": 201, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": orjson.dumps({"execucao": len(execucoes)})})
+
+    middleware = idempotencia.MiddlewareIdempotencia(app)
+
+    async def requisicao():
+        mensagens = []
+
+        async def receive():
+            return {"type": "http.request", "body": b'{"a": 1}', "more_body": False}
+
+        async def send(mensagem):
+            mensagens.append(mensagem)
+
+        scope = {"type": "http", "method": "POST", "path": "/api/criar-divisao",
+                 "headers": [(b"idempotency-key", b"chave-concorrente")]}
+        await middleware(scope, receive, send)
+        return mensagens
+
+    async def duas_ao_mesmo_tempo():
+        return await asyncio.gather(requisicao(), requisicao())
+
+    original, reenvio = asyncio.run(duas_ao_mesmo_tempo())
+
+    assert len(execucoes) == 1
+    assert original[0]["status"] == reenvio[0]["status"] == 201
+    assert orjson.loads(reenvio[1]["body"]) == {"execucao": 1}
+    assert (b"idempotent-replayed", b"true") in reenvio[0]["headers"]
+
+
+def test_reenvio_do_scan_nao_chama_a_ia_de_novo(cliente, monkeypatch, tmp_path):
+    chamadas = []
+    monkeypatch.setattr(main, "scan_receipt_to_json", lambda caminho: chamadas.append(caminho) or {
+        "itens": [{"item": "Chopp", "quantidade": 2, "preco_unitario": 12.0}]
+    })
+    monkeypatch.chdir(tmp_path)
+    envio = {"files": {"file": ("comanda.jpg", b"imagem", "image/jpeg")}, "headers": {"Idempotency-Key": "scan-1"}}
+
+    original = cliente.post("/api/scan-comanda", **envio)
+    reenvio = cliente.post("/api/scan-comanda", **envio)  # o httpx gera outro boundary no multipart
+
+    assert original.status_code == reenvio.status_code == 200
+    assert reenvio.json() == original.json()
+    assert len(chamadas) == 1
+
+
+def test_chave_e_do_usuario_e_nao_do_token(cliente, monkeypatch):
+    usuarios = {"jwt-antigo": "ana", "jwt-renovado": "ana", "jwt-do-bruno": "bruno"}
+
+    async def identificar(token, api_key):
+        return {"user_id": usuarios[token], "email": None, "method": "jwt"}
+
+    monkeypatch.setattr(auth, "identificar", identificar)
+
+    def criar(token):
+        return cliente.post("/api/criar-divisao", json=DIVISAO,
+                            headers={"Idempotency-Key": "criar-3", "Authorization": f"Bearer {token}"})
+
+    original = criar("jwt-antigo")
+    renovado = criar("jwt-renovado")  # reenvio depois de renovar o JWT
+    outro_usuario = criar("jwt-do-bruno")
+
+    assert renovado.headers["idempotent-replayed"] == "true"
+    assert renovado.json()["id"] == original.json()["id"]
+    assert "idempotent-replayed" not in outro_usuario.headers
+    assert outro_usuario.json()["id"] != original.json()["id"]
+
+
+def test_armazenamento_tem_limite_de_bytes(monkeypatch):
+    monkeypatch.setattr(idempotencia, "MAX_BYTES", 3000)
+    resposta = {"status": 200, "headers": [(b"content-type", b"application/json")], "corpo": b"x" * 1000}
+
+    for numero in range(5):
+        idempotencia.guardar(f"chave-{numero}", "impressao", resposta)
+    idempotencia.guardar("grande", "impressao", {**resposta, "corpo": b"x" * 4000})
+
+    assert idempotencia.bytes_guardados() <= 3000
+    assert idempotencia.obter("chave-0") is None
+    assert idempotencia.obter("chave-4") is not None
+    assert idempotencia.obter("grande") is None
+
+
+def test_corpo_grande_demais_e_recusado_sem_ler_tudo(monkeypatch):
+    monkeypatch.setattr(idempotencia, "TAMANHO_MAXIMO_CORPO", 1000)
+    execucoes = []
+
+    async def app(scope, receive, send):
+        execucoes.append((await receive())["body"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def identificar(token, api_key):
+        return {"user_id": "ana", "email": None, "method": "jwt"}
+
+    monkeypatch.setattr(auth, "identificar", identificar)
+    middleware = idempotencia.MiddlewareIdempotencia(app)
+
+    def enviar(cabecalhos, pedacos):
+        lidos, mensagens = [], []
+
+        async def receive():
+            lidos.append(pedacos[len(lidos)])
+            return {"type": "http.request", "body": lidos[-1], "more_body": len(lidos) < len(pedacos)}
+
+        async def send(mensagem):
+            mensagens.append(mensagem)
+
+        scope = {"type": "http", "method": "POST", "path": "/api/scan-comanda",
+                 "headers": [(b"idempotency-key", b"grande")] + cabecalhos}
+        asyncio.run(middleware(scope, receive, send))
+        return mensagens[0]["status"], len(lidos)
+
+    pedacos = [b"x" * 600] * 10
+    assert enviar([(b"content-length", b"6000")], pedacos) == (413, 0)
+    assert enviar([], pedacos) == (413, 2)  # chunked: para assim que passa do limite
+    assert enviar([], [b"x" * 600]) == (200, 1)
+    assert execucoes == [b"x" * 600]
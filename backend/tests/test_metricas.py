@@ -0,0 +1,46 @@
+# --- Anotações para Iniciantes ---
+# Testes da medição por requisição (services/metricas.py): o header
+# Server-Timing de cada resposta e o /api/metrics no formato do Prometheus.
+
+from backend import main
+
+
+def _criar_divisao(cliente) -> str:
+    resposta = cliente.post("/api/criar-divisao", json={
+        "itens": [{"id": "item_0", "nome": "Chopp", "quantidade": 2, "valor_unitario": 12}],
+        "nomes_pessoas": ["Ana", "Bruno"],
+    })
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()["id"]
+
+
+def test_resposta_tem_server_timing_por_fase(cliente):
+    divisao_id = _criar_divisao(cliente)
+
+    resposta = cliente.get(f"/api/divisao/{divisao_id}")
+
+    fases = {parte.split(";")[0] for parte in resposta.headers["server-timing"].split(", ")}
+    assert {"db", "db.get_divisao", "serializacao", "total"} <= fases
+    assert resposta.headers["x-frame-options"] == "DENY"
+
+
+def test_metrics_agrega_por_rota_no_formato_prometheus(cliente):
+    divisao_id = _criar_divisao(cliente)
+    cliente.get(f"/api/divisao/{divisao_id}")
+
+    resposta = cliente.get("/api/metrics")
+
+    assert resposta.status_code == 200
+    assert resposta.headers["content-type"].startswith("text/plain; version=0.0.4")
+    rota = 'metodo="GET",rota="/api/divisao/{divisao_id}"'
+    assert f'compartilha_requisicao_segundos_bucket{{{rota},le="+Inf"}}' in resposta.text
+    assert f'compartilha_db_chamadas_total{{{rota},funcao="get_divisao"}}' in resposta.text
+    assert f'compartilha_fase_segundos_total{{{rota},fase="db"}}' in resposta.text
+
+
+def test_metrics_com_token_exige_o_bearer(cliente, monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "segredo")
+
+    assert cliente.get("/api/metrics").status_code == 401
+    assert cliente.get("/api/metrics", headers={"Authorization": "Bearer outro"}).status_code == 401
+    assert cliente.get("/api/metrics", headers={"Authorization": "Bearer segredo"}).status_code == 200
@@ -0,0 +1,322 @@
+# --- Anotações para Iniciantes ---
+# Orçamento de idas ao banco por endpoint.
+# Cada endpoint do main.py declara aqui quantas consultas (round trips ao
+# PostgREST) ele pode fazer por requisição. O teste roda cada endpoint sobre
+# divisões de vários tamanhos e falha se o orçamento for estourado, mostrando
+# cada consulta feita (tabela, linhas e bytes). Assim um N+1 que escape numa
+# alteração (ex: uma query por item) quebra o teste na hora.
+#
+# Os orçamentos valem para o pior caso: cache de divisões vazio (outro worker,
+# servidor reiniciado) e distribuições gravadas na hora (sem o coalescedor).
+# Se uma otimização reduzir as consultas de um endpoint, diminua o orçamento
+# dele junto, para a melhoria não se perder depois.
+
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+import pytest
+from fastapi.routing import APIRoute
+
+from backend import main
+from backend.services import cache_divisoes, coalescedor, perfilador
+
+# "MÉTODO rota [variante]" -> máximo de consultas por requisição
+ORCAMENTOS = {
+    "GET /api": 0,
+    "GET /api/health": 0,
+    "GET /api/ready": 1,
+    "GET /api/metrics": 0,
+    "GET /api/publico/{token}": 1,
+    "POST /api/scan-comanda": 0,
+    "POST /api/criar-divisao": 7,
+    "GET /api/divisao/{divisao_id}": 4,
+    "GET /api/divisao/{divisao_id} [If-None-Match]": 1,
+    "GET /api/divisao/{divisao_id}/mudancas": 4,
+    "GET /api/divisoes": 4,
+    "GET /api/divisoes [desde]": 4,
+    "GET /api/buscar": 1,
+    "GET /api/exportar": 4,
+    "DELETE /api/divisao/{divisao_id}": 3,
+    "POST /api/divisao/{divisao_id}/duplicar": 12,
+    "PUT /api/divisao/{divisao_id}/config": 4,
+    "POST /api/divisao/{divisao_id}/item": 4,
+    "PUT /api/divisao/{divisao_id}/item/{item_id}": 4,
+    "DELETE /api/divisao/{divisao_id}/item/{item_id}": 4,
+    "POST /api/divisao/{divisao_id}/pessoa": 4,
+    "DELETE /api/divisao/{divisao_id}/pessoa/{pessoa_id}": 4,
+    "POST /api/distribuir-item/{divisao_id}": 4,
+    "POST /api/divisao/{divisao_id}/distribuir-lote": 4,
+    "POST /api/divisao/{divisao_id}/batch": 4,
+    "GET /api/calcular-totais/{divisao_id}": 2,
+    "GET /api/calcular-totais/{divisao_id} [local]": 4,
+    "POST /api/calcular-totais/lote": 4,
+    "POST /api/divisao/{divisao_id}/simular-totais": 4,
+    "POST /api/simular-totais": 0,
+    "PUT /api/divisao/{divisao_id}/nome": 4,
+    "PUT /api/divisao/{divisao_id}/finalizar": 5,
+    "GET /api/estatisticas/mensal": 1,
+    "GET /api/estatisticas/itens": 1,
+    "GET /api/estatisticas/companhias": 1,
+    "POST /api/divisao/{divisao_id}/compartilhar": 3,
+    "POST /api/admin/perfil": 0,
+    "GET /api/admin/perfis": 0,
+    "GET /api/admin/perfis/{nome}": 0,
+}
+
+# Com o coalescedor ligado: a resposta da distribuição (validação e reserva
+# da versão) e a gravação juntada
+ORCAMENTO_DISTRIBUIR_JUNTANDO = 5
+ORCAMENTO_GRAVACAO_JUNTADA = 1
+
+# Rotas que não dá para medir como uma requisição comum
+SEM_ORCAMENTO = {
+    "GET /api/divisao/{divisao_id}/eventos": "stream SSE sem fim (1 consulta ao conectar)",
+}
+
+# (itens, pessoas) das divisões usadas nos testes; cada item é dividido entre todos
+TAMANHOS = [
+    pytest.param((1, 2), id="1x2"),
+    pytest.param((30, 6), id="30x6"),
+    pytest.param((150, 20), id="150x20"),
+]
+
+
+@pytest.fixture(params=TAMANHOS)
+def divisao(request, cliente) -> dict:
+    """Uma divisão em andamento com todos os itens divididos igualmente."""
+    itens, pessoas = request.param
+    resposta = cliente.post("/api/criar-divisao", json={
+        "nome": "Jantar de teste",
+        "itens": [
+            {"id": f"item_{i}", "nome": f"Item {i}", "quantidade": 2, "valor_unitario": 10.5 + i}
+            for i in range(itens)
+        ],
+        "nomes_pessoas": [f"Pessoa {p}" for p in range(pessoas)],
+    })
+    assert resposta.status_code == 200, resposta.text
+    divisao_id = resposta.json()["id"]
+    resposta = cliente.post(f"/api/divisao/{divisao_id}/distribuir-lote", json={"operacao": "dividir_igualmente"})
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+# ============================================
+# PREPARAÇÃO DE CADA REQUISIÇÃO
+# ============================================
+# Cada função recebe (cliente, divisao, monkeypatch), faz o que for preciso
+# antes (não é contado) e devolve (método, url, kwargs) da requisição medida.
+
+def _finalizar(cliente, divisao) -> None:
+    resposta = cliente.put(f"/api/divisao/{divisao['id']}/finalizar")
+    assert resposta.status_code == 200, resposta.text
+
+
+def _compartilhar(cliente, divisao) -> str:
+    _finalizar(cliente, divisao)
+    resposta = cliente.post(f"/api/divisao/{divisao['id']}/compartilhar")
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()["token"]
+
+
+def _scan(cliente, divisao, monkeypatch):
+    # O scanner (Gemini) não faz parte do orçamento do banco
+    monkeypatch.setattr(main, "scan_receipt_to_json", lambda caminho: {
+        "itens": [{"item": "Chopp", "quantidade": 2, "preco_unitario": 12.0}]
+    })
+    monkeypatch.chdir(tempfile.gettempdir())
+    return "POST", "/api/scan-comanda", {"files": {"file": ("comanda.jpg", b"imagem", "image/jpeg")}}
+
+
+def _criar(cliente, divisao, monkeypatch):
+    return "POST", "/api/criar-divisao", {"json": {
+        "itens": [{"id": f"n_{item['id']}", **{k: item[k] for k in ("nome", "quantidade", "valor_unitario")}}
+                  for item in divisao["itens"]],
+        "nomes_pessoas": [pessoa["nome"] for pessoa in divisao["pessoas"]],
+    }}
+
+
+def _buscar_com_etag(cliente, divisao, monkeypatch):
+    etag = cliente.get(f"/api/divisao/{divisao['id']}").headers["ETag"]
+    return "GET", f"/api/divisao/{divisao['id']}", {"headers": {"If-None-Match": etag}}
+
+
+def _publico(cliente, divisao, monkeypatch):
+    return "GET", f"/api/publico/{_compartilhar(cliente, divisao)}", {}
+
+
+def _excluir_finalizada(cliente, divisao, monkeypatch):
+    _compartilhar(cliente, divisao)  # pior caso: ainda apaga o link público
+    return "DELETE", f"/api/divisao/{divisao['id']}", {}
+
+
+def _distribuir_item(cliente, divisao, monkeypatch):
+    item, pessoa = divisao["itens"][0], divisao["pessoas"][0]
+    return "POST", f"/api/distribuir-item/{divisao['id']}", {"json": {
+        "item_id": item["id"], "distribuicao": [{"pessoa_id": pessoa["id"], "quantidade": item["quantidade"]}]
+    }}
+
+
+def _batch(cliente, divisao, monkeypatch):
+    return "POST", f"/api/divisao/{divisao['id']}/batch", {"json": {"operacoes": [
+        {"tipo": "renomear", "nome": "Renomeada"},
+        {"tipo": "adicionar_item", "nome": "Sobremesa", "quantidade": 1, "valor_unitario": 20, "ref": "s"},
+        {"tipo": "distribuir_lote", "operacao": "dividir_igualmente"},
+    ]}}
+
+
+def _simular(cliente, divisao, monkeypatch):
+    item = divisao["itens"][0]
+    return "POST", f"/api/divisao/{divisao['id']}/simular-totais", {"json": {
+        "taxa_servico_percentual": 12,
+        "distribuicoes": [{"item_id": item["id"], "distribuicao": [
+            {"pessoa_id": divisao["pessoas"][0]["id"], "quantidade": item["quantidade"]}
+        ]}],
+    }}
+
+
+def _estatistica(caminho: str):
+    def preparar(cliente, divisao, monkeypatch):
+        _finalizar(cliente, divisao)
+        return "GET", caminho, {}
+    return preparar
+
+
+def _admin(metodo: str, caminho: str, **kwargs):
+    """Rotas do perfilador: liga o ADMIN_TOKEN e grava os perfis numa pasta temporária."""
+    def preparar(cliente, divisao, monkeypatch):
+        monkeypatch.setattr(main, "ADMIN_TOKEN", "admin-teste")
+        monkeypatch.setattr(perfilador, "PERFIL_DIR", tempfile.mkdtemp())
+        monkeypatch.setattr(perfilador, "_perfil_atual", None)
+        perfilador.gravar_folded(perfilador.Counter({"main;funcao": 3}), "teste.folded")
+        return metodo, caminho, {"headers": {"Authorization": "Bearer admin-teste"}, **kwargs}
+    return preparar
+
+
+def _simples(metodo: str, caminho: str, **kwargs):
+    """Requisição sem preparação; {id}, {item} e {pessoa} vêm da divisão."""
+    def preparar(cliente, divisao, monkeypatch):
+        url = caminho.format(id=divisao["id"], item=divisao["itens"][0]["id"], pessoa=divisao["pessoas"][0]["id"])
+        return metodo, url, kwargs
+    return preparar
+
+
+@dataclass
+class Caso:
+    nome: str  # chave em ORCAMENTOS
+    preparar: Callable
+
+
+CASOS = [
+    Caso("GET /api", _simples("GET", "/api")),
+    Caso("GET /api/health", _simples("GET", "/api/health")),
+    Caso("GET /api/ready", _simples("GET", "/api/ready")),
+    Caso("GET /api/metrics", _simples("GET", "/api/metrics")),
+    Caso("GET /api/publico/{token}", _publico),
+    Caso("POST /api/scan-comanda", _scan),
+    Caso("POST /api/criar-divisao", _criar),
+    Caso("GET /api/divisao/{divisao_id}", _simples("GET", "/api/divisao/{id}")),
+    Caso("GET /api/divisao/{divisao_id} [If-None-Match]", _buscar_com_etag),
+    Caso("GET /api/divisao/{divisao_id}/mudancas", _simples("GET", "/api/divisao/{id}/mudancas", params={"desde": 0})),
+    Caso("GET /api/divisoes", _simples("GET", "/api/divisoes")),
+    Caso("GET /api/divisoes [desde]", _simples("GET", "/api/divisoes", params={
+        "desde": (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    })),
+    Caso("GET /api/buscar", _simples("GET", "/api/buscar", params={"q": "item"})),
+    Caso("GET /api/exportar", _simples("GET", "/api/exportar", params={"nivel": "pessoas"})),
+    Caso("DELETE /api/divisao/{divisao_id}", _excluir_finalizada),
+    Caso("POST /api/divisao/{divisao_id}/duplicar", _simples("POST", "/api/divisao/{id}/duplicar")),
+    Caso("PUT /api/divisao/{divisao_id}/config", _simples(
+        "PUT", "/api/divisao/{id}/config", json={"taxa_servico_percentual": 12, "desconto_valor": 5}
+    )),
+    Caso("POST /api/divisao/{divisao_id}/item", _simples(
+        "POST", "/api/divisao/{id}/item", json={"nome": "Água", "quantidade": 1, "valor_unitario": 6}
+    )),
+    Caso("PUT /api/divisao/{divisao_id}/item/{item_id}", _simples(
+        "PUT", "/api/divisao/{id}/item/{item}", json={"nome": "Chopp", "quantidade": 3, "valor_unitario": 12}
+    )),
+    Caso("DELETE /api/divisao/{divisao_id}/item/{item_id}", _simples("DELETE", "/api/divisao/{id}/item/{item}")),
+    Caso("POST /api/divisao/{divisao_id}/pessoa", _simples("POST", "/api/divisao/{id}/pessoa", json={"nome": "Nova"})),
+    Caso("DELETE /api/divisao/{divisao_id}/pessoa/{pessoa_id}", _simples("DELETE", "/api/divisao/{id}/pessoa/{pessoa}")),
+    Caso("POST /api/distribuir-item/{divisao_id}", _distribuir_item),
+    Caso("POST /api/divisao/{divisao_id}/distribuir-lote", _simples(
+        "POST", "/api/divisao/{id}/distribuir-lote", json={"operacao": "dividir_igualmente"}
+    )),
+    Caso("POST /api/divisao/{divisao_id}/batch", _batch),
+    Caso("GET /api/calcular-totais/{divisao_id}", _simples("GET", "/api/calcular-totais/{id}")),
+    Caso("GET /api/calcular-totais/{divisao_id} [local]", _simples(
+        "GET", "/api/calcular-totais/{id}", params={"estrategia": "local"}
+    )),
+    Caso("POST /api/calcular-totais/lote", lambda cliente, divisao, monkeypatch: (
+        "POST", "/api/calcular-totais/lote", {"json": {"divisao_ids": [divisao["id"]]}}
+    )),
+    Caso("POST /api/divisao/{divisao_id}/simular-totais", _simular),
+    Caso("POST /api/simular-totais", lambda cliente, divisao, monkeypatch: (
+        "POST", "/api/simular-totais", {"json": divisao}
+    )),
+    Caso("PUT /api/divisao/{divisao_id}/nome", _simples("PUT", "/api/divisao/{id}/nome", json={"nome": "Outro"})),
+    Caso("PUT /api/divisao/{divisao_id}/finalizar", _simples("PUT", "/api/divisao/{id}/finalizar")),
+    Caso("GET /api/estatisticas/mensal", _estatistica("/api/estatisticas/mensal")),
+    Caso("GET /api/estatisticas/itens", _estatistica("/api/estatisticas/itens")),
+    Caso("GET /api/estatisticas/companhias", _estatistica("/api/estatisticas/companhias")),
+    Caso("POST /api/divisao/{divisao_id}/compartilhar", lambda cliente, divisao, monkeypatch: (
+        _finalizar(cliente, divisao) or ("POST", f"/api/divisao/{divisao['id']}/compartilhar", {})
+    )),
+    Caso("POST /api/admin/perfil", _admin("POST", "/api/admin/perfil", params={"segundos": 0.05})),
+    Caso("GET /api/admin/perfis", _admin("GET", "/api/admin/perfis")),
+    Caso("GET /api/admin/perfis/{nome}", _admin("GET", "/api/admin/perfis/teste.folded")),
+]
+
+
+def _conferir(banco, nome: str, orcamento: int, resposta) -> None:
+    assert resposta.status_code < 400, f"{nome}: HTTP {resposta.status_code} {resposta.text[:300]}"
+    assert banco.consultas <= orcamento, (
+        f"{nome}: {banco.consultas} consultas (orçamento: {orcamento}), "
+        f"{banco.linhas} linhas, {banco.bytes} bytes\n{banco.relatorio()}"
+    )
+
+
+# ============================================
+# TESTES
+# ============================================
+
+@pytest.mark.parametrize("caso", CASOS, ids=lambda caso: caso.nome)
+def test_endpoint_respeita_orcamento_de_consultas(caso, divisao, cliente, banco, monkeypatch):
+    metodo, url, kwargs = caso.preparar(cliente, divisao, monkeypatch)
+
+    cache_divisoes.limpar()
+    banco.zerar()
+    resposta = cliente.request(metodo, url, **kwargs)
+    _conferir(banco, caso.nome, ORCAMENTOS[caso.nome], resposta)
+
+
+def test_distribuicoes_juntadas_gravam_de_uma_vez(divisao, cliente, banco, monkeypatch):
+    """Com o coalescedor, N toques viram uma gravação só (versão e atribuições numa RPC)."""
+    monkeypatch.setattr(coalescedor, "JANELA_SEGUNDOS", 60)
+    monkeypatch.setattr(coalescedor, "JANELA_MAXIMA", 60)
+    pessoa = divisao["pessoas"][0]
+
+    for item in divisao["itens"][:20]:
+        cache_divisoes.limpar()
+        banco.zerar()
+        resposta = cliente.post(f"/api/distribuir-item/{divisao['id']}", json={
+            "item_id": item["id"], "distribuicao": [{"pessoa_id": pessoa["id"], "quantidade": 1}]
+        })
+        _conferir(banco, "POST /api/distribuir-item/{divisao_id} [juntando]", ORCAMENTO_DISTRIBUIR_JUNTANDO, resposta)
+
+    banco.zerar()
+    cliente.portal.call(coalescedor.descarregar, divisao["id"])
+    assert 0 < banco.consultas <= ORCAMENTO_GRAVACAO_JUNTADA, banco.relatorio()
+
+
+def test_todo_endpoint_tem_orcamento():
+    """Endpoint novo sem orçamento declarado (ou sem caso de teste) falha aqui."""
+    com_caso = {caso.nome.split(" [")[0] for caso in CASOS}
+    assert set(caso.nome for caso in CASOS) <= set(ORCAMENTOS)
+    for rota in main.app.routes:
+        if not isinstance(rota, APIRoute):
+            continue
+        for metodo in rota.methods:
+            chave = f"{metodo} {rota.path}"
+            assert chave in com_caso or chave in SEM_ORCAMENTO, f"{chave} não tem orçamento de consultas"
@@ -0,0 +1,107 @@
+# --- Anotações para Iniciantes ---
+# Testes do perfilador (services/perfilador.py): o perfil sob demanda pelo
+# /api/admin e a captura das pilhas de requisições lentas, ambos gravando
+# arquivos no formato folded ("quadro;quadro;quadro contagem").
+
+import asyncio
+import time
+from collections import Counter
+
+from backend import main
+from backend.services import perfilador
+
+
+def _linhas_folded(caminho) -> list:
+    with open(caminho, encoding="utf-8") as arquivo:
+        linhas = arquivo.read().splitlines()
+    for linha in linhas:
+        pilha, contagem = linha.rsplit(" ", 1)
+        assert pilha and int(contagem) > 0
+    return linhas
+
+
+def test_admin_sem_token_configurado_nao_existe(cliente, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert cliente.post("/api/admin/perfil").status_code == 404
+
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "segredo")
+    assert cliente.post("/api/admin/perfil", headers={"Authorization": "Bearer errado"}).status_code == 401
+
+
+def test_perfil_sob_demanda_grava_pilhas_folded(cliente, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "segredo")
+    monkeypatch.setattr(perfilador, "PERFIL_DIR", str(tmp_path))
+    monkeypatch.setattr(perfilador, "_perfil_atual", None)
+    cabecalhos = {"Authorization": "Bearer segredo"}
+
+    resposta = cliente.post("/api/admin/perfil", params={"segundos": 0.2, "intervalo_ms": 1}, headers=cabecalhos)
+    assert resposta.status_code == 200, resposta.text
+    assert cliente.post("/api/admin/perfil", headers=cabecalhos).status_code == 409
+    perfilador._perfil_atual.join()
+
+    nome = resposta.json()["arquivo"]
+    assert [p["nome"] for p in cliente.get("/api/admin/perfis", headers=cabecalhos).json()["perfis"]] == [nome]
+    download = cliente.get(f"/api/admin/perfis/{nome}", headers=cabecalhos)
+    assert download.status_code == 200
+    assert _linhas_folded(tmp_path / nome)
+    assert cliente.get("/api/admin/perfis/..%2F..%2Fetc%2Fpasswd", headers=cabecalhos).status_code == 404
+
+
+def test_requisicao_lenta_tem_a_pilha_gravada_com_a_rota(monkeypatch, tmp_path):
+    monkeypatch.setattr(perfilador, "PERFIL_DIR", str(tmp_path))
+
+    def trava_o_loop():
+        time.sleep(0.3)  # código síncrono dentro de um endpoint async
+
+    async def app(scope, receive, send):
+        trava_o_loop()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def enviar(mensagem):
+        pass
+
+    middleware = perfilador.MiddlewareRequisicoesLentas(app, limite_ms=50)
+    asyncio.run(middleware({"type": "http", "method": "GET", "path": "/lenta"}, None, enviar))
+
+    arquivo = tmp_path / perfilador.ARQUIVO_LENTAS
+    for _ in range(100):  # o vigia grava quando não há mais requisições lentas
+        if arquivo.exists():
+            break
+        time.sleep(0.02)
+    linhas = _linhas_folded(arquivo)
+    assert any(linha.startswith("GET /lenta;event-loop;") and "trava_o_loop" in linha for linha in linhas)
+
+
+def test_streaming_conta_so_ate_o_cabecalho(monkeypatch, tmp_path):
+    monkeypatch.setattr(perfilador, "PERFIL_DIR", str(tmp_path))
+    em_andamento = []
+
+    def espera_o_cliente():
+        time.sleep(0.3)  # corpo lento, depois do cabeçalho (como um SSE)
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        em_andamento.append(len(middleware.vigia.em_andamento))
+        espera_o_cliente()
+        await send({"type": "http.response.body", "body": b""})
+
+    async def enviar(mensagem):
+        pass
+
+    middleware = perfilador.MiddlewareRequisicoesLentas(app, limite_ms=50)
+    asyncio.run(middleware({"type": "http", "method": "GET", "path": "/eventos"}, None, enviar))
+    time.sleep(0.1)
+
+    assert em_andamento == [0]
+    assert not (tmp_path / perfilador.ARQUIVO_LENTAS).exists()
+
+
+def test_pilhas_distintas_tem_limite(monkeypatch):
+    monkeypatch.setattr(perfilador, "MAX_PILHAS", 2)
+    contagens = Counter()
+
+    for linha in ["a;b", "a;c", "a;b", "a;d", "a;e"]:
+        perfilador.contar(contagens, linha)
+
+    assert contagens == {"a;b": 2, "a;c": 1, perfilador.PILHA_DESCARTADA: 2}
@@ -0,0 +1,191 @@
+# --- Anotações para Iniciantes ---
+# Testes do motor de totais em centavos (services/totais.py): o rateio pelo
+# maior resto fecha sempre com o total da conta, os empates são resolvidos
+# sempre do mesmo jeito e o que não foi distribuído fica de fora da conta
+# de cada pessoa. Cálculo puro, exceto o último bloco, que compara as
+# estratégias "banco" e "local" de services/totais_service.py.
+
+from backend.services import cache_divisoes, db_service, totais_service
+from backend.services.totais import (
+    agregar, calcular_totais, consumo_do_banco, fechar_totais, montar_matriz, ratear, totais_da_conta,
+)
+
+
+def _divisao(itens, pessoas, taxa=10.0, desconto=0.0) -> dict:
+    """Divisão completa no formato do db_service. itens: (nome, quantidade, valor, {pessoa: qtd})."""
+    return {
+        "taxa_servico_percentual": taxa,
+        "desconto_valor": desconto,
+        "pessoas": [{"id": f"p{i}", "nome": nome} for i, nome in enumerate(pessoas)],
+        "itens": [
+            {"id": f"i{j}", "nome": nome, "quantidade": quantidade, "valor_unitario": valor,
+             "atribuido_a": {f"p{pessoas.index(pessoa)}": qtd for pessoa, qtd in atribuido_a.items()}}
+            for j, (nome, quantidade, valor, atribuido_a) in enumerate(itens)
+        ],
+    }
+
+
+def _centavos(valor: float) -> int:
+    return round(valor * 100)
+
+
+def _soma_dos_totais(totais: dict) -> int:
+    return sum(_centavos(pessoa["total"]) for pessoa in totais["pessoas"])
+
+
+# ============================================
+# RATEIO
+# ============================================
+
+def test_ratear_soma_sempre_o_total():
+    casos = [(100, [1, 1, 1]), (1001, [1, 1]), (1, [3, 3, 3]), (999, [5, 7, 11, 13]), (-100, [1, 1, 1])]
+    for total, pesos in casos:
+        assert sum(ratear(total, pesos)) == total, (total, pesos)
+
+
+def test_ratear_empate_vai_para_os_primeiros():
+    assert ratear(100, [1, 1, 1]) == [34, 33, 33]
+    assert ratear(2, [1, 1, 1]) == [1, 1, 0]
+    assert ratear(-2, [1, 1, 1]) == [-1, -1, 0]
+    # Sem empate, o maior resto leva o centavo, não importa a posição
+    assert ratear(10, [1, 2]) == [3, 7]
+
+
+def test_ratear_ignora_pesos_zerados_e_negativos():
+    assert ratear(100, [0, 0]) == [0, 0]
+    assert ratear(100, [-5, 1]) == [0, 100]
+
+
+# ============================================
+# TOTAIS DA DIVISÃO
+# ============================================
+
+def test_tres_pessoas_dividindo_centavos_impares():
+    # Como o "dividir igualmente": 0,334 + 0,333 + 0,333 (milésimos inteiros)
+    divisao = _divisao([("Pizza", 1, 10.0, {"Ana": 0.334, "Bruno": 0.333, "Carla": 0.333})],
+                       ["Ana", "Bruno", "Carla"])
+
+    totais = calcular_totais(divisao)
+
+    assert [p["subtotal"] for p in totais["pessoas"]] == [3.34, 3.33, 3.33]
+    assert [p["taxa"] for p in totais["pessoas"]] == [0.34, 0.33, 0.33]
+    assert _soma_dos_totais(totais) == _centavos(totais_da_conta(divisao)["total"]) == 1100
+    assert sum(_centavos(p["percentual_da_conta"]) for p in totais["pessoas"]) == 100 * 100
+
+
+def test_desconto_e_taxa_fecham_com_o_total_da_conta():
+    divisao = _divisao([
+        ("Chopp", 3, 12.9, {"Ana": 1, "Bruno": 1, "Carla": 1}),
+        ("Porção", 1, 47.33, {"Ana": 0.5, "Bruno": 0.25, "Carla": 0.25}),
+        ("Água", 2, 4.99, {"Carla": 2}),
+    ], ["Ana", "Bruno", "Carla"], taxa=13.0, desconto=7.01)
+
+    totais = calcular_totais(divisao)
+    conta = totais_da_conta(divisao)
+
+    assert _soma_dos_totais(totais) == _centavos(conta["total"])
+    assert sum(_centavos(p["desconto"]) for p in totais["pessoas"]) == _centavos(conta["desconto"])
+    assert sum(_centavos(p["taxa"]) for p in totais["pessoas"]) == _centavos(conta["taxa"])
+    for pessoa in totais["pessoas"]:
+        # Os itens de cada pessoa também fecham com o subtotal dela
+        assert sum(_centavos(item["valor"]) for item in pessoa["itens"]) == _centavos(pessoa["subtotal"])
+
+
+def test_resultado_e_o_mesmo_em_toda_execucao():
+    # Bruno e Carla empatam no resto: o centavo que sobra vai sempre para o Bruno
+    divisao = _divisao([("Pizza", 1, 0.05, {"Ana": 0.334, "Bruno": 0.333, "Carla": 0.333})],
+                       ["Ana", "Bruno", "Carla"], taxa=0)
+
+    resultados = {tuple(p["total"] for p in calcular_totais(divisao)["pessoas"]) for _ in range(20)}
+
+    assert resultados == {(0.02, 0.02, 0.01)}
+
+
+def test_item_distribuido_em_parte_deixa_o_resto_de_fora():
+    divisao = _divisao([("Chopp", 2, 10.0, {"Ana": 1})], ["Ana", "Bruno"], taxa=10.0, desconto=2.0)
+
+    totais = calcular_totais(divisao)
+    ana, bruno = totais["pessoas"]
+
+    # Metade da conta está distribuída: Ana paga metade do desconto e da taxa
+    assert (ana["subtotal"], ana["desconto"], ana["taxa"], ana["total"]) == (10.0, 1.0, 0.9, 9.9)
+    assert bruno["total"] == 0
+    assert totais["progresso"] == {"percentual_distribuido": 50.0, "itens_restantes": 1}
+    assert _centavos(totais_da_conta(divisao)["total"]) - _soma_dos_totais(totais) == 990
+
+
+def test_fechar_totais_igual_com_o_consumo_do_banco():
+    divisao = _divisao([
+        ("Chopp", 3, 12.9, {"Ana": 2, "Bruno": 1}),
+        ("Porção", 1, 47.33, {"Ana": 0.5}),
+    ], ["Ana", "Bruno"], taxa=10.0, desconto=3.0)
+    # Mesmo consumo, no formato da função SQL totais_divisao_compacto
+    compacto = {
+        "pessoas": [
+            {"nome": "Ana", "subtotal": 2 * 12.9 + 0.5 * 47.33,
+             "itens": [["Chopp", 2, 2 * 12.9], ["Porção", 0.5, 0.5 * 47.33]]},
+            {"nome": "Bruno", "subtotal": 12.9, "itens": [["Chopp", 1, 12.9]]},
+        ],
+        "subtotal_geral": 3 * 12.9 + 47.33,
+        "quantidade_total": 4,
+        "quantidade_distribuida": 3.5,
+        "itens_total": 2,
+        "itens_restantes": 1,
+        "taxa_servico_percentual": 10.0,
+        "desconto_valor": 3.0,
+    }
+
+    assert fechar_totais(consumo_do_banco(compacto)) == fechar_totais(agregar(montar_matriz(divisao)))
+
+
+# ============================================
+# ESTRATÉGIAS "BANCO" E "LOCAL"
+# ============================================
+
+def test_banco_e_local_dao_o_mesmo_resultado(cliente):
+    divisao = cliente.post("/api/criar-divisao", json={
+        "itens": [{"id": "item_0", "nome": "Pizza", "quantidade": 1, "valor_unitario": 0.05},
+                  {"id": "item_1", "nome": "Chopp", "quantidade": 3, "valor_unitario": 12.9}],
+        "nomes_pessoas": ["Carla", "Ana", "Bruno"],
+    }).json()
+    pessoas = {p["nome"]: p["id"] for p in divisao["pessoas"]}
+    for item, quantidades in ((divisao["itens"][0], {"Carla": 0.334, "Ana": 0.333, "Bruno": 0.333}),
+                              (divisao["itens"][1], {"Carla": 1, "Ana": 1, "Bruno": 1})):
+        resposta = cliente.post(f"/api/distribuir-item/{divisao['id']}", json={
+            "item_id": item["id"],
+            "distribuicao": [{"pessoa_id": pessoas[nome], "quantidade": q} for nome, q in quantidades.items()],
+        })
+        assert resposta.status_code == 200, resposta.text
+    # A ordem de criação não bate com a ordem de inserção: Carla passa a ser a última
+    db_service.db.table("pessoas").update({"created_at": "2999-01-01T00:00:00.000000+00:00"}) \
+        .eq("id", pessoas["Carla"]).execute()
+    cache_divisoes.invalidar(divisao["id"])
+
+    banco = totais_service.calcular_totais_divisao(divisao["id"], "banco")
+    local = totais_service.calcular_totais_divisao(divisao["id"], "local")
+
+    assert banco == local
+    assert [p["nome"] for p in local["pessoas"]] == ["Ana", "Bruno", "Carla"]
+    # Ana e Bruno empatam no resto da Pizza: o centavo vai para quem vem primeiro
+    assert [p["subtotal"] for p in local["pessoas"]] == [12.92, 12.91, 12.92]
+
+
+def test_cache_de_versao_antiga_nao_vale_para_os_totais(cliente):
+    divisao = cliente.post("/api/criar-divisao", json={
+        "itens": [{"id": "item_0", "nome": "Chopp", "quantidade": 2, "valor_unitario": 10}],
+        "nomes_pessoas": ["Ana", "Bruno"],
+    }).json()
+    antes = totais_service.calcular_totais_divisao(divisao["id"], "local")  # deixa a divisão em cache
+    assert cache_divisoes.obter(divisao["id"]) is not None
+    # Outro worker distribui o item: a versão muda no banco, o cache deste processo não sabe
+    db_service.db.rpc("alterar_divisao", {"p_divisao_id": divisao["id"], "p_operacoes": [{
+        "tipo": "distribuir_item", "item_id": divisao["itens"][0]["id"],
+        "distribuicao": [{"pessoa_id": divisao["pessoas"][0]["id"], "quantidade": 2}],
+    }]}).execute()
+
+    totais = totais_service.calcular_totais_divisao(divisao["id"])
+    simulados = totais_service.simular_totais_divisao(divisao["id"])
+
+    assert [p["subtotal"] for p in antes["pessoas"]] == [0, 0]
+    assert [p["subtotal"] for p in totais["pessoas"]] == [20.0, 0]
+    assert [p["subtotal"] for p in simulados["pessoas"]] == [20.0, 0]
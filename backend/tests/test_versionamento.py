@@ -0,0 +1,80 @@
+# --- Anotações para Iniciantes ---
+# Testes da versão das divisões (ETag / If-Match): a versão só muda junto com
+# uma alteração gravada (database/15alteracoes_atomicas.md). Uma alteração
+# recusada não gasta versão, então o outro dispositivo não leva um 412 à toa.
+
+import pytest
+
+from backend.services import db_service
+
+
+@pytest.fixture
+def divisao(cliente) -> dict:
+    resposta = cliente.post("/api/criar-divisao", json={
+        "itens": [{"id": "item_0", "nome": "Chopp", "quantidade": 2, "valor_unitario": 12}],
+        "nomes_pessoas": ["Ana", "Bruno"],
+    })
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def _etag(cliente, divisao_id: str) -> str:
+    return cliente.get(f"/api/divisao/{divisao_id}").headers["ETag"]
+
+
+def test_alteracao_recusada_nao_muda_a_versao(cliente, divisao):
+    etag = _etag(cliente, divisao["id"])
+    cabecalhos = {"If-Match": etag}
+
+    item = cliente.put(f"/api/divisao/{divisao['id']}/item/00000000-0000-0000-0000-000000000000",
+                       json={"nome": "Chopp", "quantidade": 1, "valor_unitario": 12}, headers=cabecalhos)
+    pessoa = cliente.post(f"/api/divisao/{divisao['id']}/pessoa", json={"nome": "ana"}, headers=cabecalhos)
+
+    assert item.status_code == 404
+    assert pessoa.status_code == 400
+    assert pessoa.json()["detail"] == "Pessoa 'ana' já existe na divisão."
+    assert _etag(cliente, divisao["id"]) == etag
+    # O outro dispositivo, ainda com a mesma versão, altera normalmente
+    config = cliente.put(f"/api/divisao/{divisao['id']}/config",
+                         json={"taxa_servico_percentual": 12, "desconto_valor": 0}, headers=cabecalhos)
+    assert config.status_code == 200
+    assert config.headers["ETag"] != etag
+
+
+def test_if_match_desatualizado_nao_altera_nada(cliente, divisao):
+    etag = _etag(cliente, divisao["id"])
+    assert cliente.put(f"/api/divisao/{divisao['id']}/nome", json={"nome": "Primeiro"},
+                       headers={"If-Match": etag}).status_code == 200
+
+    resposta = cliente.put(f"/api/divisao/{divisao['id']}/nome", json={"nome": "Segundo"},
+                           headers={"If-Match": etag})
+    finalizar = cliente.put(f"/api/divisao/{divisao['id']}/finalizar", headers={"If-Match": etag})
+    excluir = cliente.delete(f"/api/divisao/{divisao['id']}", headers={"If-Match": etag})
+
+    assert resposta.status_code == finalizar.status_code == excluir.status_code == 412
+    atual = cliente.get(f"/api/divisao/{divisao['id']}").json()
+    assert atual["nome"] == "Primeiro"
+    assert atual["status"] == "em_andamento"
+
+
+def test_operacao_que_falha_desfaz_a_versao_e_as_anteriores(cliente, divisao):
+    versao = db_service.get_divisao(divisao["id"])["versao"]
+
+    with pytest.raises(db_service.RegistroNaoEncontrado):
+        db_service.alterar_divisao(divisao["id"], [
+            {"tipo": "renomear", "nome": "Não pode ficar"},
+            {"tipo": "remover_item", "item_id": "00000000-0000-0000-0000-000000000000"},
+        ], versao_esperada=versao)
+
+    depois = db_service.get_divisao(divisao["id"])
+    assert depois["versao"] == versao
+    assert depois["nome"] != "Não pode ficar"
+
+
+def test_resposta_da_alteracao_tem_o_etag_do_conteudo_gravado(cliente, divisao):
+    resposta = cliente.post(f"/api/divisao/{divisao['id']}/item",
+                            json={"nome": "Água", "quantidade": 1, "valor_unitario": 6})
+
+    assert resposta.status_code == 200
+    assert resposta.headers["ETag"] == _etag(cliente, divisao["id"])
+    assert [item["nome"] for item in resposta.json()["itens"]] == ["Chopp", "Água"]